@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import threading
+import time
+
+
+class TokenBucket:
+    """A bucket of `burst` tokens, refilled at `rate` tokens per second.
+
+    Parameters
+    ----------
+    rate : float
+        The number of tokens added per second
+    burst : int
+        The capacity of the bucket (it starts full)
+    now : float
+        The current time of the clock the bucket is used with
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self):
+        """ Return the time until a token is available (0 if there is one) """
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class Admission:
+    """Admit the requests within a global rate and a rate per club, with token
+    buckets: a request takes a token from the global bucket and from the
+    bucket of its club, and is refused (without taking any) if one of them is
+    empty.
+
+    The buckets of the clubs are created on demand, and the least recently
+    used ones dropped beyond `max_clubs` (a dropped bucket comes back full).
+
+    Parameters
+    ----------
+    rate, burst : float, int
+        The global rate (requests per second) and burst (0 for no limit)
+    club_rate, club_burst : float, int
+        The rate and burst of each club (0 for no limit)
+    max_clubs : int
+        The maximum number of club buckets kept
+    clock : callable
+        Return the current time in seconds
+    """
+
+    def __init__(
+        self,
+        rate=0,
+        burst=0,
+        club_rate=0,
+        club_burst=0,
+        max_clubs=10000,
+        clock=time.monotonic,
+    ):
+        self.club_rate = club_rate
+        self.club_burst = max(club_burst, 1)
+        self.max_clubs = max_clubs
+        self.clock = clock
+
+        self.bucket = TokenBucket(rate, max(burst, 1), clock()) if rate > 0 else None
+        self.clubs = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.bucket is not None or self.club_rate > 0
+
+    def admit(self, club):
+        """Take a token for a request of the club, and return (None, 0), or
+        return the exhausted scope ("global" or "club") and the seconds to
+        wait before retrying
+
+        Parameters
+        ----------
+        club : str
+            The name of the club making the request
+        """
+
+        with self._lock:
+            now = self.clock()
+            buckets = []
+
+            if self.club_rate > 0:
+                bucket = self.clubs.get(club)
+                if bucket is None:
+                    bucket = self.clubs[club] = TokenBucket(
+                        self.club_rate, self.club_burst, now
+                    )
+                    if len(self.clubs) > self.max_clubs:
+                        self.clubs.popitem(last=False)
+                else:
+                    self.clubs.move_to_end(club)
+                buckets.append(("club", bucket))
+
+            if self.bucket is not None:
+                buckets.append(("global", self.bucket))
+
+            for scope, bucket in buckets:
+                bucket.refill(now)
+                if bucket.tokens < 1:
+                    return scope, bucket.wait()
+
+            for _, bucket in buckets:
+                bucket.tokens -= 1
+            return None, 0
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+
+"""In-process benchmarks of the helpers and routes, on generated data sets.
+
+    python benchmark.py                                 # run, print the results
+    python benchmark.py --sizes tiny,large -o out.json  # save the results
+    python benchmark.py --save-baseline baseline.json   # save a baseline
+    python benchmark.py --compare baseline.json         # flag the regressions
+
+The comparison exits with status 1 if a benchmark got slower than its
+baseline by more than the threshold (20% by default).
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+from datagen import generateClubs, generateCompetitions
+from models import MAX_PLACES_PER_CLUB, BookingLedger, Club, Competition, formatDate
+
+# (the app is imported on first use, see loadServer)
+server = None
+
+# number of clubs and competitions of each data set
+SIZES = {
+    "tiny": (3, 4),
+    "small": (1000, 100),
+    "medium": (10000, 1000),
+    "large": (100000, 10000),
+}
+
+THRESHOLD = 0.2
+
+
+def loadServer():
+    """Import the app, on first use rather than with this module, so that main
+    can configure it first
+    """
+    global server
+    import server
+
+
+# ----- BENCHMARKS -----
+
+
+class Benchmarks:
+    """The benchmarks of a data set, as methods named bench_<name>
+
+    Each method prepares its run and returns the function to time, which is
+    given the number of the iteration (so that it can vary its input), or a
+    (function, setup, max_number) tuple for the runs changing the data (see
+    measure).
+
+    Parameters
+    ----------
+    clubs : int
+        The number of clubs of the data set
+    competitions : int
+        The number of competitions of the data set
+    """
+
+    def __init__(self, clubs, competitions):
+        # (with enough points and places to book all along)
+        self.clubs = generateClubs(clubs, points=(10 ** 6, 10 ** 7))
+        self.competitions = generateCompetitions(
+            competitions, places=(10 ** 6, 10 ** 6)
+        )
+        self.next_competitions = [c for c in self.competitions if c.date > self.now]
+        loadServer()
+        self.client = server.app.test_client()
+        self.reset()
+
+    @property
+    def now(self):
+        return datetime.datetime.now()
+
+    def reset(self):
+        """ Load fresh copies of the data set """
+        server.repository.load(
+            [Club(c.name, c.email, c.points) for c in self.clubs],
+            [Competition(c.name, c.date, c.numberOfPlaces) for c in self.competitions],
+        )
+
+    def club(self, i):
+        return self.clubs[i % len(self.clubs)]
+
+    def competition(self, i):
+        return self.next_competitions[i % len(self.next_competitions)]
+
+    def pair(self, i):
+        """ Return a club and a next competition, the pairs varying with i """
+        club = self.club(i)
+        competition = self.next_competitions[
+            (i // len(self.clubs)) % len(self.next_competitions)
+        ]
+        return club, competition
+
+    @property
+    def capacity(self):
+        """The number of places that can be booked one by one on successive
+        pairs before one of them reaches MAX_PLACES_PER_CLUB
+        """
+        return len(self.clubs) * len(self.next_competitions) * MAX_PLACES_PER_CLUB
+
+    def purchases(self, book):
+        """Return the run of a purchase bench: book a place on successive pairs,
+        each batch starting from fresh data and booking at most `capacity`
+        places, so that every timed booking succeeds
+
+        Parameters
+        ----------
+        book : callable
+            Book a place of a competition for a club, and return the response
+        """
+
+        def run(i):
+            club, competition = self.pair(i)
+            response = book(club, competition)
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f"booking {club.name} / {competition.name} failed"
+                    f" ({response.status_code})"
+                )
+
+        return run, self.reset, self.capacity
+
+    # -- helpers
+
+    def bench_formatDate(self):
+        return lambda i: formatDate("2050-03-27 11:11:00")
+
+    def bench_ledger_add(self):
+        ledger = BookingLedger()
+        return lambda i: ledger.add(self.club(i).name, self.competition(i).name, 1)
+
+    def bench_getBooking(self):
+        return lambda i: server.repository.getBooking(
+            self.club(i).name, self.competition(i).name
+        )
+
+    def bench_findClub(self):
+        return lambda i: server.repository.findClub(self.club(i).name)
+
+    def bench_findClubByEmail(self):
+        return lambda i: server.repository.findClubByEmail(self.club(i).email)
+
+    def bench_findCompetition(self):
+        return lambda i: server.repository.findCompetition(self.competition(i).name)
+
+    # -- routes
+
+    def bench_route_index(self):
+        return lambda i: self.client.get("/")
+
+    def bench_route_index_gzip(self):
+        return lambda i: self.client.get("/", headers={"Accept-Encoding": "gzip"})
+
+    def bench_route_showSummary(self):
+        return lambda i: self.client.post(
+            "/showSummary", data={"email": self.club(i).email}
+        )
+
+    def bench_route_book(self):
+        return lambda i: self.client.get(
+            f"/book/{self.competition(i).name}/{self.club(i).name}"
+        )
+
+    def bench_route_purchasePlaces(self):
+        return self.purchases(
+            lambda club, competition: self.client.post(
+                "/purchasePlaces",
+                data={
+                    "places": 1,
+                    "club": club.name,
+                    "competition": competition.name,
+                },
+            )
+        )
+
+    def bench_route_logout(self):
+        return lambda i: self.client.get("/logout")
+
+    def bench_route_showCompetitions(self):
+        return lambda i: self.client.get(f"/competitions/{self.club(i).name}/past")
+
+    def bench_route_showPointsBoard(self):
+        return lambda i: self.client.get("/pointsBoard?top=20")
+
+    def bench_route_apiCompetitions(self):
+        return lambda i: self.client.get("/api/competitions?page=2")
+
+    def bench_route_apiClubs(self):
+        return lambda i: self.client.get("/api/clubs?top=20")
+
+    def bench_route_apiBookings(self):
+        return lambda i: self.client.get(f"/api/clubs/{self.club(i).name}/bookings")
+
+    def bench_route_apiBookers(self):
+        return lambda i: self.client.get(
+            f"/api/competitions/{self.competition(i).name}/bookings"
+        )
+
+    def bench_route_apiPurchases(self):
+        return self.purchases(
+            lambda club, competition: self.client.post(
+                "/api/purchases",
+                json={
+                    "club": club.name,
+                    "bookings": [{"competition": competition.name, "places": 1}],
+                },
+            )
+        )
+
+    def bench_route_metrics(self):
+        return lambda i: self.client.get("/metrics")
+
+    @classmethod
+    def names(cls):
+        return [name[len("bench_") :] for name in dir(cls) if name.startswith("bench_")]
+
+
+def measure(run, min_time=0.2, repeat=5, setup=None, max_number=None):
+    """Time a function, and return the statistics of its calls in microseconds
+
+    The function is called in batches lasting at least `min_time` seconds
+    (the batch size is calibrated first, and capped by `max_number`), `repeat`
+    times.
+
+    Parameters
+    ----------
+    run : callable
+        The function to time, given the number of the iteration
+    min_time : float
+        The minimum duration of a batch, in seconds
+    repeat : int
+        The number of batches
+    setup : callable
+        Called (untimed) before each batch, calibration included (optional)
+    max_number : int
+        The maximum number of calls of a batch (optional)
+    """
+
+    max_number = max_number or 10 ** 6
+
+    # (calibration: grow the batch until it lasts a tenth of min_time, then
+    # scale it to min_time)
+    i, number = 0, 1
+    while True:
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            run(i)
+            i += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 10 or number >= max_number:
+            break
+        number = min(number * 10, max_number)
+    number = max(1, min(int(number * min_time / max(elapsed, 1e-9)), max_number))
+
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            run(i)
+            i += 1
+        timings.append((time.perf_counter() - start) / number * 10 ** 6)
+
+    return {
+        "min_us": min(timings),
+        "median_us": statistics.median(timings),
+        "calls": number * len(timings),
+    }
+
+
+def runBenchmarks(sizes, names=None, min_time=0.2, repeat=5, log=None):
+    """Run the benchmarks on the given data sets, and return the results
+
+    Parameters
+    ----------
+    sizes : list of str
+        The names of the data sets (see SIZES)
+    names : list of str
+        The benchmarks to run (all by default)
+    min_time, repeat :
+        See measure
+    log : callable
+        Called with a line of text after each benchmark (optional)
+    """
+
+    loadServer()
+
+    results = {}
+    for size in sizes:
+        benchmarks = Benchmarks(*SIZES[size])
+        results[size] = {}
+        for name in names or Benchmarks.names():
+            benchmarks.reset()
+            run = getattr(benchmarks, f"bench_{name}")()
+            run, setup, max_number = (
+                run if isinstance(run, tuple) else (run, None, None)
+            )
+            results[size][name] = measure(run, min_time, repeat, setup, max_number)
+            if log is not None:
+                log(f"{size:>8} {name:<28} {results[size][name]['min_us']:12.2f} us")
+
+    return {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage": server.app.config["STORAGE"],
+            "startup_s": {
+                phase: server.startup_duration.get(phase) for phase in ("app", "data")
+            },
+        },
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """Return the benchmarks slower than their baseline by more than `threshold`,
+    as (size, name, baseline us, current us, ratio) tuples
+
+    Parameters
+    ----------
+    results : dict
+        The results of runBenchmarks
+    baseline : dict
+        Previous results of runBenchmarks
+    threshold : float
+        The tolerated slowdown (0.2 for 20%)
+    """
+
+    regressions = []
+    for size, benchmarks in results["results"].items():
+        for name, result in benchmarks.items():
+            reference = baseline["results"].get(size, {}).get(name)
+            if reference is None:
+                continue
+            ratio = result["min_us"] / reference["min_us"]
+            if ratio > 1 + threshold:
+                regressions.append(
+                    (size, name, reference["min_us"], result["min_us"], ratio)
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="tiny,small", help=",".join(SIZES))
+    parser.add_argument("--only", help="comma separated benchmarks to run")
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("-o", "--output", help="write the results to this file")
+    parser.add_argument("--save-baseline", help="write the results as a baseline")
+    parser.add_argument("--compare", help="compare the results with a baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args(argv)
+
+    # (the benchmarks own the data: no file watcher replacing it meanwhile,
+    # unless the app was already imported and configured by its user)
+    if "server" not in sys.modules:
+        os.environ.setdefault("GUDLFT_RELOAD_INTERVAL", "0")
+
+    results = runBenchmarks(
+        args.sizes.split(","),
+        args.only.split(",") if args.only else None,
+        args.min_time,
+        args.repeat,
+        log=print,
+    )
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for size, name, before, after, ratio in regressions:
+            print(
+                f"REGRESSION {size} {name}: {before:.2f} us -> {after:.2f} us"
+                f" (x{ratio:.2f})"
+            )
+        if regressions:
+            return 1
+        print(f"no regression beyond {args.threshold:.0%}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
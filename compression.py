@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+
+try:
+    import brotli
+except ImportError:  # (optional: pip install brotli)
+    brotli = None
+
+
+def encodings():
+    """ Return the supported content codings, by order of preference """
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encodings):
+    """Return the supported content coding the client prefers, or None if it
+    only accepts the identity
+
+    Parameters
+    ----------
+    accept_encodings : werkzeug.datastructures.Accept
+        The parsed Accept-Encoding header of the request
+    """
+
+    best, best_quality = None, 0
+    for encoding in encodings():
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding, level):
+    """Return the data compressed with a content coding
+
+    Parameters
+    ----------
+    data : bytes
+        The data to compress
+    encoding : str
+        "gzip", or "br" (brotli)
+    level : int
+        The compression level (0-9 for gzip) or quality (0-11 for brotli)
+    """
+
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    # (without timestamp, so that the same data is always compressed the same)
+    return gzip.compress(data, compresslevel=level, mtime=0)
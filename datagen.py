@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""Generate clubs and competitions, e.g. for load tests and benchmarks.
+
+    python datagen.py --clubs 1000 --competitions 100 --output-dir data
+
+The files are written to ./generated by default.
+
+The same counts and seed always give the same data: club i is named
+"Club i" with the email "secretary<i>@club<i>.com", and competition j is
+named "Competition j" (one in ten competitions is in the past).
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+
+from models import Club, Competition
+
+
+def clubName(i):
+    return f"Club {i}"
+
+
+def clubEmail(i):
+    return f"secretary{i}@club{i}.com"
+
+
+def competitionName(j):
+    return f"Competition {j}"
+
+
+def isPastCompetition(j):
+    return j % 10 == 0
+
+
+def generateClubs(count, seed=0, points=(20, 200)):
+    """Return `count` clubs
+
+    Parameters
+    ----------
+    count : int
+        The number of clubs
+    seed : int
+        The seed of the random points
+    points : tuple of int
+        The range of the points of the clubs
+    """
+    rng = random.Random(seed)
+    return [Club(clubName(i), clubEmail(i), rng.randint(*points)) for i in range(count)]
+
+
+def generateCompetitions(count, seed=0, places=(20, 500), now=None):
+    """Return `count` competitions, a tenth of them in the past
+
+    Parameters
+    ----------
+    count : int
+        The number of competitions
+    seed : int
+        The seed of the random dates and places
+    places : tuple of int
+        The range of the places of the competitions
+    now : datetime
+        The date the competitions are spread around (now by default)
+    """
+    rng = random.Random(seed)
+    now = (now or datetime.datetime.now()).replace(microsecond=0)
+    return [
+        Competition(
+            competitionName(j),
+            now
+            + datetime.timedelta(
+                days=-rng.randint(1, 365)
+                if isPastCompetition(j)
+                else rng.randint(1, 3650)
+            ),
+            rng.randint(*places),
+        )
+        for j in range(count)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clubs", type=int, default=1000)
+    parser.add_argument("--competitions", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    # (never the current directory by default: it holds the app's own files)
+    parser.add_argument("--output-dir", default="generated")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name, records in (
+        ("clubs", generateClubs(args.clubs, args.seed)),
+        ("competitions", generateCompetitions(args.competitions, args.seed)),
+    ):
+        with open(os.path.join(args.output_dir, f"{name}.json"), "w") as f:
+            json.dump({name: [record.toJson() for record in records]}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # (not available on Windows)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class BookingJournal:
+    """An append-only journal (write-ahead log) of JSON records, one per line.
+
+    Each record gets a sequence number ("seq") when it is appended. Appending
+    only queues the record: `wait` must then be called to make sure it was
+    written and fsynced. Writers waiting at the same time are served by a
+    single write + fsync (group commit): the first waiter writes the whole
+    pending batch on behalf of the others, so the fsync cost is shared
+    instead of limiting the number of bookings per second.
+
+    When opened, a partially written last line (e.g. after a crash) is
+    dropped, and the sequence numbers resume after the last valid record.
+
+    A journal can only be opened by one process at a time (a RuntimeError is
+    raised otherwise), since each process would replay and append its own
+    view of the bookings.
+
+    Parameters
+    ----------
+    path : str
+        The path of the journal file (created if needed)
+    min_seq : int
+        The last sequence number known to be used, for when the journal was
+        emptied by `compact` (e.g. the sequence number of the last snapshot)
+    """
+
+    def __init__(self, path, min_seq=0):
+        self.path = path
+        self._owner = self._acquire()
+
+        self._lock = threading.Lock()
+        self._flushed = threading.Condition(self._lock)
+        self._pending = []
+        self._flushing = False
+
+        self.last_seq = max(self._recover(), min_seq)
+        self._durable_seq = self.last_seq
+
+        self.fsyncs = 0
+        self._file = open(path, "ab")
+
+    def _acquire(self):
+        """ Lock the journal for this process (released when closed) """
+
+        owner = open(f"{self.path}.lock", "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                owner.close()
+                raise RuntimeError(
+                    f"{self.path} is already used by another process"
+                    " (several workers need the sqlite storage)"
+                ) from None
+        return owner
+
+    def _recover(self):
+        """ Truncate any torn last line and return the last sequence number """
+
+        last_seq, valid_size = 0, 0
+
+        if not os.path.exists(self.path):
+            return last_seq
+
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                last_seq = max(last_seq, record["seq"])
+                valid_size += len(line)
+
+        if valid_size < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_size)
+
+        return last_seq
+
+    def replay(self, after=0):
+        """Yield the records of the journal in the order they were written
+
+        Parameters
+        ----------
+        after : int
+            Only yield the records whose sequence number is greater than this
+        """
+        with open(self.path, "rb") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["seq"] > after:
+                    after = record["seq"]
+                    yield record
+
+    def append(self, record):
+        """Queue a record and return its sequence number
+
+        The record is not durable until `wait` returns for this number.
+
+        Parameters
+        ----------
+        record : dict
+            A JSON serializable record (its "seq" key is set here)
+        """
+        with self._lock:
+            self.last_seq += 1
+            record = dict(record, seq=self.last_seq)
+            self._pending.append(
+                json.dumps(record, separators=(",", ":")).encode() + b"\n"
+            )
+            return self.last_seq
+
+    def wait(self, seq):
+        """Block until the record with the given sequence number is on disk
+
+        Parameters
+        ----------
+        seq : int
+            A sequence number returned by `append`
+        """
+        with self._lock:
+            while self._durable_seq < seq:
+
+                if self._flushing:
+                    self._flushed.wait()
+                    continue
+
+                # lead this group commit: write everything pending so far
+                batch, self._pending = self._pending, []
+                batch_seq = self.last_seq
+                self._flushing = True
+                self._lock.release()
+                try:
+                    self._file.write(b"".join(batch))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                except BaseException:
+                    # records may be written twice on retry, but the replay
+                    # skips the sequence numbers it already saw
+                    self._lock.acquire()
+                    self._pending[:0] = batch
+                    self._flushing = False
+                    self._flushed.notify_all()
+                    raise
+                self._lock.acquire()
+                self.fsyncs += 1
+                self._durable_seq = batch_seq
+                self._flushing = False
+                self._flushed.notify_all()
+
+    def compact(self, seq):
+        """Drop the records up to a given sequence number from the journal
+
+        The remaining records are copied to a temporary file which then
+        atomically replaces the journal.
+
+        Parameters
+        ----------
+        seq : int
+            The last sequence number covered by a snapshot
+        """
+        with self._lock:
+            while self._flushing:
+                self._flushed.wait()
+
+            tmp_path = f"{self.path}.tmp"
+            with open(self.path, "rb") as src, open(tmp_path, "wb") as dst:
+                for line in src:
+                    if json.loads(line)["seq"] > seq:
+                        dst.write(line)
+                dst.flush()
+                os.fsync(dst.fileno())
+
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, "ab")
+
+    def commit(self, record):
+        """ Append a record and wait until it is on disk """
+        self.wait(self.append(record))
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._owner.close()
+
+
+class Snapshotter:
+    """Periodically write a snapshot of the state and compact the journal.
+
+    A snapshot is written to a temporary file, fsynced, then atomically
+    renamed over the previous one. Only then are the records it covers
+    dropped from the journal, so a crash at any point leaves either the old
+    snapshot and the full journal, or the new snapshot and a journal whose
+    covered records are skipped at replay.
+
+    A snapshot is taken every `interval` seconds, or as soon as `max_records`
+    records were appended to the journal since the last snapshot.
+
+    Parameters
+    ----------
+    journal : BookingJournal
+        The journal to compact after each snapshot
+    path : str
+        The path of the snapshot file
+    capture : callable
+        Return a (seq, data) tuple, where data is the JSON serializable state
+        including all the journal records up to seq (and none after)
+    interval : float
+        The maximum number of seconds between two snapshots
+    max_records : int
+        The number of new journal records triggering a snapshot
+    """
+
+    def __init__(self, journal, path, capture, interval=300, max_records=10000):
+        self.journal = journal
+        self.path = path
+        self.capture = capture
+        self.interval = interval
+        self.max_records = max_records
+
+        self.seq = journal.last_seq
+        self.count = 0
+        self.last_duration = None
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def take(self):
+        """ Write a snapshot (if the journal grew since the last one) """
+
+        start = time.perf_counter()
+
+        seq, data = self.capture()
+        if seq == self.seq and os.path.exists(self.path):
+            return
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(dict(data, seq=seq), f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        self.journal.compact(seq)
+
+        self.seq = seq
+        self.count += 1
+        self.last_duration = time.perf_counter() - start
+        logger.info("snapshot up to seq %d written in %.3fs", seq, self.last_duration)
+
+    def run(self):
+        last = time.monotonic()
+        poll = min(self.interval, 1.0)
+
+        while not self._stop.wait(poll):
+            if (
+                time.monotonic() - last >= self.interval
+                or self.journal.last_seq - self.seq >= self.max_records
+            ):
+                try:
+                    self.take()
+                except Exception:
+                    logger.exception("snapshot failed")
+                last = time.monotonic()
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.run, name="snapshotter", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
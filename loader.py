@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 16
+PROGRESS_EVERY = 100000
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+
+# (bumped whenever the records or the layout of the precompiled files change)
+PRECOMPILED_FORMAT = 1
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"\s*")
+_structure = re.compile(r'["{}\[\]]')
+_string_tail = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_number_tail = re.compile(r"[0-9.eE+-]*")
+
+
+class JsonStream:
+    """Decode a JSON document chunk by chunk.
+
+    Only the part of the document that wasn't consumed yet (plus at most one
+    chunk) is kept in memory, so values can be decoded one after the other
+    from arbitrarily large files.
+
+    Parameters
+    ----------
+    f : file
+        A file opened in text mode
+    chunk_size : int
+        The number of characters read at once
+    """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.consumed = 0
+        self.eof = False
+
+    @property
+    def offset(self):
+        """ The position in the document (in characters) """
+        return self.consumed + self.pos
+
+    def fill(self):
+        """ Read one more chunk, return False at the end of the file """
+
+        if self.eof:
+            return False
+
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+
+        # drop what was already consumed
+        self.consumed += self.pos
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """ Skip whitespaces and return the next character ('' at the end) """
+
+        while True:
+            self.pos = _whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars):
+        """ Consume the next character, which must be one of `chars` """
+
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"expected one of {chars!r} at offset {self.offset}")
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """ Decode and return the next value """
+
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # a number could go on in the next chunk, even after a prefix that is
+            # a number itself (e.g. "12." or "1e" then "5")
+            if (
+                end == len(self.buf)
+                or type(value) in (int, float)
+                and _number_tail.fullmatch(self.buf, end)
+            ) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def skip(self):
+        """ Skip the next value without decoding it """
+
+        if self.peek() not in "[{":
+            self.decode()
+            return
+
+        depth = 0
+        while True:
+            match = _structure.search(self.buf, self.pos)
+            if match is None:
+                self.pos = len(self.buf)
+                if not self.fill():
+                    raise ValueError("unexpected end of file")
+                continue
+
+            self.pos = match.end()
+            char = match.group()
+            if char == '"':
+                self._skip_string()
+            elif char in "[{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def _skip_string(self):
+        while True:
+            match = _string_tail.match(self.buf, self.pos)
+            if match is not None:
+                self.pos = match.end()
+                return
+            if not self.fill():
+                raise ValueError("unexpected end of file")
+
+    def seek(self, key):
+        """Move right after the `key` member of the top-level object
+
+        The members before it are skipped without being decoded.
+        """
+
+        self.expect("{")
+        if self.peek() != "}":
+            while True:
+                name = self.decode()
+                self.expect(":")
+                if name == key:
+                    return
+                self.skip()
+                if self.expect(",}") == "}":
+                    break
+
+        raise KeyError(key)
+
+    def items(self):
+        """ Yield the values of the array starting at the current position """
+
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+
+        while True:
+            yield self.decode()
+            if self.expect(",]") == "]":
+                return
+
+
+def readValue(path, key):
+    """Return the `key` member of the JSON object stored in a file
+
+    Parameters
+    ----------
+    path : str
+        The path of the JSON file
+    key : str
+        The name of the member to read
+    """
+    with open(path, encoding="utf-8") as f:
+        stream = JsonStream(f)
+        stream.seek(key)
+        return stream.decode()
+
+
+def iterRecords(path, key):
+    """Yield the items of the `key` array of the JSON object stored in a file
+
+    If the file is a NDJSON file (.ndjson or .jsonl), each line is an item.
+
+    Parameters
+    ----------
+    path : str
+        The path of the JSON or NDJSON file
+    key : str
+        The name of the array (ignored for NDJSON files)
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(NDJSON_SUFFIXES):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            stream = JsonStream(f)
+            stream.seek(key)
+            yield from stream.items()
+
+
+def loadRecords(path, key, build, progress=None):
+    """Yield the records built from the items of a JSON (or NDJSON) file
+
+    The file is read incrementally, so only one item is decoded at a time.
+    Items are validated as they are read: an item that `build` can't handle
+    stops the load with a ValueError pointing at it.
+
+    Parameters
+    ----------
+    path : str
+        The path of the JSON or NDJSON file
+    key : str
+        The name of the array holding the items (in a JSON file)
+    build : callable
+        Return a record from a decoded item (or raise KeyError / ValueError)
+    progress : callable
+        Called with the number of records loaded so far, every PROGRESS_EVERY
+        records (optional)
+    """
+
+    start = time.perf_counter()
+    count = 0
+
+    for count, item in enumerate(iterRecords(path, key), 1):
+        try:
+            record = build(item)
+        except (KeyError, TypeError, ValueError) as error:
+            raise ValueError(
+                f"{path}: invalid item #{count} in {key!r} ({error!r})"
+            ) from error
+
+        yield record
+
+        if count % PROGRESS_EVERY == 0:
+            logger.info("%s: %d %s loaded", path, count, key)
+            if progress is not None:
+                progress(count)
+
+    logger.info(
+        "%s: %d %s loaded in %.3fs", path, count, key, time.perf_counter() - start
+    )
+
+
+def fileDigest(path):
+    """ Return the SHA-256 hex digest of a file's content """
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def loadPrecompiled(path, key, build, progress=None, cache_path=None):
+    """Return the records of a JSON (or NDJSON) file, from its precompiled
+    version when it is up to date
+
+    The precompiled version is a pickle of the records built from the file,
+    preceded by the modification time, size and SHA-256 digest of the file
+    it was built from. It is used only if all of them still match the file
+    (the digest is only computed once the cheaper checks pass), otherwise the
+    file is loaded with loadRecords and precompiled again.
+
+    The precompiled file must be as trusted as the code (it is unpickled):
+    it is written next to the data file by default.
+
+    Parameters
+    ----------
+    path : str
+        The path of the JSON or NDJSON file
+    key, build, progress :
+        See loadRecords
+    cache_path : str
+        The path of the precompiled file (<path>.cache by default)
+    """
+
+    cache_path = cache_path or f"{path}.cache"
+    stat = os.stat(path)
+    source = (PRECOMPILED_FORMAT, key, stat.st_mtime_ns, stat.st_size)
+
+    try:
+        with open(cache_path, "rb") as f:
+            header = pickle.load(f)
+            if header[:4] == source and header[4] == fileDigest(path):
+                start = time.perf_counter()
+                records = pickle.load(f)
+                logger.info(
+                    "%s: %d %s loaded from %s in %.3fs",
+                    path,
+                    len(records),
+                    key,
+                    cache_path,
+                    time.perf_counter() - start,
+                )
+                return records
+    except FileNotFoundError:
+        pass
+    except Exception as error:  # (truncated or outdated file)
+        logger.warning("%s: ignored (%r)", cache_path, error)
+
+    digest = fileDigest(path)
+    records = list(loadRecords(path, key, build, progress))
+
+    # (not written if the file changed meanwhile, the records may mix both)
+    stat = os.stat(path)
+    if (stat.st_mtime_ns, stat.st_size) != source[2:]:
+        return records
+
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(source + (digest,), f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(records, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as error:
+        logger.warning("%s: couldn't be written (%r)", cache_path, error)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    return records
@@ -1,36 +1,132 @@
+import itertools
+import os
 import random
 
-from locust import HttpUser, between, task
+import requests
+from locust import HttpUser, between, events, task
+
+from datagen import clubEmail, clubName, competitionName, isPastCompetition
+
+# the data set the server is reset with before each run (see /admin/reset):
+# LOAD_CLUBS distinct clubs and LOAD_COMPETITIONS competitions
+LOAD_CLUBS = int(os.environ.get("LOAD_CLUBS", 1000))
+LOAD_COMPETITIONS = int(os.environ.get("LOAD_COMPETITIONS", 100))
+LOAD_SEED = int(os.environ.get("LOAD_SEED", 0))
+
+# the token of the server (GUDLFT_ADMIN_TOKEN), without which the data isn't
+# reset before the run
+ADMIN_TOKEN = os.environ.get("GUDLFT_ADMIN_TOKEN")
+
+# the refusals expected from the booking rules (X-Booking-Outcome header),
+# reported apart from the real failures
+REJECTIONS = ("PointValueError", "PlaceValueError", "EventDateError", "SoldOut")
+
+_users = itertools.count()
+
+
+@events.test_start.add_listener
+def resetData(environment, **kwargs):
+    if not ADMIN_TOKEN:
+        return
+
+    response = requests.post(
+        f"{environment.host}/admin/reset",
+        json={
+            "clubs": LOAD_CLUBS,
+            "competitions": LOAD_COMPETITIONS,
+            "seed": LOAD_SEED,
+        },
+        headers={"X-Admin-Token": ADMIN_TOKEN},
+    )
+    response.raise_for_status()
+
+
+def rename(response, name):
+    """ Report a request (in a catch_response block) under another name """
+    meta = getattr(response, "request_meta", None)
+    if meta is None:  # (locust < 2)
+        meta = response.locust_request_meta
+    meta["name"] = name
 
 
 class WebsiteUser(HttpUser):
-    wait_time = between(3, 10)
+    wait_time = between(1, 5)
 
     def on_start(self):
 
-        self.club = "Simply Lift"
-        self.competitions = ["Spring Festival 2050", "Fall Classic 2050"]
+        # each user is the secretary of its own club (as long as there are
+        # clubs enough), and is interested in a few competitions
+        i = next(_users) % LOAD_CLUBS
+        self.club = clubName(i)
+        self.email = clubEmail(i)
 
-        # Visit Home page
-        self.client.get("/")
+        rng = random.Random(i)
+        self.competitions = [
+            competitionName(j)
+            for j in rng.sample(range(LOAD_COMPETITIONS), min(5, LOAD_COMPETITIONS))
+            if not isPastCompetition(j)
+        ] or [competitionName(LOAD_COMPETITIONS - 1)]
 
-        # Login
-        self.client.post("/showSummary", {"email": "john@simplylift.co"})
+        self.client.get("/")
+        self.login()
 
     def on_stop(self):
         self.client.get("/logout")
 
+    def login(self):
+        self.client.post("/showSummary", {"email": self.email})
+
+    def checkBooking(self, response, name):
+        """Report the refused bookings (and those shed by the admission
+        control) as such, and not as failures
+        """
+        outcome = response.headers.get("X-Booking-Outcome")
+        if response.status_code in (400, 409) and outcome in REJECTIONS:
+            rename(response, f"{name} [{outcome}]")
+            response.success()
+        elif response.status_code == 429:
+            rename(response, f"{name} [429]")
+            response.success()
+
+    # -- browse
+
+    @task(3)
+    def index(self):
+        self.client.get("/")
+
     @task(2)
+    def summary(self):
+        self.login()
+
+    @task(1)
+    def pointsBoard(self):
+        self.client.get("/pointsBoard?top=20")
+
+    @task(1)
+    def competitions(self):
+        self.client.get(f"/competitions/{self.club}/next", name="/competitions")
+
+    # -- book
+
+    @task(3)
     def book(self):
-        for competition in self.competitions:
-            self.client.get(f"/book/{competition}/{self.club}", name="/book")
+        competition = random.choice(self.competitions)
+        with self.client.get(
+            f"/book/{competition}/{self.club}", name="/book", catch_response=True
+        ) as response:
+            self.checkBooking(response, "/book")
 
     @task(1)
     def purchasePlaces(self):
-        competition = random.choices(self.competitions)
-        # for competition in self.competitions:
-        self.client.post(
+        competition = random.choice(self.competitions)
+        with self.client.post(
             "/purchasePlaces",
-            {"places": 1, "club": self.club, "competition": competition},
+            {
+                "places": random.randint(1, 3),
+                "club": self.club,
+                "competition": competition,
+            },
             name="/purchasePlaces",
-        )
+            catch_response=True,
+        ) as response:
+            self.checkBooking(response, "/purchasePlaces")
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import functools
+import threading
+import time
+
+# (in seconds, from half a millisecond to 5 seconds)
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+)
+
+
+def formatLabels(names, values, extra=()):
+    """ Return the {name="value",...} part of a sample in the text format """
+
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+
+    def escape(value):
+        value = str(value).replace("\\", r"\\")
+        return value.replace('"', r"\"").replace("\n", r"\n")
+
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+def formatValue(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A set of counters, one per combination of label values.
+
+    Parameters
+    ----------
+    name : str
+        The name of the metric (e.g. gudlft_requests_total)
+    help : str
+        A description of the metric
+    labelnames : tuple of str
+        The names of the labels
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield self.name + formatLabels(self.labelnames, labels), value
+
+
+class Gauge(Counter):
+    """A set of values that can go up and down, one per combination of label
+    values (see Counter for the parameters)
+    """
+
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    """A set of histograms, one per combination of label values.
+
+    Each observation only increments the count of its bucket (found by
+    bisection) along with the sum: the cumulative counts of the text format
+    are computed when the metrics are read.
+
+    Parameters
+    ----------
+    name : str
+        The name of the metric (e.g. gudlft_request_duration_seconds)
+    help : str
+        A description of the metric
+    labelnames : tuple of str
+        The names of the labels
+    buckets : tuple of float
+        The upper bounds of the buckets (sorted)
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return 0 if series is None else sum(series[0])
+
+    def total(self, *labels):
+        series = self._series.get(labels)
+        return 0.0 if series is None else series[1]
+
+    def samples(self):
+        with self._lock:
+            series = sorted(
+                (labels, (list(counts), total))
+                for labels, (counts, total) in self._series.items()
+            )
+
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield self.name + "_bucket" + formatLabels(
+                    self.labelnames, labels, [("le", bound)]
+                ), cumulative
+            labelled = formatLabels(self.labelnames, labels)
+            yield self.name + "_sum" + labelled, total
+            yield self.name + "_count" + labelled, cumulative
+
+
+class Registry:
+    """The metrics exposed together in the Prometheus text format """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """ Return the metrics in the Prometheus text exposition format """
+
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample, value in metric.samples():
+                lines.append(f"{sample} {formatValue(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def instrument(obj, names, histogram):
+    """Time the calls of some methods of an object
+
+    The methods are replaced on the object itself (not on its class), and
+    each call is observed in the histogram, labelled by the method name.
+
+    Parameters
+    ----------
+    obj : object
+        The object whose methods are timed
+    names : iterable of str
+        The names of the methods to time
+    histogram : Histogram
+        A histogram with a single label (the method name)
+    """
+
+    def timed(name, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, name)
+
+        return wrapper
+
+    for name in names:
+        setattr(obj, name, timed(name, getattr(obj, name)))
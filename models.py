@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import collections
+import datetime
+import itertools
+import sys
+
+
+# ----- HELPER FUNCTIONS -----
+
+
+def formatDate(date_str):
+    """ Return a datetime object from a Y-M-d H:M:S date string """
+    return datetime.datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
+
+
+# ----- RULES -----
+
+COST_PER_PLACE = 3
+MAX_PLACES_PER_CLUB = 12
+
+
+# ----- VERSIONS -----
+
+# versions are drawn from a single counter, so that a version number can't
+# identify two different states (even of two different lists)
+_versions = itertools.count(1)
+
+
+def nextVersion():
+    """ Return a new version number, greater than all the previous ones """
+    return next(_versions)
+
+
+# ----- RECORDS -----
+
+
+class Club:
+    """A club, as described in clubs.json
+
+    Parameters
+    ----------
+    name : str
+        The name of the club
+    email : str
+        The email of the club's secretary
+    points : int or str
+        The number of points the club can spend on places
+    """
+
+    __slots__ = ("name", "email", "points")
+
+    def __init__(self, name, email, points):
+        self.name = sys.intern(name)
+        self.email = email
+        self.points = int(points)
+
+    @classmethod
+    def fromJson(cls, data):
+        """ Return a Club from its clubs.json representation """
+        return cls(data["name"], data["email"], data["points"])
+
+    def toJson(self):
+        """ Return the clubs.json representation of the Club """
+        return {"name": self.name, "email": self.email, "points": str(self.points)}
+
+    def __reduce__(self):
+        # (pickled as its constructor arguments: lighter, and the name interned)
+        return type(self), (self.name, self.email, self.points)
+
+    def __repr__(self):
+        return f"Club({self.name!r}, {self.email!r}, {self.points!r})"
+
+
+class Competition:
+    """A competition, as described in competitions.json
+
+    Parameters
+    ----------
+    name : str
+        The name of the competition
+    date : datetime or str
+        The date of the competition (or its Y-M-d H:M:S representation)
+    numberOfPlaces : int or str
+        The number of places still available
+    """
+
+    __slots__ = ("name", "date", "numberOfPlaces")
+
+    def __init__(self, name, date, numberOfPlaces):
+        self.name = sys.intern(name)
+        self.date = date if isinstance(date, datetime.datetime) else formatDate(date)
+        self.numberOfPlaces = int(numberOfPlaces)
+
+    @classmethod
+    def fromJson(cls, data):
+        """ Return a Competition from its competitions.json representation """
+        return cls(data["name"], data["date"], data["numberOfPlaces"])
+
+    def toJson(self):
+        """ Return the competitions.json representation of the Competition """
+        return {
+            "name": self.name,
+            "date": self.date.strftime("%Y-%m-%d %H:%M:%S"),
+            "numberOfPlaces": str(self.numberOfPlaces),
+        }
+
+    def __reduce__(self):
+        return type(self), (self.name, self.date, self.numberOfPlaces)
+
+    def __repr__(self):
+        return (
+            f"Competition({self.name!r}, {str(self.date)!r}, {self.numberOfPlaces!r})"
+        )
+
+
+# -- indexed lists
+
+
+class IndexedList(list):
+    """A list of records with hash indexes on some of their attributes.
+
+    The indexes are updated whenever the list is modified, so that a record
+    can be found in O(1) with `find` instead of scanning the whole list.
+    As with a list scan, the first record having a given value is returned.
+
+    Each modification also changes `version` (see nextVersion), so that
+    structures derived from the list can tell when they need to be rebuilt.
+    Records changed in place through `update` only change it if one of their
+    indexed (or `versioned`) attributes actually changed.
+
+    Parameters
+    ----------
+    records : iterable
+        The records to store
+    keys : tuple of str
+        The name of the attributes to index
+    """
+
+    # the attributes other than the keys on which derived structures depend
+    versioned = ()
+
+    def __init__(self, records=(), keys=()):
+        super().__init__(records)
+        self.keys = tuple(keys)
+        self.version = nextVersion()
+        self._reindex()
+
+    def _reindex(self):
+        self.version = nextVersion()
+        self.indexes = {key: {} for key in self.keys}
+        # (the values held by several records, for which the first one matters)
+        self._shared = {key: set() for key in self.keys}
+        for record in self:
+            self._index(record)
+
+    def _index(self, record):
+        self.version = nextVersion()
+        for key, index in self.indexes.items():
+            value = getattr(record, key)
+            if index.setdefault(value, record) is not record:
+                self._shared[key].add(value)
+
+    def find(self, key, value):
+        """Return the first record whose `key` attribute equals `value` (or None)
+
+        Parameters
+        ----------
+        key : str
+            The name of an indexed attribute
+        value : str
+            The value to search for
+        """
+        return self.indexes[key].get(value)
+
+    # -- growing the list only needs to index the new records
+
+    def append(self, record):
+        super().append(record)
+        self._index(record)
+
+    def extend(self, records):
+        records = list(records)
+        super().extend(records)
+        for record in records:
+            self._index(record)
+
+    def __iadd__(self, records):
+        self.extend(records)
+        return self
+
+    def reindex(self):
+        """ Rebuild the indexes once indexed attributes were changed in place """
+        self._reindex()
+
+    def update(self, record, **values):
+        """Change attributes of a record of the list in place, and only the index
+        entries of the values that changed
+
+        The list is only scanned when a value is shared with other records.
+
+        Parameters
+        ----------
+        record : object
+            A record of the list
+        values :
+            The new values of its attributes, by name
+        """
+        changed = False
+        for name, value in values.items():
+            old = getattr(record, name)
+            if old == value:
+                continue
+            setattr(record, name, value)
+            changed = changed or name in self.indexes or name in self.versioned
+            if name not in self.indexes:
+                continue
+
+            index, shared = self.indexes[name], self._shared[name]
+            if index.get(old) is record:
+                del index[old]
+                if old in shared:
+                    first = next((r for r in self if getattr(r, name) == old), None)
+                    if first is not None:
+                        index[old] = first
+            first = index.setdefault(value, record)
+            if first is not record:
+                shared.add(value)
+                index[value] = next(r for r in self if r is first or r is record)
+
+        if changed:
+            self.version = nextVersion()
+
+    # -- anything else may change which record comes first, so rebuild
+
+    def insert(self, i, record):
+        super().insert(i, record)
+        self._reindex()
+
+    def __setitem__(self, i, value):
+        super().__setitem__(i, value)
+        self._reindex()
+
+    def __delitem__(self, i):
+        super().__delitem__(i)
+        self._reindex()
+
+    def remove(self, record):
+        super().remove(record)
+        self._reindex()
+
+    def pop(self, i=-1):
+        record = super().pop(i)
+        self._reindex()
+        return record
+
+    def clear(self):
+        super().clear()
+        self._reindex()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._reindex()
+
+    def reverse(self):
+        super().reverse()
+        self._reindex()
+
+
+class CompetitionList(IndexedList):
+    """An IndexedList of competitions that also acts as a calendar.
+
+    The competitions are kept sorted by date, so that splitting past from
+    upcoming competitions is a bisect on the current time. The split itself is
+    cached until the clock crosses the date of the next competition or the
+    list is modified.
+    """
+
+    versioned = ("date",)
+
+    def __init__(self, records=(), keys=("name",)):
+        super().__init__(records, keys)
+        self._calendar_version = None
+
+    def _rebuild_calendar(self):
+        self._sorted = sorted(self, key=lambda compet: compet.date)
+        self._dates = [compet.date for compet in self._sorted]
+        self._split = None
+        self._calendar_version = self.version
+
+    def partition(self, now):
+        """Return the past (date <= now) and next (date > now) competitions
+
+        Both lists are sorted by date and must not be modified by the caller.
+
+        Parameters
+        ----------
+        now : datetime
+            The date splitting the past competitions from the next ones
+        """
+        if self._calendar_version != self.version:
+            self._rebuild_calendar()
+
+        dates, split = self._dates, self._split
+
+        # the cached split stays valid as long as
+        # dates[split - 1] <= now < dates[split]
+        if (
+            split is None
+            or (split < len(dates) and now >= dates[split])
+            or (split > 0 and now < dates[split - 1])
+        ):
+            split = bisect.bisect_right(dates, now)
+            self._split = split
+            self._past = self._sorted[:split]
+            self._next = self._sorted[split:]
+
+        return self._past, self._next
+
+
+# -- booking ledger
+
+
+class BookingLedger:
+    """The places booked by each club in each competition.
+
+    Each booking is indexed both by club (forward) and by competition
+    (reverse), and the total number of places booked by each club and in each
+    competition is updated along with it, so that:
+
+    * `get`, `clubTotal` and `competitionTotal` are O(1)
+    * `byClub` and `byCompetition` are O(k), for the k bookings returned
+
+    Memory: each (club, competition) pair is stored in both indexes, i.e. two
+    dict entries (the names themselves are shared with the records), plus one
+    dict and one total per club and per competition having bookings. Measured
+    on CPython 3.11, that is ~60 bytes per pair when clubs book many
+    competitions, and up to ~300 bytes per pair when each club books a single
+    one (one dict per club dominates): 6 to 30 MB per 100k pairs.
+
+    Parameters
+    ----------
+    booking : dict
+        The places booked, as {club name: {competition name: places}}
+    """
+
+    def __init__(self, booking=None):
+        self.clubs = {}
+        self.competitions = {}
+        self.club_totals = {}
+        self.competition_totals = {}
+
+        for club, booked in (booking or {}).items():
+            for competition, places in booked.items():
+                self.add(club, competition, places)
+
+    def add(self, club, competition, places):
+        """Add places to the booking of a club in a competition
+
+        Parameters
+        ----------
+        club : str
+            The name of the club booking the places
+        competition : str
+            The name of the competition in which places are booked
+        places : int
+            The number of places booked
+        """
+
+        forward = self.clubs.setdefault(club, {})
+        forward[competition] = forward.get(competition, 0) + places
+
+        reverse = self.competitions.setdefault(competition, {})
+        reverse[club] = reverse.get(club, 0) + places
+
+        self.club_totals[club] = self.club_totals.get(club, 0) + places
+        self.competition_totals[competition] = (
+            self.competition_totals.get(competition, 0) + places
+        )
+
+    def get(self, club, competition):
+        """ Return the places booked by a club in a competition """
+        return self.clubs.get(club, {}).get(competition, 0)
+
+    def byClub(self, club):
+        """ Return the places booked by a club, as {competition name: places} """
+        return dict(self.clubs.get(club, {}))
+
+    def byCompetition(self, competition):
+        """ Return the places booked in a competition, as {club name: places} """
+        return dict(self.competitions.get(competition, {}))
+
+    def clubTotal(self, club):
+        """ Return the number of places booked by a club in all competitions """
+        return self.club_totals.get(club, 0)
+
+    def competitionTotal(self, competition):
+        """ Return the number of places booked in a competition by all clubs """
+        return self.competition_totals.get(competition, 0)
+
+    def toJson(self):
+        """ Return the bookings as {club name: {competition name: places}} """
+        return {club: dict(booked) for club, booked in self.clubs.items()}
+
+    def __eq__(self, other):
+        if not isinstance(other, BookingLedger):
+            return NotImplemented
+        return self.clubs == other.clubs
+
+    def __len__(self):
+        """ Return the number of (club, competition) pairs having bookings """
+        return sum(len(booked) for booked in self.clubs.values())
+
+
+# -- waitlists
+
+
+class Waitlist:
+    """The requests waiting for places in a competition, first come, first
+    served.
+
+    A club waits at most once: joining again keeps its position and its
+    request. Requests only leave from the head, so the position of a request
+    is the difference between its number and the number of the head, O(1).
+    """
+
+    def __init__(self):
+        self.requests = collections.OrderedDict()
+        self.joined = 0
+
+    def join(self, club, places):
+        """Add the request of a club (unless it's already waiting), and return
+        its position (starting at 1)
+
+        Parameters
+        ----------
+        club : str
+            The name of the club waiting for places
+        places : int
+            The number of places the club wants
+        """
+
+        entry = self.requests.get(club)
+        if entry is None:
+            self.joined += 1
+            entry = self.requests[club] = (self.joined, places)
+        return entry[0] - next(iter(self.requests.values()))[0] + 1
+
+    def head(self):
+        """ Return the first request, as (club name, places) """
+        club, (_, places) = next(iter(self.requests.items()))
+        return club, places
+
+    def pop(self):
+        """ Remove the first request """
+        self.requests.popitem(last=False)
+
+    def __iter__(self):
+        return ((club, places) for club, (_, places) in self.requests.items())
+
+    def __len__(self):
+        return len(self.requests)
+
+
+# ----- EXCEPTIONS -----
+
+
+class PointValueError(Exception):
+    """ Returned when there is a problem with the clubs' points """
+
+    pass
+
+
+class PlaceValueError(Exception):
+    """ Returned when there is a problem with the competitions' places """
+
+    pass
+
+
+class EventDateError(Exception):
+    """ Returned when there is an error with competition dates """
+
+    pass
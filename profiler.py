@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import cProfile
+import hmac
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RequestProfiler:
+    """Run a sample of the requests under cProfile and save their stats.
+
+    A request is profiled either at random (with probability `rate`), or
+    when it carries the `header` with the secret `token` as value. Only one
+    request is profiled at a time: the others are skipped meanwhile.
+
+    The stats of each profiled request are written to `directory`/requests
+    as a pstats file (only the `keep` most recent ones are kept), and are also
+    added to an aggregated file per route (`directory`/<route>.prof). Both
+    can be read with `python -m pstats`, or viewed as a flamegraph (e.g. with
+    snakeviz).
+
+    Parameters
+    ----------
+    directory : str
+        The directory where the stats are written (created if needed)
+    rate : float
+        The fraction of the requests profiled at random (0 to 1)
+    header : str
+        The name of the header requesting a profile
+    token : str
+        The value the header must have (the header is ignored without token)
+    keep : int
+        The number of per-request stats files kept
+    """
+
+    def __init__(self, directory, rate=0.0, header="X-Profile", token=None, keep=50):
+        self.directory = directory
+        self.rate = rate
+        self.header = header
+        self.token = token
+        self.keep = keep
+
+        self.count = 0
+        self._running = threading.Lock()
+        self._aggregates = {}
+
+        os.makedirs(os.path.join(directory, "requests"), exist_ok=True)
+
+    def wants(self, headers):
+        """ Tell whether a request with the given headers should be profiled """
+
+        if self.token and hmac.compare_digest(
+            headers.get(self.header, "").encode(), self.token.encode()
+        ):
+            return True
+        return random.random() < self.rate
+
+    def start(self):
+        """ Return a running profile, or None if another request is profiled """
+
+        if not self._running.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except BaseException:
+            self._running.release()
+            raise
+        return profile
+
+    def stop(self, profile, name):
+        """Stop a profile returned by `start` and save its stats
+
+        Parameters
+        ----------
+        profile : cProfile.Profile
+            The running profile
+        name : str
+            The name of the profiled route
+        """
+
+        profile.disable()
+        try:
+            stats = pstats.Stats(profile)
+            self.count += 1
+            stats.dump_stats(
+                os.path.join(
+                    self.directory,
+                    "requests",
+                    f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+                    f"-{self.count}-{name}.prof",
+                )
+            )
+
+            aggregate = self._aggregates.get(name)
+            if aggregate is None:
+                aggregate = self._aggregates[name] = stats
+            else:
+                aggregate.add(stats)
+            path = os.path.join(self.directory, f"{name}.prof")
+            aggregate.dump_stats(f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+
+            self.rotate()
+        finally:
+            self._running.release()
+
+    def rotate(self):
+        """ Remove the oldest per-request stats files beyond `keep` """
+
+        files = sorted(
+            (entry.stat().st_mtime, entry.path)
+            for entry in os.scandir(os.path.join(self.directory, "requests"))
+        )
+        for _, path in files[: max(len(files) - self.keep, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                logger.warning("couldn't remove %s", path)
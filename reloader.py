@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class FileWatcher:
+    """Poll some files and call `reload` once any of them changed.
+
+    A file is considered changed when its modification time or its size
+    changes. The files are reloaded by the watcher thread, so requests never
+    wait for them to be parsed. If the reload fails (e.g. a file is being
+    written), it is tried again at the next poll.
+
+    Parameters
+    ----------
+    paths : list of str
+        The paths of the files to watch
+    reload : callable
+        Called (without arguments) once the files changed
+    interval : float
+        The number of seconds between two polls
+    """
+
+    def __init__(self, paths, reload, interval=2):
+        self.paths = list(paths)
+        self.reload = reload
+        self.interval = interval
+
+        self.stamps = self._stamps()
+        self.count = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _stamps(self):
+        stamps = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stamps.append(None)
+            else:
+                stamps.append((stat.st_mtime_ns, stat.st_size))
+        return stamps
+
+    def check(self):
+        """ Reload the files if they changed since the last reload, and tell """
+
+        stamps = self._stamps()
+        if stamps == self.stamps:
+            return False
+
+        self.reload()
+
+        self.stamps = stamps
+        self.count += 1
+        return True
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("reload of %s failed", ", ".join(self.paths))
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.run, name="file-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,1511 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import contextlib
+import datetime
+import os
+import queue
+import sqlite3
+import threading
+import uuid
+
+from models import (
+    COST_PER_PLACE,
+    MAX_PLACES_PER_CLUB,
+    BookingLedger,
+    Club,
+    Competition,
+    CompetitionList,
+    IndexedList,
+    PlaceValueError,
+    PointValueError,
+    Waitlist,
+    nextVersion,
+)
+
+
+# ----- BOOKING RULES -----
+
+
+def checkPurchase(placesRequired, club_points, competition_places, booked):
+    """Raise the exception explaining why a purchase isn't possible (if any)
+
+    Parameters
+    ----------
+    placesRequired : int
+        The number of places to book
+    club_points : int
+        The number of points of the club
+    competition_places : int
+        The number of places still available in the competition
+    booked : int
+        The number of places already booked by the club in the competition
+
+    Raises
+    ------
+    PointValueError
+        If the number of places is invalid or the club lacks points
+    PlaceValueError
+        If the competition lacks places or the club would book more than
+        MAX_PLACES_PER_CLUB places in the competition
+    """
+
+    if placesRequired < 1:
+
+        raise PointValueError("Something went wrong-please try again")
+
+    elif club_points < placesRequired * COST_PER_PLACE:
+
+        raise PointValueError("You don't have enough points available")
+
+    elif competition_places < placesRequired:
+
+        raise PlaceValueError("You can't book more places than available")
+
+    elif placesRequired + booked > MAX_PLACES_PER_CLUB:
+
+        raise PlaceValueError(
+            f"You can't book more than {MAX_PLACES_PER_CLUB} places per competition"
+        )
+
+
+def checkPurchases(orders, club_points, places, booked):
+    """Raise the exception explaining why a batch of purchases isn't possible
+    (if any), each purchase being checked after the previous ones are applied
+
+    Parameters
+    ----------
+    orders : list of (str, int)
+        The names of the competitions along with the number of places to book
+    club_points : int
+        The number of points of the club
+    places : callable
+        Return the number of places still available in a competition
+    booked : callable
+        Return the number of places already booked by the club in a competition
+
+    Raises
+    ------
+    PointValueError, PlaceValueError
+        See checkPurchase (the message starts with the competition name)
+    """
+
+    counters = {}
+    for competition, placesRequired in orders:
+        if competition not in counters:
+            counters[competition] = (places(competition), booked(competition))
+        competition_places, competition_booked = counters[competition]
+
+        try:
+            checkPurchase(
+                placesRequired, club_points, competition_places, competition_booked
+            )
+        except (PointValueError, PlaceValueError) as error:
+            raise type(error)(f"{competition}: {error}") from error
+
+        club_points -= placesRequired * COST_PER_PLACE
+        counters[competition] = (
+            competition_places - placesRequired,
+            competition_booked + placesRequired,
+        )
+
+
+# ----- LOCKS -----
+
+
+class LockRegistry:
+    """Hand out one lock per key, creating it on first use """
+
+    def __init__(self):
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def get(self, key):
+        lock = self._locks.get(key)
+        if lock is None:
+            with self._guard:
+                lock = self._locks.setdefault(key, threading.Lock())
+        return lock
+
+
+class SharedLock:
+    """A lock that is either held by any number of 'shared' owners, or by a
+    single 'exclusive' owner. Exclusive owners get priority over new shared ones.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._shared = 0
+        self._exclusive = False
+        self._waiting = 0
+
+    @contextlib.contextmanager
+    def shared(self):
+        with self._cond:
+            while self._exclusive or self._waiting:
+                self._cond.wait()
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._shared -= 1
+                if not self._shared:
+                    self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        with self._cond:
+            self._waiting += 1
+            while self._exclusive or self._shared:
+                self._cond.wait()
+            self._waiting -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
+# ----- REPOSITORIES -----
+
+
+class Repository:
+    """The storage of the clubs, competitions and bookings used by the routes.
+
+    The records returned by the repository can be rendered as they are, and
+    `purchase` updates the counters of the records it is given.
+
+    `epoch` identifies the data the versions (clubsVersion, ...) are
+    counted from, so that versions of two different stores can't be mixed up.
+    """
+
+    epoch = None
+
+    def load(self, clubs, competitions, booking=None):
+        """Replace all the stored data
+
+        Parameters
+        ----------
+        clubs : iterable of Club
+            The clubs to store
+        competitions : iterable of Competition
+            The competitions to store
+        booking : dict
+            The places booked, as {club name: {competition name: places}}
+        """
+        raise NotImplementedError
+
+    def track(self, clubs, competitions):
+        """Remember the points and places of the clubs and competitions as read
+        from the data files, for the next `merge` to tell what changed in them
+        (`load` tracks the records it is given)
+
+        Parameters
+        ----------
+        clubs : iterable of Club
+            The clubs of the data file
+        competitions : iterable of Competition
+            The competitions of the data file
+        """
+        raise NotImplementedError
+
+    def merge(self, clubs, competitions):
+        """Merge new versions of the data files into the stored data, and
+        return the number of clubs and competitions that were added or changed
+
+        New records are added. For known records, the email or date is
+        updated, and the change of points or places since the tracked
+        version of the file is applied to the current counters, so that
+        the places booked meanwhile are kept (as after a restart replaying
+        the journal). Records missing from the files are kept.
+
+        Parameters
+        ----------
+        clubs : iterable of Club
+            The clubs of the data file
+        competitions : iterable of Competition
+            The competitions of the data file
+        """
+        raise NotImplementedError
+
+    def addClub(self, club):
+        """ Store a new club """
+        raise NotImplementedError
+
+    def addCompetition(self, competition):
+        """ Store a new competition """
+        raise NotImplementedError
+
+    def findClub(self, name):
+        """ Return the club with the given name (or None) """
+        raise NotImplementedError
+
+    def findClubByEmail(self, email):
+        """ Return the club with the given secretary email (or None) """
+        raise NotImplementedError
+
+    def findCompetition(self, name):
+        """ Return the competition with the given name (or None) """
+        raise NotImplementedError
+
+    def listClubs(self):
+        """ Return all the clubs, in the order they were added """
+        raise NotImplementedError
+
+    def listCompetitions(self):
+        """ Return all the competitions, in the order they were added """
+        raise NotImplementedError
+
+    def countClubs(self):
+        """ Return the number of clubs (without listing them) """
+        raise NotImplementedError
+
+    def countCompetitions(self):
+        """ Return the number of competitions (without listing them) """
+        raise NotImplementedError
+
+    def clubsVersion(self):
+        """Return a value that changes whenever the list of clubs or the points
+        of a club change (and only then), for caching purposes
+        """
+        raise NotImplementedError
+
+    def competitionsVersion(self):
+        """Return a value that changes whenever the list of competitions or
+        the places of a competition change (and only then), for caching purposes
+        """
+        raise NotImplementedError
+
+    def countPastCompetitions(self, now):
+        """ Return the number of competitions whose date is <= now """
+        raise NotImplementedError
+
+    def windowClubs(self, offset, limit):
+        """ Return at most `limit` clubs, starting at `offset`, in listClubs order """
+        raise NotImplementedError
+
+    def topClubs(self, limit):
+        """Return the `limit` clubs with the most points (the first added first,
+        in case of a tie)
+        """
+        raise NotImplementedError
+
+    def windowCompetitions(self, now, past, offset, limit):
+        """Return at most `limit` past or next competitions, starting at `offset`,
+        in partitionCompetitions order
+
+        Parameters
+        ----------
+        now : datetime
+            The date splitting the past competitions from the next ones
+        past : bool
+            Whether to return past competitions (rather than next ones)
+        offset : int
+            The number of competitions to skip
+        limit : int
+            The maximum number of competitions to return
+        """
+        raise NotImplementedError
+
+    def partitionCompetitions(self, now):
+        """Return the past (date <= now) and next (date > now) competitions,
+        both sorted by date
+
+        Parameters
+        ----------
+        now : datetime
+            The date splitting the past competitions from the next ones
+        """
+        raise NotImplementedError
+
+    def getBooking(self, club, competition):
+        """Return the current club's booking number for a given competition
+
+        Parameters
+        ----------
+        club : str
+            The name of the club
+        competition : str
+            The name of the competition
+        """
+        raise NotImplementedError
+
+    def getClubBookings(self, club):
+        """Return the places booked by a club, as {competition name: places}
+
+        Parameters
+        ----------
+        club : str
+            The name of the club
+        """
+        raise NotImplementedError
+
+    def getCompetitionBookings(self, competition):
+        """Return the places booked in a competition, as {club name: places}
+
+        Parameters
+        ----------
+        competition : str
+            The name of the competition
+        """
+        raise NotImplementedError
+
+    def getClubTotal(self, club):
+        """ Return the number of places booked by a club in all competitions """
+        raise NotImplementedError
+
+    def getCompetitionTotal(self, competition):
+        """ Return the number of places booked in a competition by all clubs """
+        raise NotImplementedError
+
+    def purchase(self, club, competition, placesRequired):
+        """Book places for a club in a competition, or raise an exception
+
+        The checks (see checkPurchase) and the updates are atomic.
+
+        Parameters
+        ----------
+        club : Club
+            The club booking the places
+        competition : Competition
+            The competition in which places are booked
+        placesRequired : int
+            The number of places to book
+        """
+        raise NotImplementedError
+
+    def purchaseMany(self, club, orders):
+        """Book places for a club in several competitions, or raise an exception
+        without booking any of them
+
+        The checks (see checkPurchases) and the updates are atomic.
+
+        Parameters
+        ----------
+        club : Club
+            The club booking the places
+        orders : list of (Competition, int)
+            The competitions along with the number of places to book
+        """
+        raise NotImplementedError
+
+    # -- flash sales
+
+    def isSoldOut(self, competition):
+        """Tell whether a competition has no place left for new requests, in
+        constant time: either it has no place left at all, or clubs are
+        waiting for the places left (False for an unknown competition)
+
+        Parameters
+        ----------
+        competition : str
+            The name of the competition
+        """
+        raise NotImplementedError
+
+    def joinWaitlist(self, club, competition, placesRequired):
+        """Add a request for places to the waitlist of a competition, and
+        return its position (starting at 1)
+
+        A club already waiting for the competition keeps its position (and
+        its first request).
+
+        Parameters
+        ----------
+        club : Club
+            The club waiting for places
+        competition : Competition
+            The competition the club wants places in
+        placesRequired : int
+            The number of places to book once available
+        """
+        raise NotImplementedError
+
+    def getWaitlist(self, competition):
+        """ Return the requests waiting in a competition, as (club name, places) """
+        raise NotImplementedError
+
+    def serveWaitlists(self):
+        """Book the available places for the clubs waiting for them, in the
+        order of the waitlists, and return the requests booked and dropped,
+        as lists of (club name, competition name, places)
+
+        The first request of a waitlist waits until there are enough places
+        for it (the next ones wait behind it), while the requests that the
+        rules refuse otherwise (see checkPurchase) are dropped.
+        """
+        raise NotImplementedError
+
+
+class PointsRanking:
+    """The clubs of an IndexedList sorted by decreasing points (then by position).
+
+    A change of points only marks the club (see `mark`), without taking any
+    lock: the marked clubs are moved to their new rank by the next `top`, so
+    the purchases don't wait for the ranking (nor for each other through it),
+    and the top is still read without sorting. The ranking is rebuilt when the
+    list itself changes, when many clubs are marked at once, or after
+    `invalidate`.
+
+    Parameters
+    ----------
+    clubs : IndexedList
+        The clubs to rank
+    """
+
+    def __init__(self, clubs):
+        self.clubs = clubs
+        self._lock = threading.Lock()
+        self._version = None
+        self._marked = set()
+
+    def _rebuild(self):
+        # (cleared first: a club marked meanwhile is only moved again)
+        self._marked.clear()
+        self._positions = {id(club): i for i, club in enumerate(self.clubs)}
+        self._ranked = [club.points for club in self.clubs]
+        self._keys = sorted((-points, i) for i, points in enumerate(self._ranked))
+        self._version = self.clubs.version
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+
+    def mark(self, club):
+        """Note that the points of a club changed, to move it to its new rank on
+        the next `top` (to be called after the change)
+        """
+        self._marked.add(id(club))
+
+    def top(self, limit):
+        with self._lock:
+            if (
+                self._version != self.clubs.version
+                or len(self._marked) > len(self._keys) // 8
+            ):
+                self._rebuild()
+
+            # (each club is found by the points it was ranked with)
+            while self._marked:
+                i = self._positions.get(self._marked.pop())
+                if i is None:
+                    continue
+                j = bisect.bisect_left(self._keys, (-self._ranked[i], i))
+                del self._keys[j]
+                self._ranked[i] = self.clubs[i].points
+                bisect.insort(self._keys, (-self._ranked[i], i))
+
+            return [self.clubs[i] for _, i in self._keys[:limit]]
+
+
+class MemoryRepository(Repository):
+    """Keep the data in memory, in indexed lists and a booking ledger.
+
+    The checks of a purchase and the corresponding debits are done while
+    holding both a lock dedicated to the club and a lock dedicated to the
+    competition. So concurrent purchases can't oversell a competition or
+    overspend points, while purchases involving distinct clubs and distinct
+    competitions don't wait for each other.
+
+    Locks are always taken in the same order (club, then competition),
+    which prevents deadlocks.
+
+    If a journal is attached, each purchase is appended to it while the locks
+    are held (so the journal order matches the order in which the purchases
+    were applied), then waited for once the locks are released, so that
+    concurrent purchases share the same fsync.
+
+    Purchases also hold the `checkpoint` lock in shared mode, so that holding
+    it exclusively gives a consistent view of the data and of the journal
+    (e.g. to write a snapshot). In shared mode it only counts its owners, so
+    purchases wait through it for a merge or a capture, not for each other.
+    The ranking of the clubs by points is only marked by a purchase, and
+    updated when read (see PointsRanking).
+
+    The data is private to the process: several worker processes would each
+    sell the same places, so they must share a SqliteRepository instead.
+
+    Parameters
+    ----------
+    journal : BookingJournal
+        The journal in which purchases are recorded (optional)
+    """
+
+    def __init__(self, journal=None):
+        self.club_locks = LockRegistry()
+        self.competition_locks = LockRegistry()
+        self.checkpoint = SharedLock()
+        self.serving = threading.Lock()
+        self.journal = journal
+        self.points_version = nextVersion()
+        self.places_version = nextVersion()
+        self.epoch = uuid.uuid4().hex
+        self.load((), ())
+
+    def load(self, clubs, competitions, booking=None):
+        self.clubs = IndexedList(clubs, keys=("email", "name"))
+        self.competitions = CompetitionList(competitions, keys=("name",))
+        self.booking = BookingLedger(booking)
+        self.ranking = PointsRanking(self.clubs)
+        self.track(self.clubs, self.competitions)
+
+        # (updated along with the places, see isSoldOut)
+        self.sold_out = {c.name for c in self.competitions if c.numberOfPlaces <= 0}
+        self.waitlists = {}
+
+    def track(self, clubs, competitions):
+        self.sources = {
+            "clubs": {club.name: club.points for club in clubs},
+            "competitions": {
+                competition.name: competition.numberOfPlaces
+                for competition in competitions
+            },
+        }
+
+    def merge(self, clubs, competitions):
+        sources = self.sources["clubs"], self.sources["competitions"]
+
+        # (purchases wait for the end of the merge)
+        with self.checkpoint.exclusive():
+
+            new_clubs, changed_clubs = [], 0
+            for club in clubs:
+                live = self.findClub(club.name)
+                delta = club.points - sources[0].get(club.name, club.points)
+                sources[0][club.name] = club.points
+
+                if live is None:
+                    new_clubs.append(club)
+                elif delta or live.email != club.email:
+                    changed_clubs += 1
+                    self.clubs.update(live, email=club.email)
+                    if delta:
+                        live.points += delta
+                        self.ranking.mark(live)
+                        self.points_version = nextVersion()
+
+            new_competitions, changed_competitions = [], 0
+            for competition in competitions:
+                live = self.findCompetition(competition.name)
+                delta = competition.numberOfPlaces - sources[1].get(
+                    competition.name, competition.numberOfPlaces
+                )
+                sources[1][competition.name] = competition.numberOfPlaces
+
+                if live is None:
+                    new_competitions.append(competition)
+                elif delta or live.date != competition.date:
+                    changed_competitions += 1
+                    self.competitions.update(live, date=competition.date)
+                    if delta:
+                        live.numberOfPlaces += delta
+                        self.updateSoldOut(live)
+                        self.places_version = nextVersion()
+
+            # (only the new records and the changed emails and dates are indexed,
+            # and change the versions of the lists)
+            self.clubs.extend(new_clubs)
+            self.competitions.extend(new_competitions)
+            for competition in new_competitions:
+                self.updateSoldOut(competition)
+
+        return (
+            len(new_clubs) + changed_clubs,
+            len(new_competitions) + changed_competitions,
+        )
+
+    def addClub(self, club):
+        self.clubs.append(club)
+
+    def addCompetition(self, competition):
+        self.competitions.append(competition)
+        self.updateSoldOut(competition)
+
+    def findClub(self, name):
+        return self.clubs.find("name", name)
+
+    def findClubByEmail(self, email):
+        return self.clubs.find("email", email)
+
+    def findCompetition(self, name):
+        return self.competitions.find("name", name)
+
+    def listClubs(self):
+        return self.clubs
+
+    def listCompetitions(self):
+        return self.competitions
+
+    def countClubs(self):
+        return len(self.clubs)
+
+    def countCompetitions(self):
+        return len(self.competitions)
+
+    def partitionCompetitions(self, now):
+        return self.competitions.partition(now)
+
+    def clubsVersion(self):
+        return self.clubs.version, self.points_version
+
+    def competitionsVersion(self):
+        return self.competitions.version, self.places_version
+
+    def countPastCompetitions(self, now):
+        return len(self.competitions.partition(now)[0])
+
+    def windowClubs(self, offset, limit):
+        return self.clubs[offset : offset + limit]
+
+    def topClubs(self, limit):
+        return self.ranking.top(limit)
+
+    def windowCompetitions(self, now, past, offset, limit):
+        competitions = self.competitions.partition(now)[0 if past else 1]
+        return competitions[offset : offset + limit]
+
+    # -- bookings (see BookingLedger)
+
+    def getBooking(self, club, competition):
+        return self.booking.get(club, competition)
+
+    def getClubBookings(self, club):
+        return self.booking.byClub(club)
+
+    def getCompetitionBookings(self, competition):
+        return self.booking.byCompetition(competition)
+
+    def getClubTotal(self, club):
+        return self.booking.clubTotal(club)
+
+    def getCompetitionTotal(self, competition):
+        return self.booking.competitionTotal(competition)
+
+    # -- purchases
+
+    def purchase(self, club, competition, placesRequired):
+
+        # (shared with the other purchases: without it, a snapshot could hold a
+        # purchase its journal sequence number doesn't cover, or miss one it
+        # does, and a merge could apply its deltas to half-debited counters)
+        with self.checkpoint.shared(), self.club_locks.get(
+            club.name
+        ), self.competition_locks.get(competition.name):
+
+            checkPurchase(
+                placesRequired,
+                club.points,
+                competition.numberOfPlaces,
+                self.getBooking(club.name, competition.name),
+            )
+
+            club.points -= placesRequired * COST_PER_PLACE
+            self.ranking.mark(club)
+            competition.numberOfPlaces -= placesRequired
+            self.updateSoldOut(competition)
+
+            self.booking.add(club.name, competition.name, placesRequired)
+
+            # (changed after the counters, so a version never describes older ones)
+            self.points_version = nextVersion()
+            self.places_version = nextVersion()
+
+            if self.journal is not None:
+                seq = self.journal.append(
+                    {
+                        "club": club.name,
+                        "competition": competition.name,
+                        "places": placesRequired,
+                        "points": placesRequired * COST_PER_PLACE,
+                    }
+                )
+
+        if self.journal is not None:
+            self.journal.wait(seq)
+
+    def purchaseMany(self, club, orders):
+
+        # (the competitions are locked in the same order by every batch)
+        competitions = {competition.name: competition for competition, _ in orders}
+
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(self.checkpoint.shared())
+            stack.enter_context(self.club_locks.get(club.name))
+            for name in sorted(competitions):
+                stack.enter_context(self.competition_locks.get(name))
+
+            checkPurchases(
+                [
+                    (competition.name, placesRequired)
+                    for competition, placesRequired in orders
+                ],
+                club.points,
+                lambda name: competitions[name].numberOfPlaces,
+                lambda name: self.getBooking(club.name, name),
+            )
+
+            club.points -= (
+                sum(placesRequired for _, placesRequired in orders) * COST_PER_PLACE
+            )
+            self.ranking.mark(club)
+            for competition, placesRequired in orders:
+                competition.numberOfPlaces -= placesRequired
+                self.updateSoldOut(competition)
+                self.booking.add(club.name, competition.name, placesRequired)
+
+            self.points_version = nextVersion()
+            self.places_version = nextVersion()
+
+            # (a single record, so the batch is replayed all or nothing)
+            if self.journal is not None:
+                seq = self.journal.append(
+                    {
+                        "club": club.name,
+                        "items": [
+                            {
+                                "competition": competition.name,
+                                "places": placesRequired,
+                                "points": placesRequired * COST_PER_PLACE,
+                            }
+                            for competition, placesRequired in orders
+                        ],
+                    }
+                )
+
+        if self.journal is not None:
+            self.journal.wait(seq)
+
+    # -- flash sales
+
+    def updateSoldOut(self, competition):
+        """ Update the sold out state of a competition after its places changed """
+        if competition.numberOfPlaces > 0:
+            self.sold_out.discard(competition.name)
+        else:
+            self.sold_out.add(competition.name)
+
+    def isSoldOut(self, competition):
+        return competition in self.sold_out or competition in self.waitlists
+
+    def joinWaitlist(self, club, competition, placesRequired):
+        with self.competition_locks.get(competition.name):
+            waitlist = self.waitlists.get(competition.name)
+            if waitlist is None:
+                waitlist = self.waitlists[competition.name] = Waitlist()
+            return waitlist.join(club.name, placesRequired)
+
+    def getWaitlist(self, competition):
+        with self.competition_locks.get(competition):
+            return list(self.waitlists.get(competition, ()))
+
+    def serveWaitlists(self):
+        booked, dropped = [], []
+
+        # (the requests are booked with `purchase`, so that they are checked,
+        # locked and journaled as any other, and only leave the waitlist here)
+        with self.serving:
+            for name in list(self.waitlists):
+                competition = self.findCompetition(name)
+                lock = self.competition_locks.get(name)
+
+                while True:
+                    with lock:
+                        waitlist = self.waitlists.get(name)
+                        if not waitlist:
+                            self.waitlists.pop(name, None)
+                            break
+                        club_name, places = waitlist.head()
+
+                    club = self.findClub(club_name)
+                    if competition is not None and club is not None:
+                        if competition.numberOfPlaces < places:
+                            break
+                        try:
+                            self.purchase(club, competition, places)
+                        except (PointValueError, PlaceValueError):
+                            # (the places may have been booked meanwhile)
+                            if competition.numberOfPlaces < places:
+                                break
+                            dropped.append((club_name, name, places))
+                        else:
+                            booked.append((club_name, name, places))
+                    else:
+                        dropped.append((club_name, name, places))
+
+                    with lock:
+                        waitlist.pop()
+
+        return booked, dropped
+
+    # -- persistence
+
+    def replay(self, journal, after=0):
+        """Apply the purchases recorded in a journal to the stored data
+
+        Purchases are applied as they were recorded, without any validation,
+        since they were valid when they were made.
+
+        Parameters
+        ----------
+        journal : BookingJournal
+            The journal to replay
+        after : int
+            Only replay the records following this sequence number
+        """
+
+        for record in journal.replay(after):
+            club = self.findClub(record["club"])
+
+            # (batches of purchases are recorded with their items)
+            for item in record.get("items", [record]):
+                competition = self.findCompetition(item["competition"])
+
+                if club is not None:
+                    club.points -= item["points"]
+                if competition is not None:
+                    competition.numberOfPlaces -= item["places"]
+
+                self.booking.add(record["club"], item["competition"], item["places"])
+
+        self.sold_out = {c.name for c in self.competitions if c.numberOfPlaces <= 0}
+        self.ranking.invalidate()
+        self.points_version = nextVersion()
+        self.places_version = nextVersion()
+
+    def capture(self):
+        """Return the last journal sequence number along with a consistent copy
+        of the clubs, competitions and bookings, in the clubs.json /
+        competitions.json format (so that a snapshot can be read by the loaders),
+        and of the tracked version of the data files (see track).
+        """
+
+        with self.checkpoint.exclusive():
+            seq = self.journal.last_seq if self.journal is not None else 0
+            data = {
+                "clubs": [club.toJson() for club in self.clubs],
+                "competitions": [
+                    competition.toJson() for competition in self.competitions
+                ],
+                "booking": self.booking.toJson(),
+                "sources": {kind: dict(self.sources[kind]) for kind in self.sources},
+            }
+
+        return seq, data
+
+
+class SqliteRepository(Repository):
+    """Keep the data in a SQLite database, so it persists and can be shared by
+    several processes on the same host.
+
+    The database uses the WAL journal mode, so that readers don't block the
+    writer (and conversely). Clubs are indexed by name and email, and
+    competitions by name and date.
+
+    Connections are pooled: each request borrows an idle connection (or opens
+    a new one) and gives it back once done, so each worker thread or greenlet
+    reuses connections instead of opening one per query.
+
+    A purchase is a single IMMEDIATE transaction, which takes the database
+    write lock before reading the counters it checks. So the points, places
+    and bookings stay consistent across all the worker processes using the
+    same file (e.g. gunicorn / uwsgi workers), each place being sold once.
+
+    Parameters
+    ----------
+    path : str
+        The path of the database file (created if needed)
+    timeout : float
+        How long to wait for the write lock, in seconds
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS clubs (
+            name TEXT PRIMARY KEY,
+            email TEXT NOT NULL,
+            points INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS clubs_email ON clubs (email);
+        CREATE INDEX IF NOT EXISTS clubs_points ON clubs (points DESC);
+
+        CREATE TABLE IF NOT EXISTS competitions (
+            name TEXT PRIMARY KEY,
+            date TEXT NOT NULL,
+            places INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS competitions_date ON competitions (date);
+
+        CREATE TABLE IF NOT EXISTS booking (
+            club TEXT NOT NULL,
+            competition TEXT NOT NULL,
+            places INTEGER NOT NULL,
+            PRIMARY KEY (club, competition)
+        );
+        CREATE INDEX IF NOT EXISTS booking_competition ON booking (competition);
+
+        CREATE TABLE IF NOT EXISTS waitlist (
+            number INTEGER PRIMARY KEY AUTOINCREMENT,
+            competition TEXT NOT NULL,
+            club TEXT NOT NULL,
+            places INTEGER NOT NULL,
+            UNIQUE (competition, club)
+        );
+
+        CREATE TABLE IF NOT EXISTS sources (
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            counter INTEGER NOT NULL,
+            PRIMARY KEY (kind, name)
+        );
+
+        CREATE TABLE IF NOT EXISTS versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO versions (name, version) VALUES ('clubs', 0);
+        INSERT OR IGNORE INTO versions (name, version) VALUES ('competitions', 0);
+        INSERT OR IGNORE INTO versions (name, version) VALUES ('epoch', random());
+    """
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._pool = queue.LifoQueue()
+        self._pid = os.getpid()
+
+        with self._connection() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(self.SCHEMA)
+            self.epoch = self._version(db, "epoch")
+
+    def _connect(self):
+        db = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        return db
+
+    @contextlib.contextmanager
+    def _connection(self):
+        # a connection can't be used across a fork: the workers forked from a
+        # process which already used the repository start with a new pool
+        if self._pid != os.getpid():
+            self._pool = queue.LifoQueue()
+            self._pid = os.getpid()
+
+        try:
+            db = self._pool.get_nowait()
+        except queue.Empty:
+            db = self._connect()
+        try:
+            yield db
+        finally:
+            self._pool.put(db)
+
+    @contextlib.contextmanager
+    def _transaction(self, immediate=False):
+        with self._connection() as db:
+            db.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    # -- rows <-> records
+
+    @staticmethod
+    def _club(row):
+        return None if row is None else Club(*row)
+
+    @staticmethod
+    def _competition(row):
+        if row is None:
+            return None
+        name, date, places = row
+        return Competition(name, datetime.datetime.fromisoformat(date), places)
+
+    @staticmethod
+    def _date(date):
+        return date.strftime("%Y-%m-%d %H:%M:%S")
+
+    @staticmethod
+    def _bump(db, name):
+        db.execute("UPDATE versions SET version = version + 1 WHERE name = ?", (name,))
+
+    @staticmethod
+    def _version(db, name):
+        return db.execute(
+            "SELECT version FROM versions WHERE name = ?", (name,)
+        ).fetchone()[0]
+
+    def _insert(self, db, clubs, competitions, booking=None):
+        db.executemany(
+            "INSERT OR IGNORE INTO clubs (name, email, points) VALUES (?, ?, ?)",
+            ((c.name, c.email, c.points) for c in clubs),
+        )
+        db.executemany(
+            "INSERT OR IGNORE INTO competitions (name, date, places) VALUES (?, ?, ?)",
+            ((c.name, self._date(c.date), c.numberOfPlaces) for c in competitions),
+        )
+        db.executemany(
+            "INSERT INTO booking (club, competition, places) VALUES (?, ?, ?)",
+            (
+                (club, competition, places)
+                for club, booked in (booking or {}).items()
+                for competition, places in booked.items()
+            ),
+        )
+
+    @staticmethod
+    def _book(db, club, competition, placesRequired):
+        """ Apply a purchase already checked (the names of the club and competition) """
+        db.execute(
+            "UPDATE clubs SET points = points - ? WHERE name = ?",
+            (placesRequired * COST_PER_PLACE, club),
+        )
+        db.execute(
+            "UPDATE competitions SET places = places - ? WHERE name = ?",
+            (placesRequired, competition),
+        )
+        db.execute(
+            "INSERT INTO booking (club, competition, places) VALUES (?, ?, ?)"
+            " ON CONFLICT (club, competition)"
+            " DO UPDATE SET places = places + excluded.places",
+            (club, competition, placesRequired),
+        )
+
+    # -- repository interface
+
+    def _track(self, db, clubs, competitions, replace=True):
+        db.executemany(
+            f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO sources"
+            " (kind, name, counter) VALUES (?, ?, ?)",
+            [("clubs", club.name, club.points) for club in clubs]
+            + [
+                ("competitions", competition.name, competition.numberOfPlaces)
+                for competition in competitions
+            ],
+        )
+
+    def load(self, clubs, competitions, booking=None):
+        clubs, competitions = list(clubs), list(competitions)
+
+        with self._transaction(immediate=True) as db:
+            db.execute("DELETE FROM booking")
+            db.execute("DELETE FROM waitlist")
+            db.execute("DELETE FROM clubs")
+            db.execute("DELETE FROM competitions")
+            db.execute("DELETE FROM sources")
+            self._insert(db, clubs, competitions, booking)
+            self._track(db, clubs, competitions)
+            self._bump(db, "clubs")
+            self._bump(db, "competitions")
+
+    def seed(self, clubs, competitions):
+        """Add the clubs and competitions which aren't stored yet
+
+        Several processes can seed the same database concurrently.
+        """
+        clubs, competitions = list(clubs), list(competitions)
+
+        with self._transaction(immediate=True) as db:
+            self._insert(db, clubs, competitions)
+            self._track(db, clubs, competitions, replace=False)
+            self._bump(db, "clubs")
+            self._bump(db, "competitions")
+
+    def track(self, clubs, competitions):
+        with self._transaction() as db:
+            self._track(db, list(clubs), list(competitions))
+
+    def merge(self, clubs, competitions):
+        clubs, competitions = list(clubs), list(competitions)
+
+        # (the tracked counters are kept in the database, so that each worker
+        # process merging the same files applies their changes only once)
+        with self._transaction(immediate=True) as db:
+
+            def source(kind, name, counter):
+                row = db.execute(
+                    "SELECT counter FROM sources WHERE kind = ? AND name = ?",
+                    (kind, name),
+                ).fetchone()
+                return counter if row is None else row[0]
+
+            changed_clubs = 0
+            for club in clubs:
+                delta = club.points - source("clubs", club.name, club.points)
+                row = db.execute(
+                    "SELECT email FROM clubs WHERE name = ?", (club.name,)
+                ).fetchone()
+                if row is None:
+                    self._insert(db, [club], [])
+                elif delta or row[0] != club.email:
+                    db.execute(
+                        "UPDATE clubs SET email = ?, points = points + ?"
+                        " WHERE name = ?",
+                        (club.email, delta, club.name),
+                    )
+                else:
+                    continue
+                changed_clubs += 1
+
+            changed_competitions = 0
+            for competition in competitions:
+                delta = competition.numberOfPlaces - source(
+                    "competitions", competition.name, competition.numberOfPlaces
+                )
+                date = self._date(competition.date)
+                row = db.execute(
+                    "SELECT date FROM competitions WHERE name = ?", (competition.name,)
+                ).fetchone()
+                if row is None:
+                    self._insert(db, [], [competition])
+                elif delta or row[0] != date:
+                    db.execute(
+                        "UPDATE competitions SET date = ?, places = places + ?"
+                        " WHERE name = ?",
+                        (date, delta, competition.name),
+                    )
+                else:
+                    continue
+                changed_competitions += 1
+
+            self._track(db, clubs, competitions)
+            if changed_clubs:
+                self._bump(db, "clubs")
+            if changed_competitions:
+                self._bump(db, "competitions")
+
+        return changed_clubs, changed_competitions
+
+    def addClub(self, club):
+        with self._transaction() as db:
+            self._insert(db, [club], [])
+            self._bump(db, "clubs")
+
+    def addCompetition(self, competition):
+        with self._transaction() as db:
+            self._insert(db, [], [competition])
+            self._bump(db, "competitions")
+
+    def findClub(self, name):
+        with self._connection() as db:
+            return self._club(
+                db.execute(
+                    "SELECT name, email, points FROM clubs WHERE name = ?", (name,)
+                ).fetchone()
+            )
+
+    def findClubByEmail(self, email):
+        with self._connection() as db:
+            return self._club(
+                db.execute(
+                    "SELECT name, email, points FROM clubs WHERE email = ?"
+                    " ORDER BY rowid LIMIT 1",
+                    (email,),
+                ).fetchone()
+            )
+
+    def findCompetition(self, name):
+        with self._connection() as db:
+            return self._competition(
+                db.execute(
+                    "SELECT name, date, places FROM competitions WHERE name = ?",
+                    (name,),
+                ).fetchone()
+            )
+
+    def listClubs(self):
+        with self._connection() as db:
+            rows = db.execute(
+                "SELECT name, email, points FROM clubs ORDER BY rowid"
+            ).fetchall()
+        return [self._club(row) for row in rows]
+
+    def listCompetitions(self):
+        with self._connection() as db:
+            rows = db.execute(
+                "SELECT name, date, places FROM competitions ORDER BY rowid"
+            ).fetchall()
+        return [self._competition(row) for row in rows]
+
+    def countClubs(self):
+        with self._connection() as db:
+            return db.execute("SELECT COUNT(*) FROM clubs").fetchone()[0]
+
+    def countCompetitions(self):
+        with self._connection() as db:
+            return db.execute("SELECT COUNT(*) FROM competitions").fetchone()[0]
+
+    def clubsVersion(self):
+        with self._connection() as db:
+            return self._version(db, "clubs")
+
+    def competitionsVersion(self):
+        with self._connection() as db:
+            return self._version(db, "competitions")
+
+    def countPastCompetitions(self, now):
+        with self._connection() as db:
+            return db.execute(
+                "SELECT COUNT(*) FROM competitions WHERE date <= ?", (self._date(now),)
+            ).fetchone()[0]
+
+    def windowClubs(self, offset, limit):
+        with self._connection() as db:
+            rows = db.execute(
+                "SELECT name, email, points FROM clubs ORDER BY rowid"
+                " LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [self._club(row) for row in rows]
+
+    def topClubs(self, limit):
+        # (read from the clubs_points index, without sorting)
+        with self._connection() as db:
+            rows = db.execute(
+                "SELECT name, email, points FROM clubs ORDER BY points DESC, rowid"
+                " LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [self._club(row) for row in rows]
+
+    def windowCompetitions(self, now, past, offset, limit):
+        with self._connection() as db:
+            rows = db.execute(
+                "SELECT name, date, places FROM competitions"
+                f" WHERE date {'<=' if past else '>'} ?"
+                " ORDER BY date, rowid LIMIT ? OFFSET ?",
+                (self._date(now), limit, offset),
+            ).fetchall()
+        return [self._competition(row) for row in rows]
+
+    def partitionCompetitions(self, now):
+        now = self._date(now)
+        with self._transaction() as db:
+            past = db.execute(
+                "SELECT name, date, places FROM competitions WHERE date <= ?"
+                " ORDER BY date, rowid",
+                (now,),
+            ).fetchall()
+            upcoming = db.execute(
+                "SELECT name, date, places FROM competitions WHERE date > ?"
+                " ORDER BY date, rowid",
+                (now,),
+            ).fetchall()
+        return (
+            [self._competition(row) for row in past],
+            [self._competition(row) for row in upcoming],
+        )
+
+    def getBooking(self, club, competition):
+        with self._connection() as db:
+            row = db.execute(
+                "SELECT places FROM booking WHERE club = ? AND competition = ?",
+                (club, competition),
+            ).fetchone()
+        return 0 if row is None else row[0]
+
+    # (the bookings are read from the primary key by club, and from the
+    # booking_competition index by competition)
+
+    def getClubBookings(self, club):
+        with self._connection() as db:
+            rows = db.execute(
+                "SELECT competition, places FROM booking WHERE club = ?", (club,)
+            ).fetchall()
+        return dict(rows)
+
+    def getCompetitionBookings(self, competition):
+        with self._connection() as db:
+            rows = db.execute(
+                "SELECT club, places FROM booking WHERE competition = ?",
+                (competition,),
+            ).fetchall()
+        return dict(rows)
+
+    def getClubTotal(self, club):
+        with self._connection() as db:
+            (total,) = db.execute(
+                "SELECT COALESCE(SUM(places), 0) FROM booking WHERE club = ?", (club,)
+            ).fetchone()
+        return total
+
+    def getCompetitionTotal(self, competition):
+        with self._connection() as db:
+            (total,) = db.execute(
+                "SELECT COALESCE(SUM(places), 0) FROM booking WHERE competition = ?",
+                (competition,),
+            ).fetchone()
+        return total
+
+    def purchase(self, club, competition, placesRequired):
+        cost = placesRequired * COST_PER_PLACE
+
+        with self._transaction(immediate=True) as db:
+            (club_points,) = db.execute(
+                "SELECT points FROM clubs WHERE name = ?", (club.name,)
+            ).fetchone()
+            (competition_places,) = db.execute(
+                "SELECT places FROM competitions WHERE name = ?", (competition.name,)
+            ).fetchone()
+            row = db.execute(
+                "SELECT places FROM booking WHERE club = ? AND competition = ?",
+                (club.name, competition.name),
+            ).fetchone()
+
+            checkPurchase(
+                placesRequired,
+                club_points,
+                competition_places,
+                0 if row is None else row[0],
+            )
+
+            self._book(db, club.name, competition.name, placesRequired)
+            self._bump(db, "clubs")
+            self._bump(db, "competitions")
+
+        club.points = club_points - cost
+        competition.numberOfPlaces = competition_places - placesRequired
+
+    def purchaseMany(self, club, orders):
+        with self._transaction(immediate=True) as db:
+
+            def places(name):
+                return db.execute(
+                    "SELECT places FROM competitions WHERE name = ?", (name,)
+                ).fetchone()[0]
+
+            def booked(name):
+                row = db.execute(
+                    "SELECT places FROM booking WHERE club = ? AND competition = ?",
+                    (club.name, name),
+                ).fetchone()
+                return 0 if row is None else row[0]
+
+            (club_points,) = db.execute(
+                "SELECT points FROM clubs WHERE name = ?", (club.name,)
+            ).fetchone()
+
+            checkPurchases(
+                [
+                    (competition.name, placesRequired)
+                    for competition, placesRequired in orders
+                ],
+                club_points,
+                places,
+                booked,
+            )
+
+            for competition, placesRequired in orders:
+                self._book(db, club.name, competition.name, placesRequired)
+            self._bump(db, "clubs")
+            self._bump(db, "competitions")
+
+            remaining = {
+                competition.name: places(competition.name) for competition, _ in orders
+            }
+
+        club.points = club_points - sum(
+            placesRequired * COST_PER_PLACE for _, placesRequired in orders
+        )
+        for competition, _ in orders:
+            competition.numberOfPlaces = remaining[competition.name]
+
+    # -- flash sales
+
+    def isSoldOut(self, competition):
+        with self._connection() as db:
+            row = db.execute(
+                "SELECT places <= 0 OR EXISTS"
+                " (SELECT 1 FROM waitlist WHERE competition = name)"
+                " FROM competitions WHERE name = ?",
+                (competition,),
+            ).fetchone()
+        return row is not None and bool(row[0])
+
+    def joinWaitlist(self, club, competition, placesRequired):
+        with self._transaction(immediate=True) as db:
+            db.execute(
+                "INSERT OR IGNORE INTO waitlist (competition, club, places)"
+                " VALUES (?, ?, ?)",
+                (competition.name, club.name, placesRequired),
+            )
+            (position,) = db.execute(
+                "SELECT COUNT(*) FROM waitlist WHERE competition = ? AND number <="
+                " (SELECT number FROM waitlist WHERE competition = ? AND club = ?)",
+                (competition.name, competition.name, club.name),
+            ).fetchone()
+        return position
+
+    def getWaitlist(self, competition):
+        with self._connection() as db:
+            return db.execute(
+                "SELECT club, places FROM waitlist WHERE competition = ?"
+                " ORDER BY number",
+                (competition,),
+            ).fetchall()
+
+    def serveWaitlists(self):
+        booked, dropped = [], []
+
+        with self._transaction(immediate=True) as db:
+            blocked = set()
+            for number, competition, club, places in db.execute(
+                "SELECT number, competition, club, places FROM waitlist"
+                " ORDER BY number"
+            ).fetchall():
+                if competition in blocked:
+                    continue
+
+                club_row = db.execute(
+                    "SELECT points FROM clubs WHERE name = ?", (club,)
+                ).fetchone()
+                competition_row = db.execute(
+                    "SELECT places FROM competitions WHERE name = ?", (competition,)
+                ).fetchone()
+
+                if club_row is None or competition_row is None:
+                    dropped.append((club, competition, places))
+                elif competition_row[0] < places:
+                    blocked.add(competition)
+                    continue
+                else:
+                    booking_row = db.execute(
+                        "SELECT places FROM booking WHERE club = ? AND competition = ?",
+                        (club, competition),
+                    ).fetchone()
+                    try:
+                        checkPurchase(
+                            places,
+                            club_row[0],
+                            competition_row[0],
+                            0 if booking_row is None else booking_row[0],
+                        )
+                    except (PointValueError, PlaceValueError):
+                        dropped.append((club, competition, places))
+                    else:
+                        self._book(db, club, competition, places)
+                        booked.append((club, competition, places))
+
+                db.execute("DELETE FROM waitlist WHERE number = ?", (number,))
+
+            if booked:
+                self._bump(db, "clubs")
+                self._bump(db, "competitions")
+
+        return booked, dropped
@@ -1,114 +1,988 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+import hashlib
+import hmac
 import json
-
-from flask import Flask, render_template, request, redirect, flash, url_for
+import logging
+import math
+import os
+import threading
+import time
+
+import click
+from flask import Flask, render_template, request, redirect, flash, url_for, jsonify
+from flask import g, make_response, session
+from flask.templating import Environment
+from jinja2 import FileSystemBytecodeCache, Template
+from markupsafe import Markup
+
+from admission import Admission
+from compression import compress, negotiate
+from datagen import generateClubs, generateCompetitions
+from journal import BookingJournal, Snapshotter
+from loader import loadPrecompiled, loadRecords, readValue
+from metrics import Counter, Gauge, Histogram, Registry, instrument
+from profiler import RequestProfiler
+from reloader import FileWatcher
+from models import (  # noqa: F401
+    COST_PER_PLACE,
+    MAX_PLACES_PER_CLUB,
+    Club,
+    Competition,
+    EventDateError,
+    PlaceValueError,
+    PointValueError,
+    formatDate,
+)
+from repository import MemoryRepository, Repository, SqliteRepository  # noqa: F401
 
 # ----- INIT APPLICATION -----
 
+logger = logging.getLogger(__name__)
+
+# (the startup time is measured from here, the imports aside)
+import_start = time.perf_counter()
+
 app = Flask(__name__)
 app.secret_key = "something_special"
 
+# the data files may also be NDJSON files (.ndjson / .jsonl, one item per line)
+app.config["CLUBS_FILE"] = os.environ.get("GUDLFT_CLUBS_FILE", "clubs.json")
+app.config["COMPETITIONS_FILE"] = os.environ.get(
+    "GUDLFT_COMPETITIONS_FILE", "competitions.json"
+)
+
+# the data is loaded when the module is imported, or on the first request with
+# LAZY_LOAD (see createApp)
+app.config["LAZY_LOAD"] = os.environ.get("GUDLFT_LAZY_LOAD", "0") == "1"
+
+# the data files are parsed once, then read from a precompiled (pickled)
+# version, <file>.cache, as long as they don't change
+app.config["PRECOMPILED"] = os.environ.get("GUDLFT_PRECOMPILED", "1") == "1"
+
+# the compiled templates are kept in this directory, shared by the workers and
+# kept across restarts ("" to compile them in each process)
+app.config["TEMPLATE_CACHE"] = os.environ.get(
+    "GUDLFT_TEMPLATE_CACHE", os.path.join(app.root_path, "__pycache__", "templates")
+)
+
+# the HTML and JSON responses of at least COMPRESS_MIN_SIZE bytes are
+# compressed (gzip, or brotli if installed) for the clients accepting it
+app.config["COMPRESS"] = os.environ.get("GUDLFT_COMPRESS", "1") == "1"
+app.config["COMPRESS_MIN_SIZE"] = int(os.environ.get("GUDLFT_COMPRESS_MIN_SIZE", 500))
+app.config["GZIP_LEVEL"] = int(os.environ.get("GUDLFT_GZIP_LEVEL", 6))
+app.config["BROTLI_QUALITY"] = int(os.environ.get("GUDLFT_BROTLI_QUALITY", 5))
+
+# the booking routes (purchasePlaces and book) admit at most ADMISSION_RATE
+# requests per second (with bursts of ADMISSION_BURST), and CLUB_RATE per club
+# (CLUB_BURST), the others being refused right away (429); 0 disables a limit
+app.config["ADMISSION_RATE"] = float(os.environ.get("GUDLFT_ADMISSION_RATE", 0))
+app.config["ADMISSION_BURST"] = int(os.environ.get("GUDLFT_ADMISSION_BURST", 100))
+app.config["CLUB_RATE"] = float(os.environ.get("GUDLFT_CLUB_RATE", 0))
+app.config["CLUB_BURST"] = int(os.environ.get("GUDLFT_CLUB_BURST", 5))
+
+# in flash sale mode, the requests for places in a sold out competition are
+# answered right away, and wait in line for the places coming back (FIFO)
+app.config["FLASH_SALE"] = os.environ.get("GUDLFT_FLASH_SALE", "0") == "1"
+
+# the data files are checked every RELOAD_INTERVAL seconds, and their changes
+# merged into the live data (0 disables the reload)
+app.config["RELOAD_INTERVAL"] = float(os.environ.get("GUDLFT_RELOAD_INTERVAL", 2))
+
+# with a PROFILE_DIR, a PROFILE_RATE fraction of the requests (and those with
+# an X-Profile header equal to PROFILE_TOKEN) are profiled with cProfile
+app.config["PROFILE_DIR"] = os.environ.get("GUDLFT_PROFILE_DIR")
+app.config["PROFILE_RATE"] = float(os.environ.get("GUDLFT_PROFILE_RATE", 0.01))
+app.config["PROFILE_TOKEN"] = os.environ.get("GUDLFT_PROFILE_TOKEN")
+app.config["PROFILE_KEEP"] = int(os.environ.get("GUDLFT_PROFILE_KEEP", 50))
+
+# with an ADMIN_TOKEN, the data can be reset (or replaced with generated data)
+# from the local host, e.g. between two load tests (see /admin/reset)
+app.config["ADMIN_TOKEN"] = os.environ.get("GUDLFT_ADMIN_TOKEN")
+
+# the data is either kept in memory ("memory") or in a SQLite database ("sqlite")
+app.config["STORAGE"] = os.environ.get("GUDLFT_STORAGE", "memory")
+app.config["SQLITE_PATH"] = os.environ.get("GUDLFT_SQLITE_PATH", "gudlft.db")
+
+# number of clubs / competitions displayed per page (and maximum top clubs)
+app.config["PAGE_SIZE"] = int(os.environ.get("GUDLFT_PAGE_SIZE", 20))
+app.config["TOP_MAX"] = int(os.environ.get("GUDLFT_TOP_MAX", 100))
+
+# maximum number of bookings in a single batch purchase (/api/purchases)
+app.config["MAX_BATCH"] = int(os.environ.get("GUDLFT_MAX_BATCH", 100))
+
+# in memory, bookings are lost on restart unless a journal file is provided
+app.config["BOOKING_JOURNAL"] = os.environ.get("GUDLFT_BOOKING_JOURNAL")
+
+# with a journal, a snapshot can be written every SNAPSHOT_INTERVAL seconds
+# (or every SNAPSHOT_MAX_RECORDS bookings) so that only its tail is replayed
+app.config["BOOKING_SNAPSHOT"] = os.environ.get("GUDLFT_BOOKING_SNAPSHOT")
+app.config["SNAPSHOT_INTERVAL"] = float(os.environ.get("GUDLFT_SNAPSHOT_INTERVAL", 300))
+app.config["SNAPSHOT_MAX_RECORDS"] = int(
+    os.environ.get("GUDLFT_SNAPSHOT_MAX_RECORDS", 10000)
+)
 
-# ----- HELPER FUNCTIONS -----
 
+# ----- DATA HANDLING -----
 
-def formatDate(date_str):
-    """ Return a datetime object from a Y-M-d H:M:S date string """
-    return datetime.datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
+# -- load jsons
 
+# (the files are streamed item by item, so that the whole document is never
+# held in memory, and the records are validated as they are loaded)
 
-# ----- DATA HANDLING -----
 
-COST_PER_PLACE = 3
-MAX_PLACES_PER_CLUB = 12
+def loadData(path, key, build, progress=None):
+    """Return the records of a data file (see loadRecords)
 
-# -- load jsons
+    The data files of the configuration are read from their precompiled
+    version when PRECOMPILED is set, the other files (snapshots) are parsed.
+    """
+    if path is None:
+        path = app.config[f"{key.upper()}_FILE"]
+        if app.config["PRECOMPILED"]:
+            return loadPrecompiled(path, key, build, progress)
+    return list(loadRecords(path, key, build, progress))
+
+
+def loadClubs(path=None, progress=None):
+    return loadData(path, "clubs", Club.fromJson, progress)
+
+
+def loadCompetitions(path=None, progress=None):
+    return loadData(path, "competitions", Competition.fromJson, progress)
+
+
+def restoreSnapshot(path):
+    """Replace the clubs, competitions and bookings with those of a snapshot,
+    merge the changes made to the data files since it was taken, and return
+    the last journal sequence number it covers.
+
+    Parameters
+    ----------
+    path : str
+        The path of a snapshot written by the Snapshotter
+    """
+
+    repository.load(loadClubs(path), loadCompetitions(path), readValue(path, "booking"))
+
+    # (the changes of the data files are counted from their version at the time
+    # of the snapshot, or from their current one for a snapshot without it)
+    try:
+        repository.sources = readValue(path, "sources")
+    except KeyError:
+        repository.track(loadClubs(), loadCompetitions())
+    repository.merge(loadClubs(), loadCompetitions())
+
+    return readValue(path, "seq")
+
+
+def reloadData():
+    """Merge the current data files into the live data (see Repository.merge),
+    and give the places coming back to the clubs waiting for them
+    """
 
+    clubs, competitions = repository.merge(loadClubs(), loadCompetitions())
+    logger.info("data files reloaded: %d clubs, %d competitions", clubs, competitions)
 
-def loadClubs():
-    with open("clubs.json") as c:
-        listOfClubs = json.load(c)["clubs"]
-        return listOfClubs
+    if app.config["FLASH_SALE"]:
+        booked, dropped = repository.serveWaitlists()
+        waitlist_total.inc("booked", amount=len(booked))
+        waitlist_total.inc("dropped", amount=len(dropped))
+        if booked or dropped:
+            logger.info(
+                "waitlists: %d requests booked, %d dropped", len(booked), len(dropped)
+            )
+
+
+# -- define globals
 
+# (the repository is created empty, and filled by startData)
 
-def loadCompetitions():
-    with open("competitions.json") as comps:
-        listOfCompetitions = json.load(comps)["competitions"]
-        return listOfCompetitions
+snapshotter = None
+watcher = None
 
+if app.config["STORAGE"] == "sqlite":
+    repository = SqliteRepository(app.config["SQLITE_PATH"])
+else:
+    repository = MemoryRepository()
+
+
+def startData():
+    """Load the data into the repository (and replay the journal), then start
+    the background threads
+    """
+
+    global snapshotter, watcher
+
+    if app.config["STORAGE"] == "sqlite":
+        repository.seed(loadClubs(), loadCompetitions())
+
+    elif app.config["BOOKING_JOURNAL"]:
+        snapshot_seq = 0
+        if app.config["BOOKING_SNAPSHOT"] and os.path.exists(
+            app.config["BOOKING_SNAPSHOT"]
+        ):
+            snapshot_seq = restoreSnapshot(app.config["BOOKING_SNAPSHOT"])
+        else:
+            repository.load(loadClubs(), loadCompetitions())
+
+        repository.journal = BookingJournal(app.config["BOOKING_JOURNAL"], snapshot_seq)
+        repository.replay(repository.journal, snapshot_seq)
+
+        if app.config["BOOKING_SNAPSHOT"]:
+            snapshotter = Snapshotter(
+                repository.journal,
+                app.config["BOOKING_SNAPSHOT"],
+                repository.capture,
+                interval=app.config["SNAPSHOT_INTERVAL"],
+                max_records=app.config["SNAPSHOT_MAX_RECORDS"],
+            )
+            snapshotter.start()
 
-# -- save bookings in dict
+    else:
+        repository.load(loadClubs(), loadCompetitions())
 
+    if app.config["RELOAD_INTERVAL"] > 0:
+        watcher = FileWatcher(
+            [app.config["CLUBS_FILE"], app.config["COMPETITIONS_FILE"]],
+            reloadData,
+            interval=app.config["RELOAD_INTERVAL"],
+        )
+        watcher.start()
 
-def addBooking(club, competition, places):
-    """Save club's booking to competitions in a dictionnay
+
+# -- lazy loading
+
+data_ready = threading.Event()
+_data_lock = threading.Lock()
+
+
+def ensureData():
+    """Start the data (see startData) and load the templates, unless it's
+    already done (only once)
+    """
+
+    if data_ready.is_set():
+        return
+
+    with _data_lock:
+        if data_ready.is_set():
+            return
+        start = time.perf_counter()
+        startData()
+        startup_duration.set(time.perf_counter() - start, "data")
+
+        start = time.perf_counter()
+        loadTemplates()
+        startup_duration.set(time.perf_counter() - start, "templates")
+        data_ready.set()
+
+    logger.info(
+        "data loaded in %.3fs (%d clubs, %d competitions), templates in %.3fs",
+        startup_duration.get("data"),
+        repository.countClubs(),
+        repository.countCompetitions(),
+        startup_duration.get("templates"),
+    )
+
+
+@app.before_request
+def loadDataOnce():
+    ensureData()
+
+
+def createApp():
+    """Return the application, with its data loaded now, or on the first
+    request if LAZY_LOAD (GUDLFT_LAZY_LOAD=1, e.g. to load it in each worker
+    rather than before the fork)
+    """
+
+    if not app.config["LAZY_LOAD"]:
+        ensureData()
+    return app
+
+
+# ----- RENDERING -----
+
+
+class FragmentCache:
+    """Keep the last rendered version of some page fragments.
+
+    A fragment is rendered again only when the version it was rendered for
+    changes, otherwise the previous rendering is reused as is.
 
     Parameters
     ----------
-    club : str
-        The name of the club booking the places
-    competition : str
-        The name of the competition for which places are booked
-    places : int
-        The number of places to book
+    max_size : int
+        The maximum number of fragments kept, the oldest ones being dropped
+        first (optional)
     """
 
-    if club not in booking:
-        booking[club] = {}
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, version, render):
+        """Return the `name` fragment for the given data version
+
+        Parameters
+        ----------
+        name : str
+            The name of the fragment
+        version : hashable
+            The version of the data displayed in the fragment
+        render : callable
+            Return the fragment for the current data (on cache miss)
+        """
+
+        entry = self.entries.get(name)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
 
-    if competition not in booking[club]:
-        booking[club][competition] = 0
+        self.misses += 1
+        fragment = render()
+        self.entries.pop(name, None)
+        self.entries[name] = (version, fragment)
 
-    booking[club][competition] += places
+        if self.max_size is not None and len(self.entries) > self.max_size:
+            self.entries.pop(next(iter(self.entries)), None)
 
+        return fragment
 
-def getBooking(club, competition):
-    """Return the current club's booking number for a given competition
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
+
+
+fragments = FragmentCache()
+
+
+def pointsBoard(page=1, top=None):
+    """Return the clubs' points board (points_board.html) as a safe html string
+
+    The board either displays a page of clubs, or the `top` clubs with the
+    most points. The first page and the top views are only rendered again
+    once the clubs or their points change.
 
     Parameters
     ----------
-    club : str
-        The name of the club
-    competition : str
-        The name of the competition
+    page : int
+        The page of clubs to display (starting at 1)
+    top : int
+        The number of clubs to display by decreasing points (optional)
     """
 
-    if club not in booking:
-        return 0
-    if competition not in booking[club]:
-        return 0
+    # (the version must be read before the clubs it describes)
+    version = repository.clubsVersion()
+    size = app.config["PAGE_SIZE"]
 
-    return booking[club][competition]
+    def render():
+        next_page = None
+        if top is not None:
+            clubs = repository.topClubs(top)
+        else:
+            clubs = repository.windowClubs((page - 1) * size, size + 1)
+            if len(clubs) > size:
+                clubs, next_page = clubs[:size], page + 1
 
+        return Markup(
+            render_template(
+                "points_board.html", clubs=clubs, next_page=next_page, top=top
+            )
+        )
 
-# -- define globals
+    if top is None and page != 1:
+        return render()
+
+    return fragments.get(f"points_board:{size}:{page}:{top}", version, render)
+
+
+# -- conditional requests
+
+
+def templatesFingerprint():
+    """ Return a digest of the templates, so that ETags change with them """
+
+    digest = hashlib.sha1()
+    folder = os.path.join(app.root_path, app.template_folder)
+    for name in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, name), "rb") as f:
+            digest.update(name.encode())
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+TEMPLATES_FINGERPRINT = templatesFingerprint()
+
+
+def makeETag(*parts):
+    """Return a strong ETag (unquoted) for a page built from the given parts
+
+    Parameters
+    ----------
+    parts : str, int or tuple
+        Everything the page depends on: the page name, the data versions
+        (see Repository.clubsVersion, ...), and any value displayed as is
+    """
+    key = repr((TEMPLATES_FINGERPRINT, repository.epoch) + parts)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def conditionalResponse(render, status_code=200, etag=None):
+    """Return the rendered page, or an empty 304 response if the client
+    already has the version identified by the ETag (If-None-Match).
+
+    Pages with an error status code or with messages (flash) don't get any
+    ETag, since they depend on more than the data.
+
+    The compressed pages are kept (see `compressed`), so that they are
+    neither rendered nor compressed again as long as their ETag is the same.
+
+    Parameters
+    ----------
+    render : callable
+        Return the html of the page (only called if needed)
+    status_code : int
+        The HTTP status_code to return with the body html
+    etag : str
+        The ETag of the page (see makeETag)
+    """
+
+    if status_code != 200 or etag is None or session.get("_flashes"):
+        return render(), status_code
+
+    encoding = acceptedEncoding()
+    if encoding is not None:
+        etag = f"{etag}-{encoding}"
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    elif encoding is not None:
+        response = encodedResponse(
+            compressed.get(etag, None, lambda: encodeBody(render().encode(), encoding)),
+            mimetype="text/html",
+        )
+    else:
+        response = make_response(render())
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+# -- JSON API
+
+# the fields a client may select (?fields=name,date) for each kind of item
+API_FIELDS = {
+    "competitions": ("name", "date", "numberOfPlaces"),
+    "clubs": ("name", "points"),
+    "bookings": ("competition", "date", "places"),
+    "bookers": ("club", "places"),
+}
+
+payloads = FragmentCache(max_size=1024)
+
+
+def apiFields(kind):
+    """Return the fields selected by the `fields` GET parameter (all by default),
+    or raise a ValueError if some of them are unknown
+
+    Parameters
+    ----------
+    kind : str
+        The kind of the returned items (a key of API_FIELDS)
+    """
+
+    fields = request.args.get("fields")
+    if not fields:
+        return API_FIELDS[kind]
+
+    fields = tuple(dict.fromkeys(field.strip() for field in fields.split(",")))
+    unknown = [field for field in fields if field not in API_FIELDS[kind]]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def apiPage(items, page, size, fields):
+    """Return the payload of a page of items (one more item than the page size
+    tells whether there is a next page)
+
+    Parameters
+    ----------
+    items : list
+        The items of the page, as dicts, plus at most one item
+    page : int
+        The number of the page (starting at 1)
+    size : int
+        The number of items per page
+    fields : tuple
+        The fields to keep in each item
+    """
+    return {
+        "items": [{field: item[field] for field in fields} for item in items[:size]],
+        "page": page,
+        "next_page": page + 1 if len(items) > size else None,
+    }
+
+
+def apiResponse(name, version, build):
+    """Return a JSON response, or an empty 304 response if the client already
+    has the version identified by the ETag (If-None-Match).
+
+    The body is serialized (and compressed) once per data version and then
+    served as is.
+
+    Parameters
+    ----------
+    name : tuple
+        Identify the payload (the endpoint and its parameters)
+    version : hashable
+        The version of the data the payload is built from
+    build : callable
+        Return the JSON serializable payload (on cache miss)
+    """
+
+    etag = makeETag("api", name, version)
+    encoding = acceptedEncoding()
+    if encoding is not None:
+        etag = f"{etag}-{encoding}"
+
+    def serialize():
+        return payloads.get(
+            name,
+            version,
+            lambda: json.dumps(build(), separators=(",", ":")).encode(),
+        )
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    elif encoding is not None:
+        response = encodedResponse(
+            compressed.get(etag, None, lambda: encodeBody(serialize(), encoding)),
+            mimetype="application/json",
+        )
+    else:
+        response = app.response_class(serialize(), mimetype="application/json")
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def apiError(message, status_code):
+    return jsonify({"error": message}), status_code
+
+
+# -- compression
+
+COMPRESSED_MIMETYPES = ("text/html", "application/json")
+
+# the compressed bodies of the pages with an ETag, by ETag
+compressed = FragmentCache(max_size=256)
+
+
+def acceptedEncoding():
+    """ Return the content coding negotiated with the client (None for identity) """
+    return negotiate(request.accept_encodings) if app.config["COMPRESS"] else None
+
+
+def encodeBody(body, encoding):
+    """Return the body compressed with the given content coding, along with the
+    coding (the body is returned as is, with None, if it's too small)
+
+    Parameters
+    ----------
+    body : bytes
+        The body of a response
+    encoding : str
+        The content coding ("gzip" or "br")
+    """
+
+    if len(body) < app.config["COMPRESS_MIN_SIZE"]:
+        return body, None
+    level = app.config["BROTLI_QUALITY" if encoding == "br" else "GZIP_LEVEL"]
+    return compress(body, encoding, level), encoding
+
+
+def encodedResponse(encoded, **kwargs):
+    """Return a response with a body returned by encodeBody
+
+    Parameters
+    ----------
+    encoded : tuple
+        The body, and its content coding (or None)
+    kwargs :
+        The other arguments of the response (e.g. mimetype)
+    """
+
+    body, encoding = encoded
+    response = app.response_class(body, **kwargs)
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+@app.after_request
+def compressResponse(response):
+    """ Compress the other HTML and JSON responses, for the clients accepting it """
+
+    if response.mimetype not in COMPRESSED_MIMETYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+
+    encoding = acceptedEncoding()
+    if (
+        encoding is None
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.status_code in (204, 206, 304)
+    ):
+        return response
+
+    body, encoding = encodeBody(response.get_data(), encoding)
+    if encoding is not None:
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+# ----- INSTRUMENTATION -----
+
+# (exposed at /metrics in the Prometheus text format)
+
+metrics = Registry()
+
+request_duration = metrics.register(
+    Histogram(
+        "gudlft_request_duration_seconds",
+        "Time spent handling the requests, by route",
+        ("endpoint",),
+    )
+)
+requests_total = metrics.register(
+    Counter(
+        "gudlft_requests_total",
+        "Number of responses, by route and status code",
+        ("endpoint", "status"),
+    )
+)
+bookings_total = metrics.register(
+    Counter(
+        "gudlft_bookings_total",
+        "Number of booking attempts, by route and outcome (success or error type)",
+        ("endpoint", "outcome"),
+    )
+)
+render_duration = metrics.register(
+    Histogram(
+        "gudlft_render_duration_seconds",
+        "Time spent rendering the templates, by template",
+        ("template",),
+    )
+)
+data_duration = metrics.register(
+    Histogram(
+        "gudlft_data_duration_seconds",
+        "Time spent in the data access (repository) methods, by method",
+        ("method",),
+    )
+)
+startup_duration = metrics.register(
+    Gauge(
+        "gudlft_startup_seconds",
+        "Time spent starting, by phase (import of the app, load of the data and"
+        " of the templates)",
+        ("phase",),
+    )
+)
+template_load_duration = metrics.register(
+    Histogram(
+        "gudlft_template_load_seconds",
+        "Time spent loading the templates, by template and source (compiled from"
+        " the source, or read from the bytecode cache)",
+        ("template", "source"),
+    )
+)
+
+
+class TimedTemplate(Template):
+    """ A template whose renderings are observed in render_duration """
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            render_duration.observe(time.perf_counter() - start, self.name)
+
+
+class TimedEnvironment(Environment):
+    """ A Jinja environment timing its compilations in template_load_duration """
+
+    template_class = TimedTemplate
+
+    def compile(self, source, name=None, filename=None, raw=False, defer_init=False):
+        start = time.perf_counter()
+        try:
+            return super().compile(source, name, filename, raw, defer_init)
+        finally:
+            template_load_duration.observe(
+                time.perf_counter() - start, name or "<string>", "source"
+            )
+
+
+class TimedBytecodeCache(FileSystemBytecodeCache):
+    """A bytecode cache whose hits are observed in template_load_duration, and
+    which is only read if its directory can't be written (e.g. an install
+    made read-only once the templates were compiled)
+    """
+
+    def get_bucket(self, environment, name, filename, source):
+        start = time.perf_counter()
+        bucket = super().get_bucket(environment, name, filename, source)
+        if bucket.code is not None:
+            template_load_duration.observe(
+                time.perf_counter() - start, name, "bytecode"
+            )
+        return bucket
+
+    def dump_bytecode(self, bucket):
+        try:
+            super().dump_bytecode(bucket)
+        except OSError as error:
+            logger.warning("%s: template not cached (%r)", bucket.key, error)
+
+
+def templateCache(directory):
+    """Return the bytecode cache of a directory, created if needed, or None
+    (with a warning) if it can't be, e.g. in a read-only install
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the compiled templates
+    """
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as error:
+        logger.warning("%s: no template cache (%r)", directory, error)
+        return None
+    return TimedBytecodeCache(directory)
+
+
+# (set before the environment is created, on its first use)
+app.jinja_environment = TimedEnvironment
+
+if app.config["TEMPLATE_CACHE"]:
+    app.jinja_env.bytecode_cache = templateCache(app.config["TEMPLATE_CACHE"])
+
+
+def loadTemplates():
+    """Load all the templates (compiled, or read from the bytecode cache), so
+    that no request has to, and return their names
+    """
 
-competitions = loadCompetitions()
-clubs = loadClubs()
-booking = {}
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
 
 
-# ----- EXCEPTIONS -----
+@app.cli.command("compile-templates")
+def compileTemplates():
+    """ Compile the templates into the bytecode cache (TEMPLATE_CACHE) """
 
+    if app.jinja_env.bytecode_cache is None:
+        click.echo("no template cache (see GUDLFT_TEMPLATE_CACHE)")
+        return
+    names = loadTemplates()
+    click.echo(f"{len(names)} templates compiled into {app.config['TEMPLATE_CACHE']}")
 
-class PointValueError(Exception):
-    """ Returned when there is a problem with the clubs' points """
 
-    pass
+instrument(
+    repository,
+    [
+        name
+        for name, attribute in vars(Repository).items()
+        if callable(attribute) and not name.startswith("_")
+    ],
+    data_duration,
+)
 
 
-class PlaceValueError(Exception):
-    """ Returned when there is a problem with the competitions' places """
+@app.before_request
+def startTimer():
+    g.start = time.perf_counter()
 
-    pass
 
+@app.after_request
+def observeRequest(response):
+    endpoint = request.endpoint or "unknown"
+    request_duration.observe(time.perf_counter() - g.start, endpoint)
+    requests_total.inc(endpoint, response.status_code)
 
-class EventDateError(Exception):
-    """ Returned when there is an error with competition dates """
+    # (so that clients, e.g. load tests, can tell refused bookings apart)
+    if "booking_outcome" in g:
+        response.headers["X-Booking-Outcome"] = g.booking_outcome
+    return response
 
-    pass
+
+# -- profiling
+
+# (the hooks are only installed when profiling is enabled, so that it costs
+# nothing otherwise)
+
+profiler = None
+
+
+def enableProfiling():
+    """ Profile a sample of the requests (see RequestProfiler) """
+
+    global profiler
+
+    profiler = RequestProfiler(
+        app.config["PROFILE_DIR"],
+        rate=app.config["PROFILE_RATE"],
+        token=app.config["PROFILE_TOKEN"],
+        keep=app.config["PROFILE_KEEP"],
+    )
+
+    @app.before_request
+    def startProfile():
+        if profiler.wants(request.headers):
+            g.profile = profiler.start()
+
+    @app.teardown_request
+    def stopProfile(error=None):
+        profile = g.pop("profile", None)
+        if profile is not None:
+            profiler.stop(profile, request.endpoint or "unknown")
+
+
+if app.config["PROFILE_DIR"]:
+    enableProfiling()
+
+
+# -- admission control
+
+# (the club is read from the url or the form, before anything else is done)
+ADMITTED_ENDPOINTS = ("book", "purchasePlaces")
+
+shed_total = metrics.register(
+    Counter(
+        "gudlft_shed_total",
+        "Number of requests refused by the admission control, by route and scope"
+        " (global or club)",
+        ("endpoint", "scope"),
+    )
+)
+
+admission = Admission(
+    app.config["ADMISSION_RATE"],
+    app.config["ADMISSION_BURST"],
+    app.config["CLUB_RATE"],
+    app.config["CLUB_BURST"],
+)
+
+
+@app.before_request
+def admitBooking():
+    """ Refuse the booking requests beyond the rate limits, with a tiny 429 """
+
+    if request.endpoint not in ADMITTED_ENDPOINTS or not admission.enabled:
+        return None
+
+    club = (request.view_args or {}).get("club") or request.form.get("club", "")
+    scope, wait = admission.admit(club)
+    if scope is None:
+        return None
+
+    shed_total.inc(request.endpoint, scope)
+    response = app.response_class(
+        "Too many requests", status=429, mimetype="text/plain"
+    )
+    response.headers["Retry-After"] = str(max(1, math.ceil(wait)))
+    return response
+
+
+# -- flash sales
+
+waitlist_total = metrics.register(
+    Counter(
+        "gudlft_waitlist_total",
+        "Number of requests for places joining the waitlists, then booked or"
+        " dropped (refused by the rules) once places came back",
+        ("event",),
+    )
+)
+
+
+def soldOutResponse(club, competition, places=None):
+    """Return a tiny response for a sold out competition (in flash sale mode),
+    or None to go on as usual
+
+    A request for places joins the waitlist of the competition (202, with its
+    position), unless it couldn't be booked anyway (409, as the other
+    requests). An unknown club goes on as usual (404).
+
+    Parameters
+    ----------
+    club : str
+        The name of the club
+    competition : str
+        The name of the competition
+    places : str
+        The number of places requested (None for the booking page)
+    """
+
+    if not app.config["FLASH_SALE"] or not repository.isSoldOut(competition):
+        return None
+
+    foundCompetition = repository.findCompetition(competition)
+    if foundCompetition.date <= datetime.datetime.now():
+        return None
+
+    foundClub = repository.findClub(club)
+    if foundClub is None:
+        return None
+
+    try:
+        places = int(places)
+    except (TypeError, ValueError):
+        places = 0
+
+    if not 0 < places <= MAX_PLACES_PER_CLUB:
+        countBooking("SoldOut")
+        return app.response_class("Sold out", status=409, mimetype="text/plain")
+
+    position = repository.joinWaitlist(foundClub, foundCompetition, places)
+    waitlist_total.inc("joined")
+    countBooking("Waitlisted")
+    return app.response_class(
+        f"Sold out: {foundClub.name} is number {position} on the waitlist",
+        status=202,
+        mimetype="text/plain",
+    )
+
+
+def countBooking(outcome):
+    """Count a booking attempt of the current route
+
+    Parameters
+    ----------
+    outcome : str or Exception
+        "success", or the exception explaining why the booking was refused
+    """
+    if isinstance(outcome, Exception):
+        outcome = type(outcome).__name__
+    bookings_total.inc(request.endpoint, outcome)
+    g.booking_outcome = outcome
 
 
 # ----- ROUTES -----
@@ -118,7 +992,10 @@ class EventDateError(Exception):
 def index():
     """This route displays the landing page with the authentificatio form """
 
-    return render_template("index.html", clubs=clubs)
+    return conditionalResponse(
+        lambda: render_template("index.html", points_board=pointsBoard()),
+        etag=makeETag("index", repository.clubsVersion()),
+    )
 
 
 @app.route("/showSummary", methods=["POST"])
@@ -130,12 +1007,12 @@ def showSummary():
     email : str
         The email to search in the club 'DB'
     """
-    try:
-        club = [club for club in clubs if club["email"] == request.form["email"]][0]
-        return showSummaryDisplay(club)
-    except IndexError:
+    club = repository.findClubByEmail(request.form["email"])
+    if club is None:
         flash("The provided email is invalid")
-        return render_template("index.html", clubs=clubs), 404
+        return render_template("index.html", points_board=pointsBoard()), 404
+
+    return showSummaryDisplay(club)
 
 
 def showSummaryDisplay(club, status_code=200):
@@ -146,13 +1023,14 @@ def showSummaryDisplay(club, status_code=200):
         ( book/<compet>/<club> with HTTP 200 / 400 / 404 )
         ( purchasePlaces with HTTP 200 / 400 / 404 )
 
-        This function will collect past & incoming competion informations along
-        with the current club informations and all the other clubs.
+        This function will collect the first incoming competions informations
+        along with the current club informations and the points board (the
+        past competitions and the other pages are served by showCompetitions).
 
 
     Parameters
     ----------
-    club : dict
+    club : Club
         The currently 'authentified' club
     status_code : int
         The HTTP status_code to return with the body html
@@ -160,24 +1038,31 @@ def showSummaryDisplay(club, status_code=200):
 
     now = datetime.datetime.now()
 
-    past_competitions = [
-        compet for compet in competitions if formatDate(compet["date"]) <= now
-    ]
-
-    next_competitions = [
-        compet for compet in competitions if formatDate(compet["date"]) > now
-    ]
-
-    return (
-        render_template(
+    etag = None
+    if status_code == 200:
+        etag = makeETag(
+            "summary",
+            club.name,
+            club.email,
+            club.points,
+            repository.clubsVersion(),
+            repository.competitionsVersion(),
+            repository.countPastCompetitions(now),
+        )
+
+    def render():
+        size = app.config["PAGE_SIZE"]
+        next_competitions = repository.windowCompetitions(now, False, 0, size + 1)
+
+        return render_template(
             "welcome.html",
             club=club,
-            past_competitions=past_competitions,
-            next_competitions=next_competitions,
-            clubs=clubs,
-        ),
-        status_code,
-    )
+            next_competitions=next_competitions[:size],
+            more_competitions=len(next_competitions) > size,
+            points_board=pointsBoard(),
+        )
+
+    return conditionalResponse(render, status_code, etag)
 
 
 @app.route("/book/<competition>/<club>")
@@ -195,45 +1080,59 @@ def book(competition, club):
         The name of the competition to display
     """
 
+    # Is the competition sold out ? (in flash sale mode)
+    response = soldOutResponse(club, competition)
+    if response is not None:
+        return response
+
     # Is the provided club valid ?
-    try:
-        foundClub = [c for c in clubs if c["name"] == club][0]
-    except IndexError:
+    foundClub = repository.findClub(club)
+    if foundClub is None:
         flash("The provided club is invalid")
-        return render_template("index.html", clubs=clubs), 404
+        return render_template("index.html", points_board=pointsBoard()), 404
 
     # Is the provided competition valid ?
+    foundCompetition = repository.findCompetition(competition)
+    if foundCompetition is None:
+        flash("The provided competition is invalid")
+        return showSummaryDisplay(foundClub, 404)
+
     # Is the competition date valid ?
     try:
-        foundCompetition = [c for c in competitions if c["name"] == competition][0]
-
         now = datetime.datetime.now()
 
-        if formatDate(foundCompetition["date"]) > now:
+        if foundCompetition.date > now:
+
+            booked = repository.getBooking(foundClub.name, foundCompetition.name)
 
-            booked = getBooking(foundClub["name"], foundCompetition["name"])
+            # (the page only displays these values)
+            etag = makeETag(
+                "book",
+                foundClub.name,
+                foundClub.points,
+                foundCompetition.name,
+                foundCompetition.numberOfPlaces,
+                booked,
+            )
 
-            return (
-                render_template(
+            return conditionalResponse(
+                lambda: render_template(
                     "booking.html",
                     club=foundClub,
                     competition=foundCompetition,
                     booked=booked,
                     maxplaces=min(
-                        int(foundClub["points"]) // COST_PER_PLACE,
+                        foundClub.points // COST_PER_PLACE,
                         MAX_PLACES_PER_CLUB - booked,
                     ),
                 ),
-                200,
+                etag=etag,
             )
         else:
             raise EventDateError("The booking page for a past competition is closed")
 
-    except IndexError:
-        flash("The provided competition is invalid")
-        status_code = 404
-
     except EventDateError as error_msg:
+        countBooking(error_msg)
         flash(error_msg)
         status_code = 400
 
@@ -258,71 +1157,475 @@ def purchasePlaces():
         if all the validation steps are validated.
     """
 
+    # Is the competition sold out ? (in flash sale mode, the request waits)
+    response = soldOutResponse(
+        request.form["club"], request.form["competition"], request.form.get("places")
+    )
+    if response is not None:
+        return response
+
     # Is the provided club valid ?
-    try:
-        club = [c for c in clubs if c["name"] == request.form["club"]][0]
-    except IndexError:
+    club = repository.findClub(request.form["club"])
+    if club is None:
         flash("The provided club is invalid")
-        return render_template("index.html", clubs=clubs), 404
+        return render_template("index.html", points_board=pointsBoard()), 404
 
     # Is the provided competition valid ?
-    # Also check the various possible input errors
-    try:
-        competition = [
-            c for c in competitions if c["name"] == request.form["competition"]
-        ][0]
+    competition = repository.findCompetition(request.form["competition"])
+    if competition is None:
+        flash("The provided competition is invalid")
+        return showSummaryDisplay(club, 404)
 
+    # Check the various possible input errors
+    try:
         placesRequired = int(request.form["places"])
-        club_points = int(club["points"])
-        competition_places = int(competition["numberOfPlaces"])
 
-        if placesRequired < 1:
+        repository.purchase(club, competition, placesRequired)
 
-            raise PointValueError("Something went wrong-please try again")
+        countBooking("success")
+        flash("Great-booking complete!")
+        status_code = 200
 
-        elif club_points < placesRequired * COST_PER_PLACE:
+    except (PointValueError, PlaceValueError) as error_msg:
+        countBooking(error_msg)
+        flash(error_msg)
+        status_code = 400
 
-            raise PointValueError("You don't have enough points available")
+    return showSummaryDisplay(club, status_code)
+    # return redirect(url_for("showSummary"), status_code)
 
-        elif competition_places < placesRequired:
 
-            raise PlaceValueError("You can't book more places than available")
+@app.route("/logout")
+def logout():
+    """This route redirect to the landing page
 
-        elif (
-            placesRequired + getBooking(club["name"], competition["name"])
-            > MAX_PLACES_PER_CLUB
-        ):
+    # NOTE : this page should actually logout users...
+    """
+    return redirect(url_for("index"))
+
+
+@app.route("/competitions/<club>/<when>")
+def showCompetitions(club, when):
+    """This route displays a page of the next or past competitions.
+
+    Parameters
+    ----------
+    club : str
+        The name of the currently 'authentified' club
+    when : str
+        Either "next" or "past"
+
+    GET Parameters
+    ----------
+    page : int
+        The page to display (starting at 1)
+    """
+
+    foundClub = repository.findClub(club)
+    if foundClub is None or when not in ("next", "past"):
+        flash("The provided club is invalid")
+        return render_template("index.html", points_board=pointsBoard()), 404
+
+    now = datetime.datetime.now()
+    page = max(request.args.get("page", 1, type=int), 1)
+    size = app.config["PAGE_SIZE"]
+    past = when == "past"
+
+    def render():
+        competitions = repository.windowCompetitions(
+            now, past, (page - 1) * size, size + 1
+        )
+        return render_template(
+            "competitions.html",
+            club=foundClub,
+            competitions=competitions[:size],
+            past=past,
+            when=when,
+            page=page,
+            next_page=page + 1 if len(competitions) > size else None,
+        )
+
+    return conditionalResponse(
+        render,
+        etag=makeETag(
+            "competitions",
+            foundClub.name,
+            when,
+            size,
+            page,
+            repository.competitionsVersion(),
+            repository.countPastCompetitions(now),
+        ),
+    )
+
+
+@app.route("/pointsBoard")
+def showPointsBoard():
+    """This route displays a page of the clubs' points board, or the top clubs.
+
+    GET Parameters
+    ----------
+    page : int
+        The page to display (starting at 1)
+    top : int
+        The number of clubs to display by decreasing points (up to TOP_MAX)
+    """
+
+    page = max(request.args.get("page", 1, type=int), 1)
+    top = request.args.get("top", type=int)
+    if top is not None:
+        top = min(max(top, 1), app.config["TOP_MAX"])
+
+    return conditionalResponse(
+        lambda: render_template("board.html", points_board=pointsBoard(page, top)),
+        etag=makeETag(
+            "board", app.config["PAGE_SIZE"], page, top, repository.clubsVersion()
+        ),
+    )
+
+
+# -- JSON API
+
+
+@app.route("/api/competitions")
+def apiCompetitions():
+    """This route returns a page of the next or past competitions as JSON.
+
+    GET Parameters
+    ----------
+    when : str
+        Either "next" (default) or "past"
+    page : int
+        The page to return (starting at 1)
+    fields : str
+        The comma separated fields to return (name, date, numberOfPlaces)
+    """
+
+    when = request.args.get("when", "next")
+    if when not in ("next", "past"):
+        return apiError("The when parameter must be next or past", 400)
+    try:
+        fields = apiFields("competitions")
+    except ValueError as error_msg:
+        return apiError(str(error_msg), 400)
+
+    now = datetime.datetime.now()
+    page = max(request.args.get("page", 1, type=int), 1)
+    size = app.config["PAGE_SIZE"]
+
+    def build():
+        competitions = repository.windowCompetitions(
+            now, when == "past", (page - 1) * size, size + 1
+        )
+        items = [
+            {
+                "name": competition.name,
+                "date": competition.date.strftime("%Y-%m-%d %H:%M:%S"),
+                "numberOfPlaces": competition.numberOfPlaces,
+            }
+            for competition in competitions
+        ]
+        return apiPage(items, page, size, fields)
+
+    return apiResponse(
+        ("competitions", when, page, size, fields),
+        (repository.competitionsVersion(), repository.countPastCompetitions(now)),
+        build,
+    )
 
-            raise PlaceValueError(
-                f"You can't book more than {MAX_PLACES_PER_CLUB} places per competition"
-            )
 
+@app.route("/api/clubs")
+def apiClubs():
+    """This route returns a page of the clubs' points board (or the top clubs)
+    as JSON.
+
+    GET Parameters
+    ----------
+    page : int
+        The page to return (starting at 1)
+    top : int
+        The number of clubs to return by decreasing points (up to TOP_MAX)
+    fields : str
+        The comma separated fields to return (name, points)
+    """
+
+    try:
+        fields = apiFields("clubs")
+    except ValueError as error_msg:
+        return apiError(str(error_msg), 400)
+
+    page = max(request.args.get("page", 1, type=int), 1)
+    top = request.args.get("top", type=int)
+    if top is not None:
+        top = min(max(top, 1), app.config["TOP_MAX"])
+        page = 1
+    size = app.config["PAGE_SIZE"] if top is None else top
+
+    def build():
+        if top is None:
+            clubs = repository.windowClubs((page - 1) * size, size + 1)
         else:
+            clubs = repository.topClubs(top)
+        items = [{"name": club.name, "points": club.points} for club in clubs]
+        return apiPage(items, page, size, fields)
 
-            club["points"] = club_points - (placesRequired * COST_PER_PLACE)
-            competition["numberOfPlaces"] = competition_places - placesRequired
+    return apiResponse(
+        ("clubs", page, size, top, fields), repository.clubsVersion(), build
+    )
 
-            addBooking(club["name"], competition["name"], placesRequired)
 
-            flash("Great-booking complete!")
-            status_code = 200
+@app.route("/api/clubs/<club>/bookings")
+def apiBookings(club):
+    """This route returns a page of the competitions booked by a club (by date)
+    as JSON, along with the total number of places it booked.
 
-    except IndexError:
-        flash("The provided competition is invalid")
-        status_code = 404
+    Parameters
+    ----------
+    club : str
+        The name of the club
 
-    except (PointValueError, PlaceValueError) as error_msg:
-        flash(error_msg)
-        status_code = 400
+    GET Parameters
+    ----------
+    page : int
+        The page to return (starting at 1)
+    fields : str
+        The comma separated fields to return (competition, date, places)
+    """
 
-    return showSummaryDisplay(club, status_code)
-    # return redirect(url_for("showSummary"), status_code)
+    foundClub = repository.findClub(club)
+    if foundClub is None:
+        return apiError("The provided club is invalid", 404)
+    try:
+        fields = apiFields("bookings")
+    except ValueError as error_msg:
+        return apiError(str(error_msg), 400)
+
+    page = max(request.args.get("page", 1, type=int), 1)
+    size = app.config["PAGE_SIZE"]
+
+    def build():
+        items = []
+        for name, places in repository.getClubBookings(foundClub.name).items():
+            competition = repository.findCompetition(name)
+            if competition is not None:
+                items.append(
+                    {
+                        "competition": competition.name,
+                        "date": competition.date.strftime("%Y-%m-%d %H:%M:%S"),
+                        "places": places,
+                    }
+                )
+        items.sort(key=lambda item: item["date"])
+        return dict(
+            apiPage(items[(page - 1) * size :], page, size, fields),
+            total=repository.getClubTotal(foundClub.name),
+        )
+
+    # (the bookings only change along with the competitions' places)
+    return apiResponse(
+        ("bookings", foundClub.name, page, size, fields),
+        repository.competitionsVersion(),
+        build,
+    )
 
 
-@app.route("/logout")
-def logout():
-    """This route redirect to the landing page
+@app.route("/api/competitions/<competition>/bookings")
+def apiBookers(competition):
+    """This route returns a page of the clubs having booked places in a
+    competition as JSON, along with the total number of places booked.
 
-    # NOTE : this page should actually logout users...
+    Parameters
+    ----------
+    competition : str
+        The name of the competition
+
+    GET Parameters
+    ----------
+    page : int
+        The page to return (starting at 1)
+    fields : str
+        The comma separated fields to return (club, places)
     """
-    return redirect(url_for("index"))
+
+    foundCompetition = repository.findCompetition(competition)
+    if foundCompetition is None:
+        return apiError("The provided competition is invalid", 404)
+    try:
+        fields = apiFields("bookers")
+    except ValueError as error_msg:
+        return apiError(str(error_msg), 400)
+
+    page = max(request.args.get("page", 1, type=int), 1)
+    size = app.config["PAGE_SIZE"]
+
+    def build():
+        booked = repository.getCompetitionBookings(foundCompetition.name)
+        items = [{"club": club, "places": places} for club, places in booked.items()]
+        return dict(
+            apiPage(items[(page - 1) * size :], page, size, fields),
+            total=repository.getCompetitionTotal(foundCompetition.name),
+        )
+
+    return apiResponse(
+        ("bookers", foundCompetition.name, page, size, fields),
+        repository.competitionsVersion(),
+        build,
+    )
+
+
+@app.route("/api/purchases", methods=["POST"])
+def apiPurchases():
+    """This route books places in several competitions at once, all or nothing,
+    and returns the resulting counters as JSON.
+
+    JSON Parameters
+    ----------
+    club : str
+        The name of the club booking the places
+    bookings : list
+        The places to book, as {"competition": name, "places": number} items
+        (up to MAX_BATCH items)
+    """
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("bookings"), list):
+        return apiError("Something went wrong-please try again", 400)
+    if not 0 < len(data["bookings"]) <= app.config["MAX_BATCH"]:
+        return apiError(
+            f"A batch holds from 1 to {app.config['MAX_BATCH']} bookings", 400
+        )
+
+    # Is the provided club valid ?
+    if not isinstance(data.get("club"), str):
+        return apiError("Something went wrong-please try again", 400)
+    club = repository.findClub(data["club"])
+    if club is None:
+        return apiError("The provided club is invalid", 404)
+
+    # Are the provided competitions valid ? (the places must be integers, not
+    # floats or booleans)
+    orders = []
+    for item in data["bookings"]:
+        if (
+            not isinstance(item, dict)
+            or not isinstance(item.get("competition"), str)
+            or type(item.get("places")) is not int
+        ):
+            return apiError("Something went wrong-please try again", 400)
+        competition = repository.findCompetition(item["competition"])
+        if competition is None:
+            return apiError(
+                f"{item['competition']}: The provided competition is invalid", 404
+            )
+        orders.append((competition, item["places"]))
+
+    try:
+        # Are the competitions dates valid ?
+        now = datetime.datetime.now()
+        for competition, _ in orders:
+            if competition.date <= now:
+                raise EventDateError(
+                    f"{competition.name}: The booking page for a past competition"
+                    " is closed"
+                )
+
+        repository.purchaseMany(club, orders)
+    except (PointValueError, PlaceValueError, EventDateError) as error_msg:
+        countBooking(error_msg)
+        return apiError(str(error_msg), 400)
+    countBooking("success")
+
+    return jsonify(
+        {
+            "club": club.name,
+            "points": club.points,
+            "bookings": [
+                {
+                    "competition": competition.name,
+                    "places": placesRequired,
+                    "numberOfPlaces": competition.numberOfPlaces,
+                }
+                for competition, placesRequired in orders
+            ],
+        }
+    )
+
+
+# -- administration
+
+
+@app.route("/admin/reset", methods=["POST"])
+def adminReset():
+    """This route replaces the data with the data files, or with generated data.
+
+    It only exists when an ADMIN_TOKEN is configured, and only answers the
+    requests of the local host carrying this token (X-Admin-Token header).
+
+    JSON Parameters
+    ----------
+    clubs : int
+        The number of clubs to generate (0 to reload the data files)
+    competitions : int
+        The number of competitions to generate
+    seed : int
+        The seed of the generated data
+    """
+
+    token = app.config["ADMIN_TOKEN"]
+    if not token:
+        return apiError("Not found", 404)
+    if request.remote_addr not in ("127.0.0.1", "::1") or not hmac.compare_digest(
+        request.headers.get("X-Admin-Token", "").encode(), token.encode()
+    ):
+        return apiError("Forbidden", 403)
+    if getattr(repository, "journal", None) is not None:
+        return apiError("The data can't be reset while bookings are journaled", 409)
+
+    data = request.get_json(silent=True) or {}
+    try:
+        clubs = int(data.get("clubs", 0))
+        competitions = int(data.get("competitions", 0))
+        seed = int(data.get("seed", 0))
+    except (TypeError, ValueError):
+        return apiError("Something went wrong-please try again", 400)
+
+    if clubs > 0:
+        repository.load(
+            generateClubs(clubs, seed), generateCompetitions(competitions, seed)
+        )
+    else:
+        repository.load(loadClubs(), loadCompetitions())
+
+    return jsonify(
+        {
+            "clubs": repository.countClubs(),
+            "competitions": repository.countCompetitions(),
+        }
+    )
+
+
+@app.route("/metrics")
+def showMetrics():
+    """This route returns the instrumentation metrics (Prometheus text format) """
+
+    return app.response_class(
+        metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.route("/cacheStats")
+def cacheStats():
+    """This route returns the hits / misses counters of the fragments, API
+    payloads and compressed pages caches
+    """
+
+    return jsonify(
+        dict(fragments.stats(), api=payloads.stats(), compressed=compressed.stats())
+    )
+
+
+# ----- STARTUP -----
+
+startup_duration.set(time.perf_counter() - import_start, "app")
+
+createApp()
@@ -0,0 +1,74 @@
+# coding : utf-8
+
+from admission import Admission
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestAdmission:
+
+    # --- TESTS --- #
+
+    def test_happy_club_bucket(self):
+        """ Each club may burst, then is limited to its rate """
+
+        clock = Clock()
+        admission = Admission(club_rate=2, club_burst=3, clock=clock)
+
+        assert [admission.admit("A")[0] for _ in range(3)] == [None] * 3
+        assert admission.admit("A") == ("club", 0.5)
+        assert admission.admit("B") == (None, 0)
+
+        clock.now += 0.5
+        assert admission.admit("A") == (None, 0)
+        assert admission.admit("A")[0] == "club"
+
+    def test_happy_global_bucket(self):
+        """ All the clubs share the global rate """
+
+        clock = Clock()
+        admission = Admission(rate=10, burst=2, clock=clock)
+
+        assert admission.admit("A") == (None, 0)
+        assert admission.admit("B") == (None, 0)
+        assert admission.admit("C") == ("global", 0.1)
+
+        clock.now += 0.1
+        assert admission.admit("C") == (None, 0)
+
+    def test_happy_disabled(self):
+        """ Without any rate, everything is admitted """
+
+        admission = Admission()
+
+        assert not admission.enabled
+        assert all(admission.admit("A") == (None, 0) for _ in range(1000))
+
+    def test_sad_refused_requests_take_no_token(self):
+        """ A request refused by one bucket doesn't use the other one """
+
+        clock = Clock()
+        admission = Admission(rate=1, burst=1, club_rate=1, club_burst=1, clock=clock)
+
+        assert admission.admit("A") == (None, 0)
+        assert admission.admit("A")[0] == "club"
+
+        clock.now += 1
+        assert admission.admit("B")[0] is None
+        assert admission.admit("A")[0] == "global"
+
+    def test_sad_club_buckets_are_bounded(self):
+        """ Only the most recently used club buckets are kept """
+
+        admission = Admission(club_rate=1, club_burst=1, max_clubs=2, clock=Clock())
+
+        for club in ("A", "B", "A", "C"):
+            admission.admit(club)
+
+        assert list(admission.clubs) == ["A", "C"]
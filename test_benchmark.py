@@ -0,0 +1,77 @@
+# coding : utf-8
+
+import importlib
+import json
+import os
+
+import benchmark
+
+
+class TestBenchmark:
+
+    # --- TESTS --- #
+
+    def test_happy_run_and_save(self, tmp_path):
+        """ The benchmarks run on a data set and their results are saved """
+
+        path = str(tmp_path / "results.json")
+        status = benchmark.main(
+            [
+                "--sizes",
+                "tiny",
+                "--only",
+                "findClub,route_index,route_purchasePlaces",
+                "--min-time",
+                "0.001",
+                "--repeat",
+                "2",
+                "-o",
+                path,
+            ]
+        )
+
+        assert status == 0
+        with open(path) as f:
+            results = json.load(f)
+        assert sorted(results["results"]["tiny"]) == [
+            "findClub",
+            "route_index",
+            "route_purchasePlaces",
+        ]
+        assert results["results"]["tiny"]["findClub"]["min_us"] > 0
+
+    def test_sad_compare_flags_regressions(self):
+        """ Benchmarks slower than their baseline beyond the threshold are flagged """
+
+        baseline = {"results": {"tiny": {"a": {"min_us": 10.0}, "b": {"min_us": 10.0}}}}
+        results = {
+            "results": {
+                "tiny": {
+                    "a": {"min_us": 11.0},
+                    "b": {"min_us": 13.0},
+                    "c": {"min_us": 99.0},
+                }
+            }
+        }
+
+        assert benchmark.compare(results, baseline, threshold=0.2) == [
+            ("tiny", "b", 10.0, 13.0, 1.3)
+        ]
+
+    def test_happy_purchases_all_succeed(self):
+        """ The timed bookings all succeed, beyond the capacity of the data set """
+
+        benchmarks = benchmark.Benchmarks(*benchmark.SIZES["tiny"])
+        run, setup, max_number = benchmarks.bench_route_purchasePlaces()
+
+        result = benchmark.measure(run, 1, 3, setup, max_number)
+
+        assert result["calls"] == 3 * max_number
+
+    def test_happy_import_keeps_the_environment(self, monkeypatch):
+        """ Importing the benchmarks doesn't configure the app for the process """
+
+        monkeypatch.delenv("GUDLFT_RELOAD_INTERVAL", raising=False)
+        importlib.reload(benchmark)
+
+        assert "GUDLFT_RELOAD_INTERVAL" not in os.environ
@@ -0,0 +1,50 @@
+# coding : utf-8
+
+import gzip
+
+import pytest
+from werkzeug.datastructures import Accept
+
+import compression
+from compression import compress, negotiate
+
+
+class TestCompression:
+
+    # --- TESTS --- #
+
+    def test_happy_negotiate(self, monkeypatch):
+        """ The coding the client prefers is chosen, brotli only if installed """
+
+        monkeypatch.setattr(compression, "brotli", None)
+
+        assert negotiate(Accept([("gzip", 1), ("deflate", 1)])) == "gzip"
+        assert negotiate(Accept([("br", 1), ("gzip", 0.5)])) == "gzip"
+        assert negotiate(Accept([("*", 1)])) == "gzip"
+
+        monkeypatch.setattr(compression, "brotli", object())
+
+        assert negotiate(Accept([("br", 1), ("gzip", 1)])) == "br"
+        assert negotiate(Accept([("br", 0.5), ("gzip", 1)])) == "gzip"
+
+    def test_happy_gzip_is_reproducible(self):
+        """ The same data is always compressed the same way """
+
+        data = b"<li>Simply Lift</li>" * 100
+
+        assert compress(data, "gzip", 6) == compress(data, "gzip", 6)
+        assert gzip.decompress(compress(data, "gzip", 6)) == data
+
+    def test_happy_brotli(self):
+        """ Brotli compresses the data, when installed """
+
+        brotli = pytest.importorskip("brotli")
+        data = b"<li>Simply Lift</li>" * 100
+
+        assert brotli.decompress(compress(data, "br", 5)) == data
+
+    def test_sad_identity_only(self):
+        """ No coding is chosen if the client doesn't accept any """
+
+        assert negotiate(Accept()) is None
+        assert negotiate(Accept([("gzip", 0), ("identity", 1)])) is None
@@ -0,0 +1,153 @@
+# coding : utf-8
+
+import json
+import os
+import threading
+
+import pytest
+
+import journal as journal_module
+from journal import BookingJournal, Snapshotter
+
+
+class TestBookingJournal:
+
+    # --- HELPERS --- #
+
+    def record(self, i):
+        return {"club": f"club {i}", "competition": "compet", "places": 1, "points": 3}
+
+    # --- TESTS --- #
+
+    def test_happy_commit_replay(self, tmp_path):
+        """ Committed records are replayed in order after a reopen """
+
+        path = str(tmp_path / "journal.log")
+
+        journal = BookingJournal(path)
+        for i in range(5):
+            journal.commit(self.record(i))
+        journal.close()
+
+        journal = BookingJournal(path)
+        records = list(journal.replay())
+
+        assert [r["seq"] for r in records] == [1, 2, 3, 4, 5]
+        assert [r["club"] for r in records] == [f"club {i}" for i in range(5)]
+        assert journal.append(self.record(5)) == 6
+
+    def test_happy_group_commit(self, tmp_path):
+        """ Concurrent writers share fsyncs """
+
+        journal = BookingJournal(str(tmp_path / "journal.log"))
+        start = threading.Barrier(20)
+
+        def writer(i):
+            start.wait()
+            for j in range(10):
+                journal.commit(self.record(i * 10 + j))
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(list(journal.replay())) == 200
+        assert journal.fsyncs <= 200
+
+    def test_sad_torn_last_line(self, tmp_path):
+        """ A partially written last record is dropped when reopening """
+
+        path = str(tmp_path / "journal.log")
+
+        journal = BookingJournal(path)
+        journal.commit(self.record(0))
+        journal.close()
+
+        with open(path, "ab") as f:
+            f.write(b'{"club": "club 1", "compet')
+
+        journal = BookingJournal(path)
+        journal.commit(self.record(2))
+
+        assert [r["club"] for r in journal.replay()] == ["club 0", "club 2"]
+
+    def test_sad_duplicated_records_are_skipped(self, tmp_path):
+        """ Records written twice (retried batch) are replayed once """
+
+        path = str(tmp_path / "journal.log")
+
+        journal = BookingJournal(path)
+        journal.commit(self.record(0))
+        journal.close()
+
+        with open(path, "rb") as f:
+            line = f.read()
+        with open(path, "ab") as f:
+            f.write(line)
+
+        assert len(list(BookingJournal(path).replay())) == 1
+
+    @pytest.mark.skipif(journal_module.fcntl is None, reason="needs fcntl")
+    def test_sad_used_by_another_process(self, tmp_path):
+        """ A journal can't be written by two processes (or instances) at once """
+
+        path = str(tmp_path / "journal.log")
+
+        journal = BookingJournal(path)
+        with pytest.raises(RuntimeError):
+            BookingJournal(path)
+        journal.close()
+
+        BookingJournal(path).close()
+
+    def test_happy_compact(self, tmp_path):
+        """ Compacting drops the covered records and keeps the sequence going """
+
+        path = str(tmp_path / "journal.log")
+
+        journal = BookingJournal(path)
+        for i in range(5):
+            journal.commit(self.record(i))
+
+        journal.compact(3)
+        journal.commit(self.record(5))
+        assert [r["seq"] for r in journal.replay()] == [4, 5, 6]
+
+        journal.compact(6)
+        journal.close()
+        assert os.path.getsize(path) == 0
+        assert BookingJournal(path, min_seq=6).append(self.record(6)) == 7
+
+
+class TestSnapshotter:
+    def test_happy_snapshot(self, tmp_path):
+        """ A snapshot is written atomically and the journal compacted """
+
+        journal = BookingJournal(str(tmp_path / "journal.log"))
+        path = str(tmp_path / "snapshot.json")
+        state = {"total": 0}
+
+        def capture():
+            return journal.last_seq, dict(state)
+
+        snapshotter = Snapshotter(journal, path, capture, interval=0.01)
+        for i in range(3):
+            journal.commit({"places": 1})
+            state["total"] += 1
+
+        snapshotter.start()
+        try:
+            for _ in range(500):
+                if snapshotter.count:
+                    break
+                threading.Event().wait(0.01)
+        finally:
+            snapshotter.stop()
+
+        with open(path) as f:
+            assert json.load(f) == {"total": 3, "seq": 3}
+        assert list(journal.replay()) == []
+        assert snapshotter.last_duration is not None
+        assert not os.path.exists(f"{path}.tmp")
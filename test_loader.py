@@ -0,0 +1,165 @@
+# coding : utf-8
+
+import io
+import json
+import os
+
+import pytest
+
+import loader
+from loader import JsonStream, loadPrecompiled, loadRecords, readValue
+
+
+class TestLoader:
+
+    # --- HELPERS --- #
+
+    def write(self, tmp_path, name, content):
+        path = tmp_path / name
+        path.write_text(content, encoding="utf-8")
+        return str(path)
+
+    # --- TESTS --- #
+
+    def test_happy_stream_small_chunks(self):
+        """ Values split over many chunks are decoded properly """
+
+        document = {
+            "other": [{"a": 'x]}\\"[{'}, 12345, None, {"b": [1, [2, {}]]}],
+            "clubs": [{"name": f"club {i}", "points": i * 1000} for i in range(50)],
+            "after": 1,
+        }
+        text = json.dumps(document, indent=2)
+
+        for chunk_size in (1, 2, 7, 64):
+            stream = JsonStream(io.StringIO(text), chunk_size)
+            stream.seek("clubs")
+            assert list(stream.items()) == document["clubs"]
+
+            stream = JsonStream(io.StringIO(text), chunk_size)
+            stream.seek("after")
+            assert stream.decode() == 1
+
+    def test_happy_stream_floats_small_chunks(self):
+        """ Numbers cut after their "." or "e" by a chunk are decoded properly """
+
+        floats = [44566.85, -0.5, 1e-07, 2.5e16, 3.0, 1e300, 12]
+        document = {"skipped": 44566.85, "other": 1.5e-3, "floats": floats}
+        text = json.dumps(document, separators=(",", ":"))
+
+        for chunk_size in range(1, 9):
+            stream = JsonStream(io.StringIO(text), chunk_size)
+            stream.seek("floats")
+            assert list(stream.items()) == floats
+
+            stream = JsonStream(io.StringIO(text), chunk_size)
+            stream.seek("other")
+            assert stream.decode() == 1.5e-3
+
+    def test_happy_load_json_and_ndjson(self, tmp_path):
+        """ The same records are loaded from JSON and NDJSON files """
+
+        items = [{"name": f"club {i}", "points": str(i)} for i in range(10)]
+        json_path = self.write(tmp_path, "clubs.json", json.dumps({"clubs": items}))
+        ndjson_path = self.write(
+            tmp_path, "clubs.ndjson", "\n".join(json.dumps(i) for i in items) + "\n"
+        )
+
+        def build(item):
+            return item["name"], int(item["points"])
+
+        expected = [build(item) for item in items]
+        assert list(loadRecords(json_path, "clubs", build)) == expected
+        assert list(loadRecords(ndjson_path, "clubs", build)) == expected
+
+    def test_happy_progress(self, tmp_path, monkeypatch):
+        """ Progress is reported while loading """
+
+        monkeypatch.setattr(loader, "PROGRESS_EVERY", 3)
+        items = [{"n": i} for i in range(10)]
+        path = self.write(tmp_path, "items.json", json.dumps({"items": items}))
+
+        reported = []
+        list(loadRecords(path, "items", dict, reported.append))
+
+        assert reported == [3, 6, 9]
+
+    def test_happy_read_value(self, tmp_path):
+        """ A single member is read from a JSON object """
+
+        path = self.write(tmp_path, "snap.json", '{"a": [1, 2], "seq": 42}')
+        assert readValue(path, "seq") == 42
+
+    def test_happy_precompiled(self, tmp_path, monkeypatch):
+        """ The records are parsed once, then read from the precompiled file """
+
+        path = self.write(tmp_path, "clubs.json", '{"clubs": [{"n": 1}, {"n": 2}]}')
+
+        parsed = []
+        monkeypatch.setattr(
+            loader,
+            "loadRecords",
+            lambda *args: parsed.append(1) or loadRecords(*args),
+        )
+
+        assert loadPrecompiled(path, "clubs", dict) == [{"n": 1}, {"n": 2}]
+        assert loadPrecompiled(path, "clubs", dict) == [{"n": 1}, {"n": 2}]
+        assert os.path.exists(f"{path}.cache")
+        assert len(parsed) == 1
+
+        # a change of the file (even with the same size and date) is noticed
+        stat = os.stat(path)
+        self.write(tmp_path, "clubs.json", '{"clubs": [{"n": 3}, {"n": 4}]}')
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        assert loadPrecompiled(path, "clubs", dict) == [{"n": 3}, {"n": 4}]
+        assert len(parsed) == 2
+
+    def test_sad_precompiled_corrupted(self, tmp_path):
+        """ A corrupted precompiled file is ignored, and written again """
+
+        path = self.write(tmp_path, "clubs.json", '{"clubs": [{"n": 1}]}')
+        self.write(tmp_path, "clubs.json.cache", "garbage")
+
+        assert loadPrecompiled(path, "clubs", dict) == [{"n": 1}]
+        assert loadPrecompiled(path, "clubs", dict) == [{"n": 1}]
+
+    def test_sad_precompiled_read_only(self, tmp_path, monkeypatch):
+        """ Without access to the precompiled file, the data file is parsed """
+
+        path = self.write(tmp_path, "clubs.json", '{"clubs": [{"n": 1}]}')
+
+        def deny(file, *args, **kwargs):
+            if not str(file).endswith(".json"):
+                raise PermissionError(file)
+            return open(file, *args, **kwargs)
+
+        monkeypatch.setattr(loader, "open", deny, raising=False)
+
+        assert loadPrecompiled(path, "clubs", dict) == [{"n": 1}]
+        assert loadPrecompiled(path, "clubs", dict) == [{"n": 1}]
+        assert os.listdir(tmp_path) == ["clubs.json"]
+
+    def test_sad_invalid_record(self, tmp_path):
+        """ An invalid item stops the load with an explicit error """
+
+        path = self.write(tmp_path, "clubs.json", '{"clubs": [{"n": "1"}, {"x": 2}]}')
+
+        with pytest.raises(ValueError, match="invalid item #2"):
+            list(loadRecords(path, "clubs", lambda item: int(item["n"])))
+
+    def test_sad_missing_key(self, tmp_path):
+        """ A missing array is reported """
+
+        path = self.write(tmp_path, "clubs.json", '{"competitions": []}')
+
+        with pytest.raises(KeyError):
+            list(loadRecords(path, "clubs", dict))
+
+    def test_sad_truncated_file(self, tmp_path):
+        """ A truncated file is reported """
+
+        path = self.write(tmp_path, "clubs.json", '{"clubs": [{"n": 1}, {"n"')
+
+        with pytest.raises(ValueError):
+            list(loadRecords(path, "clubs", dict))
@@ -0,0 +1,67 @@
+# coding : utf-8
+
+from metrics import Counter, Gauge, Histogram, Registry, instrument
+
+
+class TestMetrics:
+
+    # --- TESTS --- #
+
+    def test_happy_histogram_text_format(self):
+        """ Histograms are exposed with cumulative buckets, sum and count """
+
+        registry = Registry()
+        histogram = registry.register(
+            Histogram("duration_seconds", "Some durations", ("route",), (0.1, 1))
+        )
+        histogram.observe(0.05, "index")
+        histogram.observe(0.5, "index")
+        histogram.observe(2, "index")
+
+        assert registry.render().splitlines() == [
+            "# HELP duration_seconds Some durations",
+            "# TYPE duration_seconds histogram",
+            'duration_seconds_bucket{route="index",le="0.1"} 1',
+            'duration_seconds_bucket{route="index",le="1"} 2',
+            'duration_seconds_bucket{route="index",le="+Inf"} 3',
+            'duration_seconds_sum{route="index"} 2.55',
+            'duration_seconds_count{route="index"} 3',
+        ]
+
+    def test_happy_counter_labels_are_escaped(self):
+        """ Label values are escaped in the text format """
+
+        registry = Registry()
+        counter = registry.register(Counter("total", "Some counts", ("name",)))
+        counter.inc('say "hi"\n')
+        counter.inc('say "hi"\n', amount=2)
+
+        assert registry.render().splitlines()[-1] == 'total{name="say \\"hi\\"\\n"} 3'
+
+    def test_happy_gauge(self):
+        """ A gauge keeps the last value set """
+
+        registry = Registry()
+        gauge = registry.register(Gauge("startup_seconds", "Startup", ("phase",)))
+        gauge.set(1.5, "data")
+        gauge.set(0.25, "data")
+
+        assert gauge.get("data") == 0.25
+        assert registry.render().splitlines()[1:] == [
+            "# TYPE startup_seconds gauge",
+            'startup_seconds{phase="data"} 0.25',
+        ]
+
+    def test_happy_instrument(self):
+        """ The calls of instrumented methods are timed """
+
+        class Store:
+            def get(self, key):
+                return key * 2
+
+        store = Store()
+        histogram = Histogram("calls", "Calls", ("method",))
+        instrument(store, ["get"], histogram)
+
+        assert store.get(21) == 42
+        assert histogram.count("get") == 1
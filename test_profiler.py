@@ -0,0 +1,62 @@
+# coding : utf-8
+
+import os
+import pstats
+
+from profiler import RequestProfiler
+
+
+class TestRequestProfiler:
+
+    # --- HELPERS --- #
+
+    def profile(self, profiler, name):
+        profile = profiler.start()
+        sum(i * i for i in range(1000))
+        profiler.stop(profile, name)
+
+    # --- TESTS --- #
+
+    def test_happy_sampling(self, tmp_path):
+        """ Requests are sampled at random, or on demand with the token """
+
+        profiler = RequestProfiler(str(tmp_path), rate=0.0, token="secret")
+        assert not profiler.wants({})
+        assert not profiler.wants({"X-Profile": "guess"})
+        assert profiler.wants({"X-Profile": "secret"})
+
+        profiler = RequestProfiler(str(tmp_path), rate=1.0)
+        assert profiler.wants({})
+
+        # without token, the header can't trigger a profile
+        profiler = RequestProfiler(str(tmp_path))
+        assert not profiler.wants({"X-Profile": ""})
+
+    def test_happy_stats_are_aggregated_and_rotated(self, tmp_path):
+        """ Each profile is saved, added to its route stats, and rotated """
+
+        profiler = RequestProfiler(str(tmp_path), keep=2)
+        for _ in range(3):
+            self.profile(profiler, "index")
+        self.profile(profiler, "book")
+
+        assert len(os.listdir(tmp_path / "requests")) == 2
+        names = [name for name in os.listdir(tmp_path) if name.endswith(".prof")]
+        assert sorted(names) == [
+            "book.prof",
+            "index.prof",
+        ]
+
+        stats = pstats.Stats(str(tmp_path / "index.prof"))
+        assert stats.total_calls > 0
+
+    def test_sad_one_profile_at_a_time(self, tmp_path):
+        """ A request isn't profiled while another one is """
+
+        profiler = RequestProfiler(str(tmp_path))
+        profile = profiler.start()
+        try:
+            assert profiler.start() is None
+        finally:
+            profiler.stop(profile, "index")
+        self.profile(profiler, "index")
@@ -0,0 +1,59 @@
+# coding : utf-8
+
+import os
+
+import pytest
+
+from reloader import FileWatcher
+
+
+class TestFileWatcher:
+
+    # --- HELPERS --- #
+
+    def touch(self, path, content):
+        with open(path, "w") as f:
+            f.write(content)
+        # (make sure the modification time changes, whatever its resolution)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    # --- TESTS --- #
+
+    def test_happy_reload_on_change(self, tmp_path):
+        """ The files are reloaded once they change, and only then """
+
+        paths = [str(tmp_path / "clubs.json"), str(tmp_path / "competitions.json")]
+        for path in paths:
+            self.touch(path, "{}")
+
+        reloads = []
+        watcher = FileWatcher(paths, lambda: reloads.append(1))
+
+        assert not watcher.check()
+        self.touch(paths[1], '{"competitions": []}')
+        assert watcher.check()
+        assert not watcher.check()
+        assert len(reloads) == watcher.count == 1
+
+    def test_sad_failed_reload_is_retried(self, tmp_path):
+        """ A reload that fails is tried again at the next check """
+
+        path = str(tmp_path / "clubs.json")
+        self.touch(path, "{}")
+
+        calls = []
+
+        def reload():
+            calls.append(1)
+            if len(calls) == 1:
+                raise ValueError("file being written")
+
+        watcher = FileWatcher([path], reload)
+        self.touch(path, '{"clubs": []}')
+
+        with pytest.raises(ValueError):
+            watcher.check()
+        assert watcher.check()
+        assert len(calls) == 2
+        assert not watcher.check()
@@ -0,0 +1,295 @@
+# coding : utf-8
+
+import datetime
+import multiprocessing
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from models import Club, Competition, CompetitionList, IndexedList, PlaceValueError
+from repository import MemoryRepository, PointsRanking, SqliteRepository
+
+
+class TestIndexedList:
+
+    # --- TESTS --- #
+
+    def test_happy_update_in_place(self):
+        """ Only the changed index entries are updated, and the version with them """
+
+        clubs = IndexedList(
+            [Club("A", "a@email.com", 30), Club("B", "b@email.com", 20)],
+            keys=("email", "name"),
+        )
+        version = clubs.version
+
+        clubs.update(clubs[0], points=10, email="a@email.com")
+        assert clubs[0].points == 10
+        assert clubs.version == version
+
+        clubs.update(clubs[0], email="new@email.com")
+        assert clubs.find("email", "new@email.com") is clubs[0]
+        assert clubs.find("email", "a@email.com") is None
+        assert clubs.find("name", "A") is clubs[0]
+        assert clubs.version != version
+
+    def test_sad_update_shared_value(self):
+        """ The first record having a value is still found when it's shared """
+
+        clubs = IndexedList(
+            [
+                Club("A", "same@email.com", 30),
+                Club("B", "same@email.com", 20),
+                Club("C", "c@email.com", 10),
+            ],
+            keys=("email",),
+        )
+
+        clubs.update(clubs[0], email="a@email.com")
+        assert clubs.find("email", "same@email.com") is clubs[1]
+
+        clubs.update(clubs[2], email="a@email.com")
+        assert clubs.find("email", "a@email.com") is clubs[0]
+        clubs.update(clubs[0], email="same@email.com")
+        assert clubs.find("email", "a@email.com") is clubs[2]
+        assert clubs.find("email", "same@email.com") is clubs[0]
+
+    def test_happy_update_competition_date(self):
+        """ A competition moved to another date moves in the calendar """
+
+        now = datetime.datetime.now()
+        competitions = CompetitionList(
+            [Competition("next", now + datetime.timedelta(days=1), 5)]
+        )
+        assert competitions.partition(now)[0] == []
+
+        competitions.update(competitions[0], date=now - datetime.timedelta(days=1))
+        assert competitions.partition(now)[0] == [competitions[0]]
+
+    def test_happy_merge_keeps_the_versions(self):
+        """ A merge only changing counters keeps the versions of the lists """
+
+        repository = MemoryRepository()
+        date = datetime.datetime.now() + datetime.timedelta(days=1)
+        repository.load(
+            [Club("club", "club@email.com", 30)], [Competition("next", date, 5)]
+        )
+        clubs, competitions = repository.clubs.version, repository.competitions.version
+
+        assert repository.merge(
+            [Club("club", "club@email.com", 40)], [Competition("next", date, 9)]
+        ) == (1, 1)
+        assert repository.clubs.version == clubs
+        assert repository.competitions.version == competitions
+
+        repository.merge([Club("club", "new@email.com", 40)], [])
+        assert repository.clubs.version != clubs
+        assert repository.findClubByEmail("new@email.com").points == 40
+
+
+class TestPointsRanking:
+
+    # --- HELPERS --- #
+
+    def clubs(self):
+        return IndexedList(
+            [
+                Club("A", "a@email.com", 30),
+                Club("B", "b@email.com", 20),
+                Club("C", "c@email.com", 10),
+            ],
+            keys=("name",),
+        )
+
+    # --- TESTS --- #
+
+    def test_happy_marked_clubs_moved(self):
+        """ The marked clubs are moved to their new rank on the next read """
+
+        clubs = self.clubs()
+        ranking = PointsRanking(clubs)
+        assert [club.name for club in ranking.top(3)] == ["A", "B", "C"]
+
+        clubs[0].points -= 15
+        ranking.mark(clubs[0])
+        clubs[2].points += 15
+        ranking.mark(clubs[2])
+        assert [club.name for club in ranking.top(3)] == ["C", "B", "A"]
+
+        # (unmarked: moved by the next rebuild only)
+        clubs[1].points += 30
+        assert [club.name for club in ranking.top(3)] == ["C", "B", "A"]
+        ranking.invalidate()
+        assert [club.name for club in ranking.top(3)] == ["B", "C", "A"]
+
+    def test_sad_rebuilt_between_change_and_mark(self):
+        """ A ranking rebuilt before a club is marked isn't corrupted """
+
+        clubs = self.clubs()
+        ranking = PointsRanking(clubs)
+        ranking.top(3)
+
+        clubs[0].points -= 15
+        clubs.reindex()  # (e.g. a club was added meanwhile)
+        assert [club.name for club in ranking.top(3)] == ["B", "A", "C"]
+        ranking.mark(clubs[0])
+
+        assert [club.name for club in ranking.top(3)] == ["B", "A", "C"]
+
+    def test_sad_purchases_while_reading_the_top(self):
+        """ The top clubs stay consistent while purchases debit their points """
+
+        repository = MemoryRepository()
+        date = datetime.datetime.now() + datetime.timedelta(days=1)
+        repository.load(
+            [Club(f"club {i}", f"{i}@email.com", 1000) for i in range(20)],
+            [Competition("next", date, 10 ** 6)],
+        )
+        competition = repository.findCompetition("next")
+
+        def purchase(i):
+            club = repository.findClub(f"club {i % 20}")
+            for j in range(12):
+                repository.purchase(club, competition, 1)
+                # (a new list version: the next `top` rebuilds the ranking)
+                repository.addClub(Club(f"new {i} {j}", f"new{i}.{j}@email.com", 0))
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [executor.submit(purchase, i) for i in range(20)]
+            while not all(future.done() for future in futures):
+                top = repository.topClubs(40)
+                assert len({id(club) for club in top}) == len(top)
+
+        for future in futures:
+            future.result()
+        top = repository.topClubs(40)
+        assert len({id(club) for club in top}) == len(top) == 40
+        assert [club.points for club in top] == sorted(
+            (club.points for club in repository.listClubs()), reverse=True
+        )[:40]
+
+
+class TestSqliteRepository:
+
+    # --- HELPERS --- #
+
+    def repository(self, tmp_path):
+        repository = SqliteRepository(str(tmp_path / "gudlft.db"))
+        date = datetime.datetime.now().replace(microsecond=0)
+        repository.load(
+            [Club("club", "club@email.com", 30), Club("other", "club@email.com", 3)],
+            [
+                Competition("past", date - datetime.timedelta(days=1), 5),
+                Competition("next", date + datetime.timedelta(days=1), 1),
+            ],
+        )
+        return repository
+
+    # --- TESTS --- #
+
+    def test_happy_wal_mode(self, tmp_path):
+        """ The database uses the WAL journal mode """
+
+        repository = self.repository(tmp_path)
+        with repository._connection() as db:
+            (mode,) = db.execute("PRAGMA journal_mode").fetchone()
+        assert mode == "wal"
+
+    def test_happy_shared_between_instances(self, tmp_path):
+        """ A purchase made through a repository is seen by another one """
+
+        repository = self.repository(tmp_path)
+        other = SqliteRepository(repository.path)
+
+        club = repository.findClub("club")
+        repository.purchase(club, repository.findCompetition("next"), 1)
+        assert club.points == 27
+
+        assert other.findClub("club").points == 27
+        assert other.findCompetition("next").numberOfPlaces == 0
+        assert other.getBooking("club", "next") == 1
+
+        # the competition is full for everybody
+        with pytest.raises(PlaceValueError):
+            other.purchase(other.findClub("club"), other.findCompetition("next"), 1)
+
+    @pytest.mark.skipif(sys.platform == "win32", reason="needs fork")
+    def test_happy_workers_dont_oversell(self, tmp_path):
+        """ Forked worker processes share the places (each one is sold once) """
+
+        repository = self.repository(tmp_path)
+        clubs = [Club(f"worker {i}", f"{i}@email.com", 1000) for i in range(4)]
+        date = datetime.datetime.now() + datetime.timedelta(days=1)
+        repository.load(clubs, [Competition("big", date.replace(microsecond=0), 30)])
+
+        def work(name, results):
+            sold = 0
+            while True:
+                try:
+                    repository.purchase(
+                        repository.findClub(name), repository.findCompetition("big"), 1
+                    )
+                except PlaceValueError:
+                    break
+                sold += 1
+            results.put(sold)
+
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        workers = [
+            context.Process(target=work, args=(club.name, results)) for club in clubs
+        ]
+        for worker in workers:
+            worker.start()
+        sold = [results.get(timeout=30) for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        assert sum(sold) == 30
+        assert repository.findCompetition("big").numberOfPlaces == 0
+        assert sum(repository.getClubTotal(club.name) for club in clubs) == 30
+        assert sum(repository.findClub(club.name).points for club in clubs) == (
+            4000 - 30 * 3
+        )
+
+    def test_happy_first_club_by_email(self, tmp_path):
+        """ As with a list scan, the first club having an email is found """
+
+        repository = self.repository(tmp_path)
+        assert repository.findClubByEmail("club@email.com").name == "club"
+
+    def test_happy_seed_keeps_data(self, tmp_path):
+        """ Seeding only adds the missing records """
+
+        repository = self.repository(tmp_path)
+        repository.seed(
+            [Club("club", "club@email.com", 1000), Club("new", "new@email.com", 1)], []
+        )
+
+        assert repository.findClub("club").points == 30
+        assert repository.findClub("new").points == 1
+        assert repository.countClubs() == 3
+        assert repository.countCompetitions() == 2
+
+    def test_happy_waitlist_shared_between_instances(self, tmp_path):
+        """ A waitlist is shared by the processes, and served only once """
+
+        repository = self.repository(tmp_path)
+        other = SqliteRepository(repository.path)
+
+        club = repository.findClub("club")
+        competition = repository.findCompetition("next")
+        repository.purchase(club, competition, 1)
+        assert other.isSoldOut("next")
+        assert not other.isSoldOut("past")
+
+        assert other.joinWaitlist(other.findClub("other"), competition, 1) == 1
+        assert repository.getWaitlist("next") == [("other", 1)]
+
+        repository.merge([], [Competition("next", competition.date, 2)])
+
+        assert other.serveWaitlists() == ([("other", "next", 1)], [])
+        assert repository.serveWaitlists() == ([], [])
+        assert repository.getBooking("other", "next") == 1
+        assert repository.isSoldOut("next")
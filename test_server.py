@@ -1,18 +1,28 @@
 # coding : utf-8
 
 import datetime
+import gzip
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
 
 import server
 
+# The tests run against the storage selected by GUDLFT_STORAGE, and a few of
+# them check features that only exist with the in-memory storage
+memory_only = pytest.mark.skipif(
+    not isinstance(server.repository, server.MemoryRepository),
+    reason="specific to the in-memory storage",
+)
+
 
 class TestServer:
     @classmethod
     def setup_class(cls):
         cls.app = server.app.test_client()
 
-        cls.competitions = server.competitions
-        cls.clubs = server.clubs
-
         cls.cost_per_place = server.COST_PER_PLACE
 
         # cls.ref_clubs = [
@@ -35,9 +45,9 @@ class TestServer:
 
     def setup_method(self, method):
         print("RESET")
-        server.competitions = server.loadCompetitions()
-        server.clubs = server.loadClubs()
-        server.booking = {}
+        server.repository.load(server.loadClubs(), server.loadCompetitions())
+        self.clubs = list(server.repository.listClubs())
+        self.competitions = list(server.repository.listCompetitions())
 
     # --- HELPERS --- #
 
@@ -47,36 +57,95 @@ class TestServer:
     def logout(self):
         return self.app.get("/logout", follow_redirects=True)
 
+    def with_past(self, rv, club):
+        """ Return a summary page along with the (collapsed) past competitions """
+        return rv.data + self.app.get(f"/competitions/{club}/past").data
+
     def add_fake_club(self, points=0, name="fake_club", email="fake@email.com"):
         """ Create a fake club for test purpose """
 
-        server.clubs.append(
-            {
-                "name": f"{name}",
-                "email": f"{email}",
-                "points": f"{points}",
-            }
-        )
-        self.clubs = server.clubs
+        server.repository.addClub(server.Club(name, email, points))
+        self.clubs = list(server.repository.listClubs())
 
-        return len(server.clubs) - 1
+        return len(self.clubs) - 1
 
     def add_fake_competition(self, places, name="fake_compet", day_offset=0):
         """ Create a fake competition for test purpose """
 
         date = datetime.datetime.now() + datetime.timedelta(days=day_offset)
-        date = date.strftime("%Y-%m-%d %H:%M:%S")
+        date = date.replace(microsecond=0)
+
+        server.repository.addCompetition(server.Competition(name, date, places))
+        self.competitions = list(server.repository.listCompetitions())
+
+        return len(self.competitions) - 1
+
+    # --- TESTS INDEXES --- #
+
+    @memory_only
+    def test_happy_indexes_follow_list_changes(self):
+        """ Check that the lookup indexes are kept in sync with the lists """
+
+        club_index = self.add_fake_club(points=10, email="indexed@email.com")
+        club = self.clubs[club_index]
+
+        assert server.repository.findClubByEmail("indexed@email.com") is club
+        assert server.repository.findClub(club.name) is club
+
+        server.repository.clubs.remove(club)
+        assert server.repository.findClubByEmail("indexed@email.com") is None
+
+        rv = self.login("indexed@email.com")
+        assert rv.status_code in [404]
+
+    # --- TESTS RECORDS --- #
+
+    def test_happy_records_are_typed(self):
+        """ Check that the loaded records have native counters and no __dict__ """
+
+        for club in self.clubs:
+            assert isinstance(club.points, int)
+            assert not hasattr(club, "__dict__")
+
+        for competition in self.competitions:
+            assert isinstance(competition.numberOfPlaces, int)
+            assert isinstance(competition.date, datetime.datetime)
+            assert not hasattr(competition, "__dict__")
 
-        server.competitions.append(
-            {
-                "name": f"{name}",
-                "date": f"{date}",
-                "numberOfPlaces": f"{places}",
-            }
+    # --- TESTS CALENDAR --- #
+
+    def test_happy_calendar_partition(self):
+        """ Check the past / next split of the competitions calendar """
+
+        compet_index = self.add_fake_competition(places=5, day_offset=10)
+        name = self.competitions[compet_index].name
+        date = self.competitions[compet_index].date
+
+        partition = server.repository.partitionCompetitions
+
+        past, next = partition(date - datetime.timedelta(seconds=1))
+        assert name in [c.name for c in next] and name not in [c.name for c in past]
+        assert [c.date for c in past + next] == sorted(
+            c.date for c in self.competitions
         )
-        self.competitions = server.competitions
 
-        return len(server.competitions) - 1
+        # crossing the competition date moves it to the past competitions
+        past, next = partition(date)
+        assert name in [c.name for c in past] and name not in [c.name for c in next]
+
+    @memory_only
+    def test_happy_calendar_follows_list_changes(self):
+        """ Check that the calendar is rebuilt when competitions change """
+
+        compet_index = self.add_fake_competition(places=5, day_offset=10)
+        compet = self.competitions[compet_index]
+
+        past, next = server.repository.partitionCompetitions(compet.date)
+        assert compet in past
+
+        server.repository.competitions.remove(compet)
+        past, next = server.repository.partitionCompetitions(compet.date)
+        assert compet not in past and compet not in next
 
     # --- TESTS LOGIN / LOGOUT --- #
 
@@ -114,16 +183,16 @@ class TestServer:
 
         for club in self.clubs:
             for competition in self.competitions:
-                rv = self.app.get(f"/book/{competition['name']}/{club['name']}")
+                rv = self.app.get(f"/book/{competition.name}/{club.name}")
 
                 print(rv.data, rv.status_code, "\n")
 
-                if server.formatDate(competition["date"]) <= now:
+                if competition.date <= now:
                     continue
 
                 assert rv.status_code in [200]
                 assert (
-                    str.encode(f"Places available: {competition['numberOfPlaces']}")
+                    str.encode(f"Places available: {competition.numberOfPlaces}")
                     in rv.data
                 )
 
@@ -131,7 +200,7 @@ class TestServer:
         """ Display the booking page for an existing club with a non existing competition """
 
         for competition in self.competitions:
-            rv = self.app.get(f"/book/wrong_compet_name/{self.clubs[0]['name']}")
+            rv = self.app.get(f"/book/wrong_compet_name/{self.clubs[0].name}")
 
             assert rv.status_code in [404]
             assert b"The provided competition is invalid" in rv.data
@@ -140,7 +209,7 @@ class TestServer:
         """ Display the booking page for an existing competition with a non existing club """
 
         for competition in self.competitions:
-            rv = self.app.get(f"/book/{competition['name']}/wrong_club_name")
+            rv = self.app.get(f"/book/{competition.name}/wrong_club_name")
 
             assert rv.status_code in [404]
             assert b"The provided club is invalid" in rv.data
@@ -150,17 +219,17 @@ class TestServer:
     def test_happy_purchasePlaces_once(self):
         """ Book less places than club points or competitions available places """
 
-        points = int(self.clubs[0]["points"])
+        points = self.clubs[0].points
         booked = 0
         num_places = 1
         for competition in self.competitions:
-            places = int(competition["numberOfPlaces"])
+            places = competition.numberOfPlaces
             rv = self.app.post(
                 "/purchasePlaces",
                 data={
                     "places": num_places,
-                    "club": self.clubs[0]["name"],
-                    "competition": competition["name"],
+                    "club": self.clubs[0].name,
+                    "competition": competition.name,
                 },
             )
 
@@ -171,7 +240,9 @@ class TestServer:
             cost = points - (self.cost_per_place * booked)
 
             assert rv.status_code in [200]
-            assert str.encode(f"Number of Places: {places-num_places}") in rv.data
+            assert str.encode(f"Number of Places: {places-num_places}") in (
+                self.with_past(rv, self.clubs[0].name)
+            )
             assert str.encode(f"Points available: {cost}") in rv.data
 
     def test_sad_purchasePlaces_negative(self):
@@ -183,8 +254,8 @@ class TestServer:
                 "/purchasePlaces",
                 data={
                     "places": num_places,
-                    "club": self.clubs[0]["name"],
-                    "competition": competition["name"],
+                    "club": self.clubs[0].name,
+                    "competition": competition.name,
                 },
             )
 
@@ -200,8 +271,8 @@ class TestServer:
                 "/purchasePlaces",
                 data={
                     "places": num_places,
-                    "club": self.clubs[0]["name"],
-                    "competition": competition["name"],
+                    "club": self.clubs[0].name,
+                    "competition": competition.name,
                 },
             )
 
@@ -215,22 +286,24 @@ class TestServer:
 
         print("INIT:", self.competitions, self.clubs)
 
-        points = int(self.clubs[club_index]["points"])
-        slots = int(self.competitions[0]["numberOfPlaces"])
+        points = self.clubs[club_index].points
+        slots = self.competitions[0].numberOfPlaces
 
         rv = self.app.post(
             "/purchasePlaces",
             data={
                 "places": 13,
-                "club": self.clubs[club_index]["name"],
-                "competition": self.competitions[0]["name"],
+                "club": self.clubs[club_index].name,
+                "competition": self.competitions[0].name,
             },
         )
 
         print(rv.data, rv.status_code)
 
         assert rv.status_code in [400]
-        assert str.encode(f"Number of Places: {slots}") in rv.data
+        assert str.encode(f"Number of Places: {slots}") in (
+            self.with_past(rv, self.clubs[club_index].name)
+        )
         assert str.encode(f"Points available: {points}") in rv.data
         assert b"You can&#39;t book more than 12 places per competition" in rv.data
 
@@ -241,8 +314,8 @@ class TestServer:
 
         print("INIT:", self.competitions, self.clubs)
 
-        points = int(self.clubs[club_index]["points"])
-        slots = int(self.competitions[0]["numberOfPlaces"])
+        points = self.clubs[club_index].points
+        slots = self.competitions[0].numberOfPlaces
         booked = 0
 
         num_actions = 12 + 1
@@ -252,18 +325,20 @@ class TestServer:
                 "/purchasePlaces",
                 data={
                     "places": 1,
-                    "club": self.clubs[club_index]["name"],
-                    "competition": self.competitions[0]["name"],
+                    "club": self.clubs[club_index].name,
+                    "competition": self.competitions[0].name,
                 },
             )
 
             booked += 1
-            print(i, "\n", rv.data, rv.status_code, "\n", server.booking)
+            print(i, "\n", rv.data, rv.status_code, "\n")
 
             if i < num_actions - 1:
                 cost = points - (self.cost_per_place * booked)
                 assert rv.status_code in [200]
-                assert str.encode(f"Number of Places: {slots-booked}") in rv.data
+                assert str.encode(f"Number of Places: {slots-booked}") in (
+                    self.with_past(rv, self.clubs[club_index].name)
+                )
                 assert str.encode(f"Points available: {cost}") in rv.data
 
         assert rv.status_code in [400]
@@ -287,8 +362,8 @@ class TestServer:
                 "/purchasePlaces",
                 data={
                     "places": 1,
-                    "club": self.clubs[club_index]["name"],
-                    "competition": self.competitions[compet_index]["name"],
+                    "club": self.clubs[club_index].name,
+                    "competition": self.competitions[compet_index].name,
                 },
             )
 
@@ -326,8 +401,8 @@ class TestServer:
                 "/purchasePlaces",
                 data={
                     "places": 1,
-                    "club": self.clubs[club_index]["name"],
-                    "competition": self.competitions[compet_index]["name"],
+                    "club": self.clubs[club_index].name,
+                    "competition": self.competitions[compet_index].name,
                 },
             )
 
@@ -360,7 +435,7 @@ class TestServer:
             "/purchasePlaces",
             data={
                 "places": slots + 1,
-                "club": self.clubs[club_index]["name"],
+                "club": self.clubs[club_index].name,
                 "competition": cName,
             },
         )
@@ -375,13 +450,13 @@ class TestServer:
 
         for club in self.clubs:
             for competition in self.competitions:
-                num_booked = int(club["points"]) + 1
+                num_booked = club.points + 1
                 rv = self.app.post(
                     "/purchasePlaces",
                     data={
                         "places": num_booked,
-                        "club": club["name"],
-                        "competition": competition["name"],
+                        "club": club.name,
+                        "competition": competition.name,
                     },
                 )
 
@@ -395,7 +470,7 @@ class TestServer:
             "/purchasePlaces",
             data={
                 "places": 1,
-                "club": self.clubs[0]["name"],
+                "club": self.clubs[0].name,
                 "competition": "fake_competition_name",
             },
         )
@@ -411,13 +486,1117 @@ class TestServer:
             data={
                 "places": 1,
                 "club": "fake_club_name",
-                "competition": self.competitions[0]["name"],
+                "competition": self.competitions[0].name,
+            },
+        )
+
+        assert rv.status_code in [404]
+        assert b"The provided club is invalid" in rv.data
+
+    def test_happy_purchasePlaces_concurrent(self):
+        """ Concurrent purchases can't oversell places nor overspend points """
+
+        slots = 30
+        compet_index = self.add_fake_competition(
+            places=slots, name="test compet", day_offset=20
+        )
+        competition = self.competitions[compet_index]
+
+        # 20 clubs with enough points for 5 places, trying 10 times each
+        clubs = []
+        for i in range(20):
+            club_index = self.add_fake_club(
+                points=5 * self.cost_per_place, name=f"club {i}", email=f"{i}@e.com"
+            )
+            clubs.append(self.clubs[club_index])
+
+        def purchase(club):
+            try:
+                server.repository.purchase(club, competition, 1)
+                return 1
+            except (server.PointValueError, server.PlaceValueError):
+                return 0
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                booked = sum(executor.map(purchase, clubs * 10))
+        finally:
+            sys.setswitchinterval(interval)
+
+        assert booked == slots
+        assert server.repository.findCompetition(competition.name).numberOfPlaces == 0
+        for club in clubs:
+            booked = server.repository.getBooking(club.name, competition.name)
+            assert 0 <= booked <= 5
+            club = server.repository.findClub(club.name)
+            assert club.points == (5 - booked) * self.cost_per_place
+
+    @memory_only
+    def test_happy_purchasePlaces_journal_replay(self, tmp_path):
+        """ Purchases recorded in the journal are restored after a reload """
+
+        journal = server.BookingJournal(str(tmp_path / "journal.log"))
+        server.repository.journal = journal
+        try:
+            for competition in self.competitions[2:]:
+                rv = self.app.post(
+                    "/purchasePlaces",
+                    data={
+                        "places": 2,
+                        "club": self.clubs[0].name,
+                        "competition": competition.name,
+                    },
+                )
+                assert rv.status_code in [200]
+        finally:
+            server.repository.journal = None
+            journal.close()
+
+        points = server.repository.clubs[0].points
+        places = [c.numberOfPlaces for c in server.repository.competitions]
+        booking = server.repository.booking
+
+        self.setup_method(None)
+        server.repository.replay(server.BookingJournal(journal.path))
+
+        assert server.repository.clubs[0].points == points
+        assert [c.numberOfPlaces for c in server.repository.competitions] == places
+        assert server.repository.booking == booking
+
+    @memory_only
+    def test_happy_purchasePlaces_snapshot_replay(self, tmp_path):
+        """ A snapshot plus the journal tail restore the purchases """
+
+        journal = server.BookingJournal(str(tmp_path / "journal.log"))
+        snapshotter = server.Snapshotter(
+            journal, str(tmp_path / "snapshot.json"), server.repository.capture
+        )
+        server.repository.journal = journal
+        try:
+            for i, competition in enumerate(self.competitions[2:]):
+                rv = self.app.post(
+                    "/purchasePlaces",
+                    data={
+                        "places": 1,
+                        "club": self.clubs[0].name,
+                        "competition": competition.name,
+                    },
+                )
+                assert rv.status_code in [200]
+                if i == 0:
+                    snapshotter.take()
+        finally:
+            server.repository.journal = None
+            journal.close()
+
+        points = server.repository.clubs[0].points
+        places = [c.numberOfPlaces for c in server.repository.competitions]
+        booking = server.repository.booking
+
+        self.setup_method(None)
+        seq = server.restoreSnapshot(snapshotter.path)
+        journal = server.BookingJournal(journal.path, seq)
+        assert len(list(journal.replay(seq))) == 1
+        server.repository.replay(journal, seq)
+
+        assert server.repository.clubs[0].points == points
+        assert [c.numberOfPlaces for c in server.repository.competitions] == places
+        assert server.repository.booking == booking
+
+    @memory_only
+    def test_happy_snapshot_restore_merges_offline_edits(self, tmp_path, monkeypatch):
+        """ The data files edited while the server was down are merged on restart """
+
+        journal = server.BookingJournal(str(tmp_path / "journal.log"))
+        snapshotter = server.Snapshotter(
+            journal, str(tmp_path / "snapshot.json"), server.repository.capture
+        )
+        club, competition = self.clubs[0], self.competitions[2]
+        server.repository.journal = journal
+        try:
+            rv = self.app.post(
+                "/purchasePlaces",
+                data={"places": 1, "club": club.name, "competition": competition.name},
+            )
+            assert rv.status_code in [200]
+            snapshotter.take()
+        finally:
+            server.repository.journal = None
+            journal.close()
+        points, places = club.points, competition.numberOfPlaces
+
+        # (edited offline: more points and places, and a new competition)
+        clubs, competitions = server.loadClubs(), server.loadCompetitions()
+        clubs[0].points += 5
+        competitions[2].numberOfPlaces += 4
+        competitions.append(server.Competition("New Comp", "2051-01-01 10:00:00", 10))
+        for key, records in (("clubs", clubs), ("competitions", competitions)):
+            path = tmp_path / f"{key}.json"
+            path.write_text(json.dumps({key: [record.toJson() for record in records]}))
+            monkeypatch.setitem(server.app.config, f"{key.upper()}_FILE", str(path))
+
+        server.repository.load((), ())
+        server.restoreSnapshot(snapshotter.path)
+
+        for _ in range(2):
+            assert server.repository.findClub(club.name).points == points + 5
+            restored = server.repository.findCompetition(competition.name)
+            assert restored.numberOfPlaces == places + 4
+            assert server.repository.findCompetition("New Comp") is not None
+            assert server.repository.getBooking(club.name, competition.name) == 1
+
+            # (and the file watcher doesn't apply them a second time)
+            server.reloadData()
+
+    # --- TESTS CONDITIONAL REQUESTS --- #
+
+    def test_happy_etag_index(self):
+        """ The index page is answered with 304 until the points change """
+
+        rv = self.app.get("/")
+        etag = rv.headers["ETag"]
+
+        rv = self.app.get("/", headers={"If-None-Match": etag})
+        assert rv.status_code in [304]
+        assert rv.data == b""
+
+        self.app.post(
+            "/purchasePlaces",
+            data={
+                "places": 1,
+                "club": self.clubs[0].name,
+                "competition": self.competitions[2].name,
+            },
+        )
+
+        rv = self.app.get("/", headers={"If-None-Match": etag})
+        assert rv.status_code in [200]
+        assert rv.headers["ETag"] != etag
+
+    def test_happy_etag_summary_and_book(self):
+        """ The summary and booking pages are answered with 304 when unchanged """
+
+        rv = self.login(self.clubs[0].email)
+        summary_etag = rv.headers["ETag"]
+        url = f"/book/{self.competitions[2].name}/{self.clubs[0].name}"
+        book_etag = self.app.get(url).headers["ETag"]
+
+        rv = self.app.post(
+            "/showSummary",
+            data=dict(email=self.clubs[0].email),
+            headers={"If-None-Match": summary_etag},
+        )
+        assert rv.status_code in [304]
+        rv = self.app.get(url, headers={"If-None-Match": book_etag})
+        assert rv.status_code in [304]
+
+        # other clubs get their own summary
+        rv = self.login(self.clubs[1].email)
+        assert rv.headers["ETag"] != summary_etag
+
+        # a booking changes both pages (and displays a message without ETag)
+        rv = self.app.post(
+            "/purchasePlaces",
+            data={
+                "places": 1,
+                "club": self.clubs[0].name,
+                "competition": self.competitions[2].name,
+            },
+        )
+        assert rv.status_code in [200]
+        assert "ETag" not in rv.headers
+
+        rv = self.app.post(
+            "/showSummary",
+            data=dict(email=self.clubs[0].email),
+            headers={"If-None-Match": summary_etag},
+        )
+        assert rv.status_code in [200]
+        rv = self.app.get(url, headers={"If-None-Match": book_etag})
+        assert rv.status_code in [200]
+        assert b"Places booked: 1" in rv.data
+
+    def test_sad_etag_error_pages(self):
+        """ Error pages don't get any ETag """
+
+        rv = self.login("wrong@email.com")
+        assert "ETag" not in rv.headers
+
+        rv = self.app.get(f"/book/{self.competitions[0].name}/{self.clubs[0].name}")
+        assert rv.status_code in [400]
+        assert "ETag" not in rv.headers
+
+    # --- TESTS PAGINATION --- #
+
+    def test_happy_points_board_pages(self, monkeypatch):
+        """ The points board is split in pages of PAGE_SIZE clubs """
+
+        monkeypatch.setitem(server.app.config, "PAGE_SIZE", 2)
+
+        rv = self.app.get("/pointsBoard")
+        assert rv.status_code in [200]
+        for club in self.clubs[:2]:
+            assert str.encode(club.name) in rv.data
+        assert str.encode(self.clubs[2].name) not in rv.data
+        assert b"/pointsBoard?page=2" in rv.data
+
+        rv = self.app.get("/pointsBoard?page=2")
+        assert rv.status_code in [200]
+        assert str.encode(self.clubs[2].name) in rv.data
+        assert str.encode(self.clubs[0].name) not in rv.data
+        assert b"/pointsBoard?page=3" not in rv.data
+
+    def test_happy_points_board_top(self):
+        """ The top view lists the clubs by decreasing points """
+
+        rv = self.app.get("/pointsBoard?top=2")
+        assert rv.status_code in [200]
+        assert rv.data.index(b"Simply Lift") < rv.data.index(b"She Lifts")
+        assert b"Iron Temple" not in rv.data
+
+        rv = self.app.post(
+            "/purchasePlaces",
+            data={
+                "places": 1,
+                "club": "Simply Lift",
+                "competition": self.competitions[2].name,
+            },
+        )
+        assert rv.status_code in [200]
+
+        rv = self.app.get("/pointsBoard?top=2")
+        assert rv.data.index(b"She Lifts") < rv.data.index(b"Simply Lift")
+        assert [club.name for club in server.repository.topClubs(3)] == [
+            "She Lifts",
+            "Simply Lift",
+            "Iron Temple",
+        ]
+
+    def test_happy_competitions_pages(self, monkeypatch):
+        """ The next competitions are split in pages of PAGE_SIZE competitions """
+
+        monkeypatch.setitem(server.app.config, "PAGE_SIZE", 1)
+
+        rv = self.login("john@simplylift.co")
+        assert rv.status_code in [200]
+        assert b"Spring Festival 2050" in rv.data
+        assert b"Fall Classic 2050" not in rv.data
+        assert b"More competitions" in rv.data
+
+        rv = self.app.get("/competitions/Simply Lift/next?page=2")
+        assert rv.status_code in [200]
+        assert b"Fall Classic 2050" in rv.data
+        assert b"Spring Festival 2050" not in rv.data
+        assert b"Next page" not in rv.data
+
+    def test_sad_competitions_wrong_club_or_when(self):
+        """ Display competitions for a non existing club, or neither next nor past """
+
+        rv = self.app.get("/competitions/wrong_club_name/next")
+        assert rv.status_code in [404]
+        assert b"The provided club is invalid" in rv.data
+
+        rv = self.app.get("/competitions/Simply Lift/later")
+        assert rv.status_code in [404]
+
+    # --- TESTS JSON API --- #
+
+    def test_happy_api_competitions(self):
+        """ List the next and past competitions as JSON """
+
+        rv = self.app.get("/api/competitions")
+        assert rv.status_code in [200]
+        assert rv.mimetype == "application/json"
+        assert rv.get_json() == {
+            "items": [
+                {
+                    "name": "Spring Festival 2050",
+                    "date": "2050-03-27 11:11:00",
+                    "numberOfPlaces": 20,
+                },
+                {
+                    "name": "Fall Classic 2050",
+                    "date": "2050-10-22 12:12:00",
+                    "numberOfPlaces": 24,
+                },
+            ],
+            "page": 1,
+            "next_page": None,
+        }
+
+        rv = self.app.get("/api/competitions?when=past&fields=name")
+        assert rv.get_json()["items"] == [
+            {"name": "Spring Festival"},
+            {"name": "Fall Classic"},
+        ]
+
+    def test_happy_api_clubs_pages_and_top(self, monkeypatch):
+        """ List the clubs by pages, or the top clubs, as JSON """
+
+        monkeypatch.setitem(server.app.config, "PAGE_SIZE", 2)
+
+        data = self.app.get("/api/clubs").get_json()
+        assert [club["name"] for club in data["items"]] == [
+            club.name for club in self.clubs[:2]
+        ]
+        assert data["next_page"] == 2
+
+        data = self.app.get("/api/clubs?page=2").get_json()
+        assert data["items"] == [
+            {"name": self.clubs[2].name, "points": self.clubs[2].points}
+        ]
+        assert data["next_page"] is None
+
+        data = self.app.get("/api/clubs?top=1&fields=name").get_json()
+        assert data["items"] == [{"name": "Simply Lift"}]
+
+    def test_happy_api_bookings(self):
+        """ List the competitions booked by a club as JSON """
+
+        rv = self.app.get("/api/clubs/Simply Lift/bookings")
+        assert rv.get_json()["items"] == []
+
+        self.app.post(
+            "/purchasePlaces",
+            data={
+                "places": 2,
+                "club": "Simply Lift",
+                "competition": self.competitions[2].name,
+            },
+        )
+
+        rv = self.app.get("/api/clubs/Simply Lift/bookings?fields=competition,places")
+        assert rv.get_json()["items"] == [
+            {"competition": self.competitions[2].name, "places": 2}
+        ]
+        assert rv.get_json()["total"] == 2
+
+        rv = self.app.get(f"/api/competitions/{self.competitions[2].name}/bookings")
+        assert rv.get_json()["items"] == [{"club": "Simply Lift", "places": 2}]
+        assert rv.get_json()["total"] == 2
+
+    def test_happy_api_etag_and_cache(self):
+        """ API payloads are served from the cache, and answered with 304 """
+
+        rv = self.app.get("/api/clubs")
+        etag = rv.headers["ETag"]
+        stats = self.app.get("/cacheStats").get_json()["api"]
+
+        rv = self.app.get("/api/clubs")
+        assert rv.headers["ETag"] == etag
+        assert self.app.get("/cacheStats").get_json()["api"]["hits"] == (
+            stats["hits"] + 1
+        )
+
+        rv = self.app.get("/api/clubs", headers={"If-None-Match": etag})
+        assert rv.status_code in [304]
+        assert rv.data == b""
+
+        self.app.post(
+            "/purchasePlaces",
+            data={
+                "places": 1,
+                "club": "Simply Lift",
+                "competition": self.competitions[2].name,
+            },
+        )
+
+        rv = self.app.get("/api/clubs", headers={"If-None-Match": etag})
+        assert rv.status_code in [200]
+        assert rv.headers["ETag"] != etag
+
+    def test_sad_api_wrong_parameters(self):
+        """ Ask for unknown clubs, fields or lists """
+
+        rv = self.app.get("/api/clubs/wrong_club_name/bookings")
+        assert rv.status_code in [404]
+        assert rv.get_json() == {"error": "The provided club is invalid"}
+
+        rv = self.app.get("/api/clubs?fields=name,email")
+        assert rv.status_code in [400]
+        assert "email" in rv.get_json()["error"]
+
+        rv = self.app.get("/api/competitions?when=later")
+        assert rv.status_code in [400]
+
+    def test_happy_booking_ledger_queries(self):
+        """ Bookings can be read by club, by competition, and as totals """
+
+        self.purchase_many(
+            "Simply Lift",
+            (self.competitions[2].name, 2),
+            (self.competitions[3].name, 1),
+        )
+        self.purchase_many("She Lifts", (self.competitions[2].name, 3))
+
+        repository = server.repository
+        assert repository.getClubBookings("Simply Lift") == {
+            self.competitions[2].name: 2,
+            self.competitions[3].name: 1,
+        }
+        assert repository.getCompetitionBookings(self.competitions[2].name) == {
+            "Simply Lift": 2,
+            "She Lifts": 3,
+        }
+        assert repository.getClubTotal("Simply Lift") == 3
+        assert repository.getCompetitionTotal(self.competitions[2].name) == 5
+        assert repository.getClubTotal("Iron Temple") == 0
+        assert repository.getCompetitionBookings(self.competitions[0].name) == {}
+
+    # --- TESTS BATCH PURCHASES --- #
+
+    def purchase_many(self, club, *bookings):
+        return self.app.post(
+            "/api/purchases",
+            json={
+                "club": club,
+                "bookings": [
+                    {"competition": competition, "places": places}
+                    for competition, places in bookings
+                ],
+            },
+        )
+
+    def test_happy_purchases_batch(self):
+        """ Book places in several competitions at once """
+
+        self.add_fake_club(points=100)
+
+        rv = self.purchase_many(
+            "fake_club",
+            (self.competitions[2].name, 2),
+            (self.competitions[3].name, 3),
+            (self.competitions[2].name, 1),
+        )
+
+        assert rv.status_code in [200]
+        assert rv.get_json()["points"] == 100 - 6 * self.cost_per_place
+        assert rv.get_json()["bookings"][1] == {
+            "competition": self.competitions[3].name,
+            "places": 3,
+            "numberOfPlaces": 21,
+        }
+        assert server.repository.getBooking("fake_club", self.competitions[2].name) == 3
+        assert server.repository.findClub("fake_club").points == (
+            100 - 6 * self.cost_per_place
+        )
+        assert (
+            server.repository.findCompetition(self.competitions[2].name).numberOfPlaces
+            == 17
+        )
+
+    def test_sad_purchases_batch_all_or_nothing(self):
+        """ A batch with one invalid booking books nothing """
+
+        self.add_fake_club(points=100)
+
+        # (the 12 places rule applies to the sum of the bookings)
+        rv = self.purchase_many(
+            "fake_club",
+            (self.competitions[3].name, 2),
+            (self.competitions[2].name, 8),
+            (self.competitions[2].name, 5),
+        )
+
+        assert rv.status_code in [400]
+        assert rv.get_json()["error"] == (
+            f"{self.competitions[2].name}: "
+            "You can't book more than 12 places per competition"
+        )
+        assert server.repository.findClub("fake_club").points == 100
+        for competition in self.competitions[2:]:
+            assert server.repository.getBooking("fake_club", competition.name) == 0
+            assert (
+                server.repository.findCompetition(competition.name).numberOfPlaces
+                == competition.numberOfPlaces
+            )
+
+        # (the points rule applies to the total cost)
+        rv = self.purchase_many(
+            "Iron Temple",
+            (self.competitions[2].name, 1),
+            (self.competitions[3].name, 1),
+        )
+        assert rv.status_code in [400]
+        assert b"enough points" in rv.data
+        assert server.repository.findClub("Iron Temple").points == 4
+
+    def test_sad_purchases_batch_wrong_input(self):
+        """ Send a batch with a wrong club, competition or structure """
+
+        rv = self.purchase_many("wrong_club_name", (self.competitions[2].name, 1))
+        assert rv.status_code in [404]
+
+        rv = self.purchase_many("Simply Lift", ("wrong_compet", 1))
+        assert rv.status_code in [404]
+
+        rv = self.purchase_many("Simply Lift")
+        assert rv.status_code in [400]
+
+        rv = self.app.post("/api/purchases", json={"club": "Simply Lift"})
+        assert rv.status_code in [400]
+
+        rv = self.purchase_many("Simply Lift", (self.competitions[2].name, "two"))
+        assert rv.status_code in [400]
+
+        rv = self.purchase_many([], (self.competitions[2].name, 1))
+        assert rv.status_code in [400]
+
+        rv = self.purchase_many("Simply Lift", ({"name": "x"}, 1))
+        assert rv.status_code in [400]
+
+        # (only integers are numbers of places)
+        for places in (1.9, True, "1"):
+            rv = self.purchase_many("Simply Lift", (self.competitions[2].name, places))
+            assert rv.status_code in [400]
+        assert server.repository.findClub("Simply Lift").points == 13
+
+    def test_sad_purchases_batch_past_competition(self):
+        """ A batch booking places in a past competition books nothing """
+
+        rv = self.purchase_many(
+            "Simply Lift",
+            (self.competitions[2].name, 1),
+            (self.competitions[1].name, 1),
+        )
+
+        assert rv.status_code in [400]
+        assert rv.get_json()["error"] == (
+            f"{self.competitions[1].name}: "
+            "The booking page for a past competition is closed"
+        )
+        assert server.repository.findClub("Simply Lift").points == 13
+        assert (
+            server.repository.getBooking("Simply Lift", self.competitions[2].name) == 0
+        )
+
+    @memory_only
+    def test_happy_purchases_batch_journal_replay(self, tmp_path):
+        """ Batches recorded in the journal are restored after a reload """
+
+        journal = server.BookingJournal(str(tmp_path / "journal.log"))
+        server.repository.journal = journal
+        try:
+            rv = self.purchase_many(
+                self.clubs[0].name,
+                (self.competitions[2].name, 1),
+                (self.competitions[3].name, 2),
+            )
+            assert rv.status_code in [200]
+        finally:
+            server.repository.journal = None
+            journal.close()
+
+        points = server.repository.clubs[0].points
+        places = [c.numberOfPlaces for c in server.repository.competitions]
+        booking = server.repository.booking
+
+        self.setup_method(None)
+        server.repository.replay(server.BookingJournal(journal.path))
+
+        assert server.repository.clubs[0].points == points
+        assert [c.numberOfPlaces for c in server.repository.competitions] == places
+        assert server.repository.booking == booking
+
+    # --- TESTS HOT RELOAD --- #
+
+    def test_happy_merge_keeps_live_counters(self):
+        """ Merging new data files keeps the points, places and bookings """
+
+        rv = self.app.post(
+            "/purchasePlaces",
+            data={
+                "places": 2,
+                "club": "Simply Lift",
+                "competition": "Spring Festival 2050",
             },
         )
+        assert rv.status_code in [200]
+
+        clubs = server.loadClubs()
+        competitions = server.loadCompetitions()
+        clubs[0].email = "new@simplylift.co"
+        clubs[2].points += 10
+        competitions[2].numberOfPlaces += 5
+        clubs.append(server.Club("New Club", "new@club.com", 7))
+        competitions.append(server.Competition("New Compet", "2051-01-01 10:00:00", 10))
+
+        assert server.repository.merge(clubs, competitions) == (3, 2)
+
+        repository = server.repository
+        assert repository.findClubByEmail("new@simplylift.co").points == 13 - 6
+        assert repository.findClubByEmail("john@simplylift.co") is None
+        assert repository.findClub("She Lifts").points == 22
+        assert repository.findCompetition("Spring Festival 2050").numberOfPlaces == 23
+        assert repository.getBooking("Simply Lift", "Spring Festival 2050") == 2
+        assert repository.findClub("New Club").points == 7
+        assert repository.findCompetition("New Compet").numberOfPlaces == 10
+
+        # the same files are only merged once
+        assert server.repository.merge(clubs, competitions) == (0, 0)
+        assert repository.findClub("She Lifts").points == 22
+
+    def test_happy_reload_data_files(self, tmp_path, monkeypatch):
+        """ A change of the data files is merged by the watcher """
+
+        path = tmp_path / "competitions.json"
+        path.write_text(open("competitions.json").read())
+        monkeypatch.setitem(server.app.config, "COMPETITIONS_FILE", str(path))
+        server.repository.track(server.loadClubs(), server.loadCompetitions())
+
+        watcher = server.FileWatcher([str(path)], server.reloadData)
+        path.write_text(
+            path.read_text().replace(
+                '"name": "Fall Classic 2050"', '"name": "Winter Classic 2050"'
+            )
+        )
+        watcher.stamps = None
+
+        etag = self.app.get("/api/competitions").headers["ETag"]
+        assert watcher.check()
+
+        rv = self.app.get("/api/competitions", headers={"If-None-Match": etag})
+        assert rv.status_code in [200]
+        assert b"Winter Classic 2050" in rv.data
+        assert b"Fall Classic 2050" in rv.data
+
+    # --- TESTS METRICS --- #
+
+    def test_happy_metrics(self):
+        """ Requests, bookings, rendering and data access are measured """
+
+        requests = server.requests_total.get("index", 200)
+        successes = server.bookings_total.get("purchasePlaces", "success")
+        refusals = server.bookings_total.get("purchasePlaces", "PointValueError")
+
+        self.app.get("/")
+        for places in (1, 0):
+            self.app.post(
+                "/purchasePlaces",
+                data={
+                    "places": places,
+                    "club": "Simply Lift",
+                    "competition": "Spring Festival 2050",
+                },
+            )
+
+        assert server.requests_total.get("index", 200) == requests + 1
+        assert server.bookings_total.get("purchasePlaces", "success") == successes + 1
+        assert (
+            server.bookings_total.get("purchasePlaces", "PointValueError")
+            == refusals + 1
+        )
+
+        rv = self.app.get("/metrics")
+        assert rv.status_code in [200]
+        assert rv.mimetype == "text/plain"
+        assert b'gudlft_request_duration_seconds_count{endpoint="index"}' in rv.data
+        assert b'gudlft_requests_total{endpoint="purchasePlaces",status="400"}' in (
+            rv.data
+        )
+        assert b'gudlft_render_duration_seconds_sum{template="welcome.html"}' in (
+            rv.data
+        )
+        assert b'gudlft_data_duration_seconds_count{method="purchase"}' in rv.data
+
+    def test_sad_metrics_past_competition(self):
+        """ Refused bookings of past competitions are counted """
+
+        refusals = server.bookings_total.get("book", "EventDateError")
+
+        rv = self.app.get(f"/book/{self.competitions[0].name}/{self.clubs[0].name}")
+
+        assert rv.status_code in [400]
+        assert server.bookings_total.get("book", "EventDateError") == refusals + 1
+
+    # --- TESTS ADMINISTRATION --- #
+
+    def test_happy_admin_reset(self, monkeypatch):
+        """ The data can be replaced with generated data, then reset """
+
+        monkeypatch.setitem(server.app.config, "ADMIN_TOKEN", "secret")
+        headers = {"X-Admin-Token": "secret"}
+
+        rv = self.app.post(
+            "/admin/reset",
+            json={"clubs": 50, "competitions": 20, "seed": 1},
+            headers=headers,
+        )
+        assert rv.status_code in [200]
+        assert rv.get_json() == {"clubs": 50, "competitions": 20}
+
+        rv = self.login("secretary49@club49.com")
+        assert rv.status_code in [200]
+        assert b"Welcome, secretary49@club49.com" in rv.data
+
+        # the same seed gives the same data
+        points = server.repository.findClub("Club 7").points
+        self.app.post(
+            "/admin/reset",
+            json={"clubs": 50, "competitions": 20, "seed": 1},
+            headers=headers,
+        )
+        assert server.repository.findClub("Club 7").points == points
+
+        rv = self.app.post("/admin/reset", headers=headers)
+        assert rv.get_json() == {"clubs": 3, "competitions": 4}
+        assert server.repository.findClub("Simply Lift").points == 13
+
+    def test_sad_admin_reset_protected(self, monkeypatch, tmp_path):
+        """ The reset needs the token, and isn't possible with a journal """
+
+        rv = self.app.post("/admin/reset", json={"clubs": 10})
+        assert rv.status_code in [404]
+
+        monkeypatch.setitem(server.app.config, "ADMIN_TOKEN", "secret")
+        rv = self.app.post(
+            "/admin/reset", json={"clubs": 10}, headers={"X-Admin-Token": "guess"}
+        )
+        assert rv.status_code in [403]
+
+        rv = self.app.post(
+            "/admin/reset",
+            json={"clubs": 10},
+            headers={"X-Admin-Token": "secret"},
+            environ_base={"REMOTE_ADDR": "10.0.0.1"},
+        )
+        assert rv.status_code in [403]
+
+        if isinstance(server.repository, server.MemoryRepository):
+            monkeypatch.setattr(server.repository, "journal", object())
+            rv = self.app.post(
+                "/admin/reset", json={"clubs": 10}, headers={"X-Admin-Token": "secret"}
+            )
+            assert rv.status_code in [409]
+
+        assert server.repository.findClub("Simply Lift") is not None
+
+    def test_happy_booking_outcome_header(self):
+        """ Refused bookings are told apart with the X-Booking-Outcome header """
+
+        rv = self.app.post(
+            "/purchasePlaces",
+            data={"places": 1, "club": "Iron Temple", "competition": "Fall Classic"},
+        )
+        assert rv.headers["X-Booking-Outcome"] == "success"
+
+        rv = self.app.post(
+            "/purchasePlaces",
+            data={"places": 2, "club": "Iron Temple", "competition": "Fall Classic"},
+        )
+        assert rv.status_code in [400]
+        assert rv.headers["X-Booking-Outcome"] == "PointValueError"
+
+        rv = self.app.get("/")
+        assert "X-Booking-Outcome" not in rv.headers
+
+    # --- TESTS STARTUP --- #
+
+    def test_happy_lazy_load(self, monkeypatch):
+        """ Without data yet, the first requests load it, only once """
+
+        monkeypatch.setattr(server, "data_ready", server.threading.Event())
+        starts = []
+        monkeypatch.setattr(server, "startData", lambda: starts.append(1))
+        monkeypatch.setitem(server.app.config, "LAZY_LOAD", True)
+
+        assert server.createApp() is server.app
+        assert starts == []
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(
+                executor.map(lambda i: server.app.test_client().get("/"), range(16))
+            )
+
+        assert all(rv.status_code == 200 for rv in responses)
+        assert starts == [1]
+        assert server.data_ready.is_set()
+
+    def test_happy_startup_time_reported(self):
+        """ The startup time is exposed with the metrics """
+
+        rv = self.app.get("/metrics")
+
+        assert 'gudlft_startup_seconds{phase="app"}' in rv.data.decode()
+        assert 'gudlft_startup_seconds{phase="data"}' in rv.data.decode()
+        assert 'gudlft_startup_seconds{phase="templates"}' in rv.data.decode()
+
+    def test_happy_templates_bytecode_cache(self, monkeypatch, tmp_path):
+        """ The templates are compiled once, then read from the bytecode cache """
+
+        env = server.app.jinja_env
+        monkeypatch.setattr(env, "bytecode_cache", server.TimedBytecodeCache(tmp_path))
+        monkeypatch.setattr(env, "cache", {})
+        load = server.template_load_duration
+
+        compiled = load.count("welcome.html", "source")
+        read = load.count("welcome.html", "bytecode")
+
+        rv = server.app.test_cli_runner().invoke(args=["compile-templates"])
+        assert "templates compiled" in rv.output
+        assert load.count("welcome.html", "source") == compiled + 1
+
+        # (e.g. in another worker)
+        env.cache.clear()
+        assert "welcome.html" in server.loadTemplates()
+        assert load.count("welcome.html", "source") == compiled + 1
+        assert load.count("welcome.html", "bytecode") == read + 1
+
+        rv = self.login("john@simplylift.co")
+        assert rv.status_code in [200]
+        assert load.count("welcome.html", "bytecode") == read + 1
+
+    def test_sad_templates_cache_read_only(self, monkeypatch, tmp_path):
+        """ Without a writable cache directory, the templates are still compiled """
+
+        (tmp_path / "file").write_text("")
+        assert server.templateCache(str(tmp_path / "file" / "templates")) is None
+
+        # (e.g. the directory is removed or made read-only once the cache is set)
+        env = server.app.jinja_env
+        cache = server.templateCache(str(tmp_path / "templates"))
+        (tmp_path / "templates").rmdir()
+        monkeypatch.setattr(env, "bytecode_cache", cache)
+        monkeypatch.setattr(env, "cache", {})
+
+        assert "welcome.html" in server.loadTemplates()
+        rv = self.login("john@simplylift.co")
+        assert rv.status_code in [200]
+
+    # --- TESTS ADMISSION CONTROL --- #
+
+    def test_happy_admission_per_club(self, monkeypatch):
+        """ A club booking too fast gets a tiny 429, without any page rendered """
+
+        monkeypatch.setattr(server, "admission", server.Admission(club_rate=0.1))
+        shed = server.shed_total.get("purchasePlaces", "club")
+        renders = server.render_duration.count("welcome.html")
+
+        data = {
+            "places": 1,
+            "club": "Simply Lift",
+            "competition": self.competitions[2].name,
+        }
+        rv = self.app.post("/purchasePlaces", data=data)
+        assert rv.status_code in [200]
+
+        rv = self.app.post("/purchasePlaces", data=data)
+        assert rv.status_code in [429]
+        assert rv.headers["Retry-After"] == "10"
+        assert rv.data == b"Too many requests"
+        assert server.shed_total.get("purchasePlaces", "club") == shed + 1
+        assert server.render_duration.count("welcome.html") == renders + 1
+
+        # (the other clubs aren't concerned)
+        rv = self.app.get(f"/book/{self.competitions[2].name}/Iron Temple")
+        assert rv.status_code in [200]
+        rv = self.app.get(f"/book/{self.competitions[2].name}/Simply Lift")
+        assert rv.status_code in [429]
+
+        assert 'gudlft_shed_total{endpoint="book",scope="club"}' in (
+            self.app.get("/metrics").data.decode()
+        )
+
+    def test_sad_admission_global(self, monkeypatch):
+        """ Beyond the global rate, every club is refused """
+
+        monkeypatch.setattr(server, "admission", server.Admission(rate=0.1, burst=2))
 
+        competition = self.competitions[2].name
+        for club in ("Simply Lift", "Iron Temple"):
+            rv = self.app.get(f"/book/{competition}/{club}")
+            assert rv.status_code in [200]
+        rv = self.app.get(f"/book/{competition}/She Lifts")
+        assert rv.status_code in [429]
+
+        # (the other routes aren't limited)
+        assert self.app.get("/").status_code in [200]
+
+    # --- TESTS FLASH SALES --- #
+
+    def flash_sale(self, monkeypatch, places):
+        """ Load the clubs along with a single upcoming competition """
+
+        monkeypatch.setitem(server.app.config, "FLASH_SALE", True)
+        date = datetime.datetime.now().replace(microsecond=0)
+        competition = server.Competition(
+            "Flash Sale", date + datetime.timedelta(days=1), places
+        )
+        server.repository.load(server.loadClubs(), [competition])
+        return competition
+
+    def purchase(self, club, places):
+        return self.app.post(
+            "/purchasePlaces",
+            data={"places": places, "club": club, "competition": "Flash Sale"},
+        )
+
+    def test_happy_sold_out_fast_path(self, monkeypatch):
+        """ Once sold out, the requests get a tiny response and join the waitlist """
+
+        self.flash_sale(monkeypatch, 1)
+        assert self.purchase("Simply Lift", 1).status_code in [200]
+        assert server.repository.isSoldOut("Flash Sale")
+
+        renders = server.render_duration.count("welcome.html")
+
+        rv = self.purchase("Iron Temple", 1)
+        assert rv.status_code in [202]
+        assert rv.data == b"Sold out: Iron Temple is number 1 on the waitlist"
+        assert rv.headers["X-Booking-Outcome"] == "Waitlisted"
+
+        rv = self.purchase("She Lifts", 2)
+        assert rv.data == b"Sold out: She Lifts is number 2 on the waitlist"
+
+        # (a club waits only once)
+        rv = self.purchase("Iron Temple", 3)
+        assert rv.data == b"Sold out: Iron Temple is number 1 on the waitlist"
+        assert server.repository.getWaitlist("Flash Sale") == [
+            ("Iron Temple", 1),
+            ("She Lifts", 2),
+        ]
+
+        rv = self.app.get("/book/Flash Sale/Iron Temple")
+        assert rv.status_code in [409]
+        assert rv.data == b"Sold out"
+
+        assert server.render_duration.count("welcome.html") == renders
+
+    def test_sad_sold_out_unknown_club(self, monkeypatch):
+        """ Once sold out, an unknown club is still refused with a 404 """
+
+        self.flash_sale(monkeypatch, 1)
+        assert self.purchase("Simply Lift", 1).status_code in [200]
+
+        rv = self.purchase("Unknown Club", 1)
         assert rv.status_code in [404]
         assert b"The provided club is invalid" in rv.data
 
+        rv = self.app.get("/book/Flash Sale/Unknown Club")
+        assert rv.status_code in [404]
+        assert server.repository.getWaitlist("Flash Sale") == []
+
+    def test_happy_waitlist_served_in_order(self, monkeypatch):
+        """ The places coming back are booked for the waiting clubs, in order """
+
+        competition = self.flash_sale(monkeypatch, 1)
+        self.purchase("Simply Lift", 1)
+        self.purchase("Iron Temple", 2)  # (4 points: can't pay 2 places)
+        self.purchase("She Lifts", 2)
+        self.purchase("Simply Lift", 3)
+
+        # 4 more places in the file
+        monkeypatch.setattr(
+            server,
+            "loadCompetitions",
+            lambda: [server.Competition(competition.name, competition.date, 5)],
+        )
+        booked = server.waitlist_total.get("booked")
+        server.reloadData()
+
+        assert server.repository.getBooking("She Lifts", "Flash Sale") == 2
+        assert server.repository.getBooking("Iron Temple", "Flash Sale") == 0
+        assert server.repository.getBooking("Simply Lift", "Flash Sale") == 1
+        assert server.repository.findClub("She Lifts").points == 12 - 2 * 3
+        assert server.repository.findCompetition("Flash Sale").numberOfPlaces == 2
+
+        # (Simply Lift waits for 3 places, and the next requests behind it)
+        assert server.repository.getWaitlist("Flash Sale") == [("Simply Lift", 3)]
+        assert server.repository.isSoldOut("Flash Sale")
+        assert server.waitlist_total.get("booked") == booked + 1
+
+    def test_sad_sold_out_without_flash_sale(self):
+        """ Without flash sale mode, a sold out competition is refused as before """
+
+        server.repository.load(
+            server.loadClubs(),
+            [
+                server.Competition(
+                    "Flash Sale",
+                    datetime.datetime.now() + datetime.timedelta(days=1),
+                    0,
+                )
+            ],
+        )
+
+        rv = self.purchase("Simply Lift", 1)
+        assert rv.status_code in [400]
+        assert rv.headers["X-Booking-Outcome"] == "PlaceValueError"
+        assert server.repository.getWaitlist("Flash Sale") == []
+
+    # --- TESTS COMPRESSION --- #
+
+    def test_happy_compressed_pages(self):
+        """ The pages are compressed once, then served from the cache """
+
+        headers = {"Accept-Encoding": "gzip"}
+        renders = server.render_duration.count("index.html")
+
+        rv = self.app.get("/", headers=headers)
+        assert rv.status_code in [200]
+        assert rv.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in rv.headers["Vary"]
+        assert b"Points Board" in gzip.decompress(rv.data)
+        assert rv.get_etag()[0].endswith("-gzip")
+
+        stats = self.app.get("/cacheStats").get_json()["compressed"]
+        again = self.app.get("/", headers=headers)
+        assert again.data == rv.data
+        assert self.app.get("/cacheStats").get_json()["compressed"]["hits"] == (
+            stats["hits"] + 1
+        )
+        assert server.render_duration.count("index.html") == renders + 1
+
+        rv = self.app.get(
+            "/", headers=dict(headers, **{"If-None-Match": rv.headers["ETag"]})
+        )
+        assert rv.status_code in [304]
+
+        # (the identity representation has its own ETag)
+        rv = self.app.get("/", headers={"If-None-Match": again.headers["ETag"]})
+        assert rv.status_code in [200]
+        assert "Content-Encoding" not in rv.headers
+
+    def test_happy_compressed_json(self, monkeypatch):
+        """ The JSON API and the other responses are compressed too """
+
+        headers = {"Accept-Encoding": "gzip, br;q=0.5"}
+        monkeypatch.setitem(server.app.config, "COMPRESS_MIN_SIZE", 100)
+
+        rv = self.app.get("/api/competitions", headers=headers)
+        assert rv.headers["Content-Encoding"] == "gzip"
+        assert b"Spring Festival" in gzip.decompress(rv.data)
+
+        rv = self.login("john@simplylift.co")
+        rv = self.app.post(
+            "/purchasePlaces",
+            data={"places": 100, "club": "Simply Lift", "competition": "Fall Classic"},
+            headers=headers,
+        )
+        assert rv.status_code in [400]
+        assert rv.headers["Content-Encoding"] == "gzip"
+        assert b"Welcome" in gzip.decompress(rv.data)
+
+    def test_sad_not_compressed(self, monkeypatch):
+        """ The small responses, and those of clients not accepting it, aren't """
+
+        rv = self.app.get("/cacheStats", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in rv.headers
+
+        rv = self.app.get("/", headers={"Accept-Encoding": "identity"})
+        assert "Content-Encoding" not in rv.headers
+
+        monkeypatch.setitem(server.app.config, "COMPRESS_MIN_SIZE", 10 ** 6)
+        rv = self.app.get("/", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in rv.headers
+        assert b"Points Board" in rv.data
+
+        monkeypatch.setitem(server.app.config, "COMPRESS", False)
+        rv = self.app.get("/api/clubs", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in rv.headers
+
     # --- TESTS PAST COMPETITIONS --- #
 
     def test_happy_showSummary_with_future_events(self):
@@ -444,15 +1623,20 @@ class TestServer:
 
         assert rv.status_code in [200]
         assert b"Book Places" in rv.data
-        assert rv.data.count(b"Finished") == 2
+        assert rv.data.count(b"Finished") == 0
         assert rv.data.count(b"Book Places") == 2
 
+        # past competitions are collapsed, and fetched on demand
+        rv = self.app.get("/competitions/Simply Lift/past")
+
+        assert rv.status_code in [200]
+        assert rv.data.count(b"Finished") == 2
+        assert rv.data.count(b"Book Places") == 0
+
     def test_sad_booking_past_compet(self):
         """ Must redirect to summary if someone directly write the booking url of a past competition """
 
-        rv = self.app.get(
-            f"/book/{self.competitions[0]['name']}/{self.clubs[0]['name']}"
-        )
+        rv = self.app.get(f"/book/{self.competitions[0].name}/{self.clubs[0].name}")
         assert rv.status_code in [400]
         assert b"The booking page for a past competition is closed" in rv.data
         assert b"Welcome" in rv.data
@@ -469,8 +1653,35 @@ class TestServer:
 
         assert b"Points Board" in rv.data
         for club in self.clubs:
-            assert str.encode(club["name"]) in rv.data
-            assert str.encode(f"Current Points: {club['points']}") in rv.data
+            assert str.encode(club.name) in rv.data
+            assert str.encode(f"Current Points: {club.points}") in rv.data
+
+    def test_happy_points_board_cache(self):
+        """ The points board is rendered again only when points change """
+
+        self.app.get("/")
+        stats = self.app.get("/cacheStats").get_json()
+
+        rv = self.app.get("/")
+        assert rv.status_code in [200]
+        assert self.app.get("/cacheStats").get_json()["hits"] == stats["hits"] + 1
+
+        points = self.clubs[0].points - self.cost_per_place
+        rv = self.app.post(
+            "/purchasePlaces",
+            data={
+                "places": 1,
+                "club": self.clubs[0].name,
+                "competition": self.competitions[2].name,
+            },
+        )
+
+        assert rv.status_code in [200]
+        assert self.app.get("/cacheStats").get_json()["misses"] == stats["misses"] + 1
+        assert str.encode(f"Current Points: {points}") in rv.data
+
+        rv = self.app.get("/")
+        assert str.encode(f"Current Points: {points}") in rv.data
 
     def test_happy_display_points_board_welcome(self):
         """ Check if the points board is displayed on the main (welcome) page """
@@ -482,5 +1693,5 @@ class TestServer:
 
         assert b"Points Board" in rv.data
         for club in self.clubs:
-            assert str.encode(club["name"]) in rv.data
-            assert str.encode(f"Current Points: {club['points']}") in rv.data
+            assert str.encode(club.name) in rv.data
+            assert str.encode(f"Current Points: {club.points}") in rv.data